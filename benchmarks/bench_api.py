@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Бенчмарк основных сценариев против локального сервера QIWI API (fake_qiwi.py): выставление и проверка счетов,
+постраничная загрузка истории платежей и массовые выплаты, синхронно и асинхронно. Для каждого сценария
+выводятся пропускная способность и p50/p99 времени запросов, с --json результаты сохраняются в файл
+для сравнения версий.
+
+    python benchmarks/bench_api.py [--operations 200] [--concurrency 8] [--latency 0.005]
+                                   [--error-423 0.01] [--error-500 0.01] [--json results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('QIWIPYAPI_NODE_ID', '0')  # бенчмарк создаёт платежи в одном процессе
+
+from fake_qiwi import FakeQiwiServer, LocalAsyncPool, LocalPool  # noqa: E402
+from qiwipyapi import PayoutEngine, PayoutOrder, RateLimiter, RetryPolicy, codec, metrics  # noqa: E402
+from qiwipyapi.aio import AsyncP2PWallet, AsyncQIWIWallet  # noqa: E402
+from qiwipyapi.ratelimit import DEFAULT_LIMITS  # noqa: E402
+from qiwipyapi.utils import abounded_map, bounded_map  # noqa: E402
+from qiwipyapi.wallets import P2PWallet, QIWIWallet  # noqa: E402
+
+WALLET_NUMBER = '79000000000'
+SCENARIOS = ('create_invoice', 'invoice_status', 'payments_history', 'payouts')
+
+
+def percentile(values, q) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def wallet_options(pool):
+    """ Ограничитель частоты не должен влиять на результат, а повторы после 423 и 500 - затягивать его. """
+    return {'pool': pool, 'rate_limiter': RateLimiter({family: (1e6, 1e6) for family in DEFAULT_LIMITS}, False),
+            'retry_policy': RetryPolicy(base_delay=0.01, max_delay=0.1)}
+
+
+class Measure:
+    """ Замер сценария: время запросов собирается хуком metrics, ошибки и число операций - вызывающим. """
+
+    def __init__(self, scenario, mode):
+        self.scenario = scenario
+        self.mode = mode
+        self.durations = []
+        self.operations = 0
+        self.errors = 0
+        self.seconds = None
+
+    def __enter__(self):
+        metrics.enable().add_hook(after=lambda event: self.durations.append(event.duration))
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.seconds = time.perf_counter() - self._started
+        metrics.disable()
+
+    def result(self) -> dict:
+        return {'scenario': self.scenario, 'mode': self.mode, 'operations': self.operations, 'errors': self.errors,
+                'requests': len(self.durations), 'seconds': round(self.seconds, 4),
+                'throughput': round(self.operations / self.seconds, 1) if self.seconds else 0.0,
+                'p50_ms': round(percentile(self.durations, 0.5) * 1000, 2),
+                'p99_ms': round(percentile(self.durations, 0.99) * 1000, 2)}
+
+
+def _count(measure, results):
+    for _, _, error in results:
+        measure.operations += 1
+        measure.errors += error is not None
+
+
+async def _acount(measure, results):
+    async for _, _, error in results:
+        measure.operations += 1
+        measure.errors += error is not None
+
+
+def run_sync(server, args):
+    pool = LocalPool(server.url, pool_maxsize=args.concurrency)
+    p2p = P2PWallet(WALLET_NUMBER, 'p2p-key', **wallet_options(pool))
+    wallet = QIWIWallet(WALLET_NUMBER, 'token', **wallet_options(pool))
+    bill_ids = [str(uuid.uuid4()) for _ in range(args.operations)]
+    results = []
+    with Measure('create_invoice', 'sync') as measure:
+        _count(measure, bounded_map(lambda bill_id: p2p.create_invoice(100, bill_id=bill_id), bill_ids,
+                                    args.concurrency))
+    results.append(measure.result())
+    with Measure('invoice_status', 'sync') as measure:
+        _count(measure, bounded_map(p2p.invoice_status, bill_ids, args.concurrency))
+    results.append(measure.result())
+    with Measure('payments_history', 'sync') as measure:
+        measure.operations = sum(1 for _ in wallet.iter_payments(rows=args.page_size))
+    results.append(measure.result())
+    with Measure('payouts', 'sync') as measure:
+        engine = PayoutEngine(wallet, concurrency=args.concurrency, retry_delay=0.01)
+        for result in engine.run(_orders(args.operations)):
+            measure.operations += 1
+            measure.errors += result.error is not None
+    results.append(measure.result())
+    pool.close()
+    return results
+
+
+async def run_async(server, args):
+    pool = LocalAsyncPool(server.url, concurrency=args.concurrency)
+    p2p = AsyncP2PWallet(WALLET_NUMBER, 'p2p-key', **wallet_options(pool))
+    wallet = AsyncQIWIWallet(WALLET_NUMBER, 'token', **wallet_options(pool))
+    bill_ids = [str(uuid.uuid4()) for _ in range(args.operations)]
+    results = []
+    with Measure('create_invoice', 'async') as measure:
+        await _acount(measure, abounded_map(lambda bill_id: p2p.create_invoice(100, bill_id=bill_id), bill_ids,
+                                            args.concurrency))
+    results.append(measure.result())
+    with Measure('invoice_status', 'async') as measure:
+        await _acount(measure, abounded_map(p2p.invoice_status, bill_ids, args.concurrency))
+    results.append(measure.result())
+    with Measure('payments_history', 'async') as measure:
+        async for _ in wallet.iter_payments(rows=args.page_size):
+            measure.operations += 1
+    results.append(measure.result())
+    with Measure('payouts', 'async') as measure:
+        engine = PayoutEngine(wallet, concurrency=args.concurrency, retry_delay=0.01)
+        async for result in engine.arun(_orders(args.operations)):
+            measure.operations += 1
+            measure.errors += result.error is not None
+    results.append(measure.result())
+    await pool.close()
+    return results
+
+
+def _orders(count):
+    return (PayoutOrder('wallet', f'+7901{i:07d}', 100 + i % 50) for i in range(count))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--operations', type=int, default=200, help='число счетов и выплат')
+    parser.add_argument('--concurrency', type=int, default=8, help='число одновременных запросов')
+    parser.add_argument('--latency', type=float, default=0.005, help='задержка ответа сервера в секундах')
+    parser.add_argument('--error-423', type=float, default=0.0, help='доля ответов 423')
+    parser.add_argument('--error-500', type=float, default=0.0, help='доля ответов 500')
+    parser.add_argument('--history-size', type=int, default=1000, help='число транзакций в истории')
+    parser.add_argument('--page-size', type=int, default=50, help='размер страницы истории')
+    parser.add_argument('--modes', nargs='+', choices=('sync', 'async'), default=('sync', 'async'))
+    parser.add_argument('--json', help='файл для результатов в JSON')
+    args = parser.parse_args()
+
+    results = []
+    for mode in args.modes:
+        with FakeQiwiServer(latency=args.latency, error_423=args.error_423, error_500=args.error_500,
+                            history_size=args.history_size, max_rows=args.page_size) as server:
+            results += run_sync(server, args) if mode == 'sync' else asyncio.run(run_async(server, args))
+
+    print(f'{"scenario":<18} {"mode":<6} {"ops":>6} {"errors":>6} {"ops/s":>9} {"p50, ms":>8} {"p99, ms":>8}')
+    for r in results:
+        print(f'{r["scenario"]:<18} {r["mode"]:<6} {r["operations"]:>6} {r["errors"]:>6} {r["throughput"]:>9.1f} '
+              f'{r["p50_ms"]:>8.2f} {r["p99_ms"]:>8.2f}')
+    if args.json:
+        report = {'python': platform.python_version(), 'codec': codec.codec.name,
+                  'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'config': vars(args), 'results': results}
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
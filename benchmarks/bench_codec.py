@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Сравнение кодеков JSON на типичных данных QIWI API: страница истории платежей и пачка платежей.
+
+    python benchmarks/bench_codec.py [--number 2000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qiwipyapi import codec  # noqa: E402
+
+
+def history_page(rows=50):
+    """ Ответ payments_history из rows платежей. """
+    return {'data': [{'txnId': 20000000000 + i, 'personId': 79001234567, 'date': '2020-03-14T15:09:26+03:00',
+                      'errorCode': 0, 'error': None, 'status': 'SUCCESS', 'type': 'OUT', 'statusText': 'Success',
+                      'trmTxnId': str(1584187766000 + i), 'account': '+79007654321',
+                      'sum': {'amount': 100.5 + i, 'currency': 643}, 'commission': {'amount': 0, 'currency': 643},
+                      'total': {'amount': 100.5 + i, 'currency': 643},
+                      'provider': {'id': 99, 'shortName': 'QIWI Кошелек', 'longName': 'QIWI Кошелек',
+                                   'logoUrl': 'https://static.qiwi.com/img/providers/logoBig/99_l.png',
+                                   'description': None, 'keys': 'мобильный кошелек', 'siteUrl': None},
+                      'source': {}, 'comment': f'Заказ {i}', 'currencyRate': 1, 'extras': {}, 'chequeReady': True,
+                      'bankDocumentAvailable': False, 'bankDocumentReady': False, 'repeatPaymentEnabled': False,
+                      'favoritePaymentEnabled': True, 'regularPaymentEnabled': True}
+                     for i in range(rows)],
+            'nextTxnDate': '2020-03-14T15:09:26+03:00', 'nextTxnId': 20000000000 + rows}
+
+
+def payment(i):
+    """ Тело платежа send_payment. """
+    return {'id': str(1584187766000 + i), 'sum': {'amount': 100.5, 'currency': '643'},
+            'paymentMethod': {'type': 'Account', 'accountId': '643'}, 'fields': {'account': '4111111111111111'},
+            'comment': f'Выплата {i}'}
+
+
+def bench(name, number):
+    selected = codec.get_codec(name)
+    body = json.dumps(history_page()).encode()
+    payments = [payment(i) for i in range(number)]
+    loads = timeit.timeit(lambda: selected.loads(body), number=number)
+    dumps = timeit.timeit(lambda: [selected.dumps(p) for p in payments], number=1)
+    return loads / number * 1e6, dumps / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', type=int, default=2000, help='число повторов')
+    args = parser.parse_args()
+    print(f'{"codec":<8} {"loads history page, us":>24} {"dumps payment, us":>20}')
+    for name in codec.available():
+        loads, dumps = bench(name, args.number)
+        print(f'{name:<8} {loads:>24.1f} {dumps:>20.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Время импорта модулей пакета в новом процессе (python -X importtime). С --budget бенчмарк завершается
+с кодом 1, если медианное время импорта модуля больше заданного, и его можно запускать в CI.
+
+    python benchmarks/bench_import.py [--repeat 7] [--budget qiwipyapi=20 --budget qiwipyapi.p2p=150]
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ('qiwipyapi', 'qiwipyapi.p2p', 'qiwipyapi.wallets', 'qiwipyapi.aio')
+_LINE = re.compile(r'import time:\s+\d+ \|\s+(\d+) \| (.+)$')
+
+
+def import_time(module) -> float:
+    """ Время импорта module вместе с зависимостями в миллисекундах. """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match and match.group(2).strip() == module:
+            return int(match.group(1)) / 1000
+    raise RuntimeError(f'No import time for {module}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=7, help='число запусков для каждого модуля')
+    parser.add_argument('--budget', action='append', default=[], metavar='MODULE=MS',
+                        help='максимальное медианное время импорта модуля в миллисекундах')
+    parser.add_argument('--json', help='файл для результатов в JSON')
+    args = parser.parse_args()
+    budgets = {module: float(ms) for module, ms in (budget.split('=') for budget in args.budget)}
+
+    results, exceeded = {}, []
+    print(f'{"module":<20} {"median, ms":>11} {"min, ms":>9} {"budget, ms":>11}')
+    for module in list(MODULES) + sorted(set(budgets) - set(MODULES)):
+        times = [import_time(module) for _ in range(args.repeat)]
+        median, budget = statistics.median(times), budgets.get(module)
+        results[module] = {'median_ms': round(median, 2), 'min_ms': round(min(times), 2), 'budget_ms': budget}
+        print(f'{module:<20} {median:>11.1f} {min(times):>9.1f} {budget if budget else "":>11}')
+        if budget and median > budget:
+            exceeded.append(module)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=2)
+    if exceeded:
+        print(f'Import time budget exceeded: {", ".join(exceeded)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
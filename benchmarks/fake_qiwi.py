@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Локальный сервер, заменяющий QIWI API в бенчмарках: счета P2P, история платежей, платежи, комиссии,
+определение провайдера и балансы. Сервер работает в потоке текущего процесса, задержку ответа и долю
+ответов 423 и 500 можно задать.
+
+    with FakeQiwiServer(latency=0.02, error_423=0.01) as server:
+        wallet = QIWIWallet(number, token, pool=LocalPool(server.url))
+"""
+
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qiwipyapi.aio import AsyncConnectionPool  # noqa: E402
+from qiwipyapi.request import ConnectionPool  # noqa: E402
+
+
+def local_url(base_url, request_url) -> str:
+    """ URL запроса к QIWI API, перенаправленный на локальный сервер. """
+    url = urlsplit(request_url)
+    return f'{base_url}{url.path}' + (f'?{url.query}' if url.query else '')
+
+
+class LocalPool(ConnectionPool):
+    """ Пул соединений, который отправляет запросы к QIWI API на локальный сервер base_url. """
+
+    def __init__(self, base_url, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+
+    def send(self, method, request_url, **kwargs):
+        return super().send(method, local_url(self.base_url, request_url), **kwargs)
+
+
+class LocalAsyncPool(AsyncConnectionPool):
+    """ Асинхронный вариант LocalPool. """
+
+    def __init__(self, base_url, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+
+    async def send(self, method, request_url, **kwargs):
+        return await super().send(method, local_url(self.base_url, request_url), **kwargs)
+
+
+def _transactions(count, wallet='79000000000'):
+    now = datetime(2020, 3, 14, 15, 9, 26, tzinfo=timezone(timedelta(hours=3)))
+    return [{'txnId': 20000000000 + count - i, 'personId': int(wallet),
+             'date': (now - timedelta(minutes=i)).isoformat(), 'errorCode': 0, 'error': None, 'status': 'SUCCESS',
+             'type': 'IN' if i % 3 else 'OUT', 'statusText': 'Success', 'trmTxnId': str(1584187766000 + i),
+             'account': '+79007654321', 'sum': {'amount': 100 + i % 1000, 'currency': 643},
+             'commission': {'amount': 0, 'currency': 643}, 'total': {'amount': 100 + i % 1000, 'currency': 643},
+             'provider': {'id': 99, 'shortName': 'QIWI Кошелек'}, 'source': {}, 'comment': f'Заказ {i}'}
+            for i in range(count)]
+
+
+class FakeQiwiServer:
+    """ Локальный HTTP-сервер с эндпоинтами QIWI API.
+
+    :param latency: задержка ответа в секундах.
+    :param error_423: доля ответов 423 (превышение частоты запросов).
+    :param error_500: доля ответов 500.
+    :param history_size: число транзакций в истории платежей.
+    :param max_rows: максимальный размер страницы истории платежей.
+    :param seed: начальное значение генератора случайных ошибок.
+    """
+
+    def __init__(self, latency: float = 0.0, error_423: float = 0.0, error_500: float = 0.0,
+                 history_size: int = 1000, max_rows: int = 50, seed: int = 0):
+        self.latency = latency
+        self.error_423 = error_423
+        self.error_500 = error_500
+        self.max_rows = max_rows
+        self.history = _transactions(history_size)
+        self.bills = {}
+        self.payments = {}
+        self.requests = 0
+        self._positions = {txn['txnId']: i for i, txn in enumerate(self.history)}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self._routes = (('PUT', re.compile(r'/partner/bill/v1/bills/([^/]+)$'), self._create_bill),
+                        ('GET', re.compile(r'/partner/bill/v1/bills/([^/]+)$'), self._get_bill),
+                        ('POST', re.compile(r'/partner/bill/v1/bills/([^/]+)/reject$'), self._reject_bill),
+                        ('GET', re.compile(r'/payment-history/v2/persons/([^/]+)/payments$'), self._payments),
+                        ('POST', re.compile(r'/sinap/api/v2/terms/([^/]+)/payments$'), self._payment),
+                        ('POST', re.compile(r'/sinap/providers/([^/]+)/onlineCommission$'), self._commission),
+                        ('POST', re.compile(r'/(card|mobile)/detect\.action$'), self._detect),
+                        ('GET', re.compile(r'/funding-sources/v2/persons/([^/]+)/accounts$'), self._accounts))
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def _handle(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                status, data = server.handle(self.command, self.path, body)
+                content = json.dumps(data, ensure_ascii=False).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def handle(self, method, path, body):
+        """ Ответ на запрос: (HTTP-код, тело ответа). """
+        if self.latency:
+            time.sleep(self.latency)
+        url = urlsplit(path)
+        with self._lock:
+            self.requests += 1
+            roll = self._random.random()
+        if roll < self.error_423:
+            return 423, {'errorCode': 'request.blocked', 'userMessage': 'Too many requests'}
+        if roll < self.error_423 + self.error_500:
+            return 500, {'errorCode': 'internal.error', 'userMessage': 'Internal error'}
+        for route_method, pattern, handler in self._routes:
+            match = pattern.search(url.path)
+            if route_method == method and match:
+                return handler(match.group(1), parse_qs(url.query), json.loads(body) if body else None)
+        return 404, {'errorCode': 'not.found', 'userMessage': 'Not found'}
+
+    def _create_bill(self, bill_id, query, data):
+        with self._lock:
+            bill = self.bills.get(bill_id)
+            if bill is None:
+                now = datetime.now(timezone.utc).isoformat(timespec='seconds')
+                bill = self.bills[bill_id] = {
+                    'siteId': 'site', 'billId': bill_id, 'amount': data['amount'],
+                    'status': {'value': 'WAITING', 'changedDateTime': now}, 'comment': data.get('comment'),
+                    'creationDateTime': now, 'expirationDateTime': data.get('expirationDateTime'),
+                    'payUrl': f'https://oplata.qiwi.com/form/?invoice_uid={bill_id}'}
+        return 200, bill
+
+    def _get_bill(self, bill_id, query, data):
+        bill = self.bills.get(bill_id)
+        if bill is None:
+            return 404, {'errorCode': 'api.invoice.not.found', 'description': 'Invoice not found'}
+        return 200, bill
+
+    def _reject_bill(self, bill_id, query, data):
+        status, bill = self._get_bill(bill_id, query, data)
+        if status == 200:
+            bill['status']['value'] = 'REJECTED'
+        return status, bill
+
+    def _payments(self, wallet, query, data):
+        rows = min(int(query.get('rows', ['10'])[0]), self.max_rows)
+        start = self._positions.get(int(query['nextTxnId'][0]), len(self.history)) if 'nextTxnId' in query else 0
+        page = self.history[start:start + rows]
+        following = self.history[start + rows] if start + rows < len(self.history) else None
+        return 200, {'data': page, 'nextTxnId': following and following['txnId'],
+                     'nextTxnDate': following and following['date']}
+
+    def _payment(self, provider_id, query, data):
+        with self._lock:
+            payment = self.payments.get(data['id'])
+            if payment is None:
+                payment = self.payments[data['id']] = {
+                    'id': data['id'], 'terms': provider_id, 'fields': data.get('fields'), 'sum': data.get('sum'),
+                    'source': 'account_643', 'comment': data.get('comment'),
+                    'transaction': {'id': str(30000000000 + len(self.payments)), 'state': {'code': 'Accepted'}}}
+        return 200, payment
+
+    def _commission(self, provider_id, query, data):
+        amount = data['purchaseTotals']['total']['amount']
+        fee = max(round(amount * 0.02, 2), 50)
+        return 200, {'providerId': int(provider_id), 'withdrawSum': {'amount': amount + fee, 'currency': '643'},
+                     'enrollmentSum': {'amount': amount, 'currency': '643'},
+                     'qwCommission': {'amount': fee, 'currency': '643'}}
+
+    def _detect(self, kind, query, data):
+        return 200, {'code': {'value': '0', '_name': 'NORMAL'}, 'message': '1963' if kind == 'card' else '1'}
+
+    def _accounts(self, wallet, query, data):
+        return 200, {'accounts': [{'alias': 'qw_wallet_rub', 'title': 'WALLET', 'hasBalance': True,
+                                   'balance': {'amount': 1000000, 'currency': 643}, 'currency': 643,
+                                   'defaultAccount': True}]}
@@ -4,7 +4,42 @@
 # Written by Stanislav Semenov
 # https://github.com/semenovsd/qiwipyapi
 
-from qiwipyapi.wallets import P2PWallet, QIWIWallet
+# Модули пакета загружаются при первом обращении к их именам, поэтому import qiwipyapi не тянет requests,
+# aiohttp и весь Wallet API. Лёгкий клиент только для счетов P2P - qiwipyapi.p2p.P2PClient.
+_LAZY = {'AsyncConnectionPool': 'aio', 'AsyncP2PWallet': 'aio', 'AsyncQIWIWallet': 'aio', 'AsyncWallet': 'aio',
+         'Cache': 'cache', 'MemoryBackend': 'cache', 'SQLiteBackend': 'cache',
+         'CommissionQuoter': 'commission',
+         'P2PNotificationHandler': 'notifications', 'WalletHookHandler': 'notifications',
+         'PaymentOutbox': 'outbox',
+         'P2PClient': 'p2p',
+         'PayoutEngine': 'payouts', 'PayoutOrder': 'payouts',
+         'InvoicePoller': 'poller',
+         'ProviderResolver': 'providers',
+         'RateLimiter': 'ratelimit', 'default_rate_limiter': 'ratelimit',
+         'Reconciler': 'reconcile', 'reconcile': 'reconcile',
+         'ConnectionPool': 'request', 'configure_default_pool': 'request',
+         'RetryPolicy': 'retry', 'default_retry_policy': 'retry',
+         'TransactionStore': 'store',
+         'AsyncMockTransport': 'transport', 'MockTransport': 'transport', 'RecordingTransport': 'transport',
+         'ReplayTransport': 'transport',
+         'P2PWallet': 'wallets', 'QIWIWallet': 'wallets'}
+
+__all__ = sorted(_LAZY) + ['Wallet']
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    from importlib import import_module
+
+    value = getattr(import_module(f'{__name__}.{module}'), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
 
 
 class Wallet:
@@ -15,12 +50,15 @@ class Wallet:
     :param wallet_number:
     :param wallet_token:
     :param p2p_sec_key:
+    :param kwargs: параметры кошелька, например pool=ConnectionPool(...)
     :return: Object QIWIWallet or P2PWallet
     """
-    def __new__(cls, wallet_number, wallet_token=None, p2p_sec_key=None):
+    def __new__(cls, wallet_number, wallet_token=None, p2p_sec_key=None, **kwargs):
+        from qiwipyapi.wallets import P2PWallet, QIWIWallet
+
         if wallet_token:
-            return QIWIWallet(wallet_number, token=wallet_token)
+            return QIWIWallet(wallet_number, token=wallet_token, **kwargs)
         elif p2p_sec_key:
-            return P2PWallet(wallet_number, token=p2p_sec_key)
+            return P2PWallet(wallet_number, token=p2p_sec_key, **kwargs)
         else:
             raise AttributeError('Enter wallet_token or p2p_token')
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Асинхронные кошельки для QIWI Wallet API и QIWI P2P API на aiohttp.
+
+Методы асинхронных кошельков совпадают с методами QIWIWallet и P2PWallet и возвращают те же данные,
+но их нужно вызывать через await. Требуется установленный aiohttp.
+"""
+
+import asyncio
+import threading
+import weakref
+from datetime import timedelta
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+from .response import response
+from . import history, metrics
+from .cheques import aexport_cheques, open_destination
+from .models import Transaction
+from .ratelimit import default_rate_limiter
+from .request import encode_json
+from .retry import default_retry_policy
+from .transport import Response
+from .jsonstream import aiter_items
+from .utils import abounded_map
+from .wallets import BaseWallet, P2PWallet, QIWIWallet
+
+
+# Полностью прочитанный ответ aiohttp: его обрабатывают те же response() и main_exception(), что и ответ requests
+AsyncResponse = Response
+
+
+class AsyncStreamResponse:
+    """ Ответ aiohttp, тело которого ещё не прочитано. """
+
+    def __init__(self, resp):
+        self._resp = resp
+        self.status_code = resp.status
+        self.headers = resp.headers
+        self.url = str(resp.url)
+        self.method = resp.method
+
+    def iter_chunks(self, chunk_size: int = 65536):
+        return self._resp.content.iter_chunked(chunk_size)
+
+    async def read(self) -> AsyncResponse:
+        """ Прочитать тело целиком. """
+        return AsyncResponse(self.status_code, await self._resp.read(), self.headers, self.url, self.method)
+
+    def close(self):
+        self._resp.release()
+
+
+def _params(params):
+    """ aiohttp не принимает None и bool в параметрах запроса, requests их пропускает или приводит к строке. """
+    if not isinstance(params, dict):
+        return params
+    items = []
+    for key, value in params.items():
+        if value is None:
+            continue
+        for v in (value if isinstance(value, (list, tuple)) else [value]):
+            items.append((key, v if isinstance(v, (str, int, float)) and not isinstance(v, bool) else str(v)))
+    return items
+
+
+class AsyncConnectionPool:
+    """ Пул соединений aiohttp с keep-alive и ограничением числа одновременных запросов.
+    Сессия aiohttp привязана к циклу событий, поэтому для каждого цикла создаётся своя сессия: пул можно
+    использовать в нескольких asyncio.run() подряд и в циклах разных потоков.
+
+    :param limit: максимальное число открытых соединений.
+    :param limit_per_host: максимальное число соединений с одним хостом.
+    :param concurrency: максимальное число запросов, выполняемых одновременно.
+    :param keepalive_timeout: время жизни неиспользуемого соединения в секундах.
+    :param timeout: таймаут запроса в секундах.
+    """
+
+    exceptions = (aiohttp.ClientError, asyncio.TimeoutError) if aiohttp else (asyncio.TimeoutError,)
+
+    def __init__(self, limit: int = 100, limit_per_host: int = 30, concurrency: int = 100,
+                 keepalive_timeout: float = 15, timeout: float = 30):
+        if aiohttp is None:
+            raise ImportError('Для асинхронных кошельков установите aiohttp: pip install aiohttp')
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        self._concurrency = concurrency
+        self._keepalive_timeout = keepalive_timeout
+        self._timeout = timeout
+        self._sessions = weakref.WeakKeyDictionary()  # цикл событий -> (сессия, семафор)
+        self._lock = threading.Lock()
+
+    def _get_session(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._sessions.get(loop)
+            if entry is None or entry[0].closed:
+                connector = aiohttp.TCPConnector(limit=self._limit, limit_per_host=self._limit_per_host,
+                                                 keepalive_timeout=self._keepalive_timeout)
+                session = aiohttp.ClientSession(connector=connector,
+                                                timeout=aiohttp.ClientTimeout(total=self._timeout))
+                entry = self._sessions[loop] = (session, asyncio.Semaphore(self._concurrency))
+        return entry
+
+    async def send(self, method, request_url, **kwargs):
+        """ Отправить запрос. С stream=True возвращается AsyncStreamResponse, тело которого читается по частям. """
+        session, semaphore = self._get_session()
+        async with semaphore:
+            resp = await session.request(method, request_url, headers=kwargs.get('headers'),
+                                         params=_params(kwargs.get('params')), data=kwargs.get('data'),
+                                         json=kwargs.get('json'))
+            if kwargs.get('stream'):
+                return AsyncStreamResponse(resp)
+            try:
+                content = await resp.read()
+            finally:
+                resp.release()
+            return AsyncResponse(resp.status, content, resp.headers, str(resp.url), resp.method)
+
+    async def close(self):
+        """ Закрыть соединения пула в текущем цикле событий. Пул можно использовать и после закрытия,
+        соединения откроются заново.
+        """
+        with self._lock:
+            entry = self._sessions.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[0].close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
+async def _amap(func, items):
+    async for item in items:
+        yield func(item)
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_async_pool() -> AsyncConnectionPool:
+    """ Общий асинхронный пул соединений, который используют все асинхронные кошельки без своего пула.
+    Кошельки его не закрывают; в конце работы цикла событий его соединения закрывает
+    await get_default_async_pool().close().
+    """
+    global _default_pool
+    if _default_pool is None:
+        with _default_pool_lock:
+            if _default_pool is None:
+                _default_pool = AsyncConnectionPool()
+    return _default_pool
+
+
+async def request(method, request_url, pool=None, retry_policy=None, rate_limiter=None, **kwargs):
+    kwargs = encode_json(kwargs)
+    pool = pool or get_default_async_pool()
+    retry_policy = retry_policy or default_retry_policy
+    rate_limiter = rate_limiter or default_rate_limiter
+    event = metrics.start(method, request_url)
+
+    async def send():
+        bucket = await rate_limiter.aacquire(request_url, kwargs.get('headers'))
+        if event is None:
+            r = await pool.send(method, request_url, **kwargs)
+        else:
+            r = await event.asend(pool.send, method, request_url, **kwargs)
+        bucket.feedback(r.status_code)
+        return r
+
+    try:
+        r = await retry_policy.acall(send, method, request_url,
+                                     exceptions=getattr(pool, 'exceptions', AsyncConnectionPool.exceptions))
+    except BaseException as e:
+        if event is not None:
+            event.finish(e)
+        raise
+    if event is not None:
+        event.finish()
+    return r
+
+
+class AsyncBaseWallet(BaseWallet):
+    """ Родительский класс асинхронных кошельков. Переопределяет _request, остальные методы наследуются
+    от синхронных кошельков и возвращают корутины.
+
+    :param pool: пул соединений AsyncConnectionPool. По умолчанию используется общий асинхронный пул,
+    close() кошелька закрывает только переданный ему пул, а не общий.
+    """
+
+    def __init__(self, wallet_number, token, pool=None, transport=None, **kwargs):
+        super().__init__(wallet_number, token, transport=transport or pool or get_default_async_pool(), **kwargs)
+        self._owns_pool = (transport or pool) is not None
+
+    async def _request(self, method, request_url, parse=None, model=None, **kwargs):
+        r = self._cache and self._cache.get(method, request_url, kwargs)
+        if r is not None:
+            return self._result(r, parse, model)
+        r = response(await request(method, request_url, pool=self._pool, retry_policy=self._retry_policy,
+                                   rate_limiter=self._rate_limiter, **kwargs))
+        result = self._result(r, parse, model)
+        if self._cache is not None:
+            self._cache.set(method, request_url, kwargs, r)
+        return result
+
+    async def _stream(self, method, request_url, key, model=None, **kwargs):
+        r = await request(method, request_url, pool=self._pool, retry_policy=self._retry_policy,
+                          rate_limiter=self._rate_limiter, stream=True, **kwargs)
+        try:
+            if r.status_code not in (200, 201):
+                response(await r.read())
+            async for item in aiter_items(r.iter_chunks(self._STREAM_CHUNK_SIZE), key):
+                yield self._result(item, None, model)
+        finally:
+            r.close()
+
+    async def _download(self, method, request_url, destination, **kwargs) -> int:
+        r = await request(method, request_url, pool=self._pool, retry_policy=self._retry_policy,
+                          rate_limiter=self._rate_limiter, stream=True, **kwargs)
+        try:
+            if r.status_code not in (200, 201):
+                response(await r.read())
+            size = 0
+            with open_destination(destination) as f:
+                async for chunk in r.iter_chunks(self._STREAM_CHUNK_SIZE):
+                    f.write(chunk)
+                    size += len(chunk)
+            return size
+        finally:
+            r.close()
+
+    async def close(self):
+        """ Закрыть соединения пула, переданного кошельку. Общий пул остаётся открытым для других кошельков. """
+        if self._owns_pool:
+            await self._pool.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
+class AsyncP2PWallet(AsyncBaseWallet, P2PWallet):
+    """ Асинхронный класс для работы с QIWI P2P API. Методы совпадают с P2PWallet. """
+
+    async def create_invoices(self, specs, concurrency: int = 4):
+        """ Асинхронно выставить много счетов, см. P2PWallet.create_invoices. """
+        async for spec, invoice, error in abounded_map(lambda spec: self.create_invoice(**spec),
+                                                       self._invoice_specs(specs), concurrency):
+            yield self._create_invoice_result(spec, invoice, error)
+
+
+class AsyncQIWIWallet(AsyncBaseWallet, QIWIWallet):
+    """ Асинхронный класс для работы с QIWI Wallet API. Методы совпадают с QIWIWallet. """
+
+    def iter_payments(self, start_date=None, end_date=None, operation='ALL', sources=None, rows: int = 50):
+        """ Асинхронный итератор по всей истории платежей, см. QIWIWallet.iter_payments. """
+        payments = history.aiter_payments(self, start_date, end_date, operation, sources, rows)
+        return _amap(Transaction.from_json, payments) if self._models else payments
+
+    def backfill_payments(self, start_date, end_date, window=timedelta(days=7), workers: int = 4, operation='ALL',
+                          sources=None, rows: int = 50):
+        """ Асинхронная загрузка истории платежей за длинный период, см. QIWIWallet.backfill_payments. """
+        payments = history.abackfill_payments(self, start_date, end_date, window, workers, operation, sources, rows)
+        return _amap(Transaction.from_json, payments) if self._models else payments
+
+    def get_commissions(self, id, amounts, account=None, account_type=None):
+        """ Асинхронно узнать комиссии для многих сумм, см. QIWIWallet.get_commissions. """
+        return self.commission_quoter.aquote_many(id, amounts, account=account, account_type=account_type)
+
+    def export_cheques(self, cheques, directory, format: str = 'PDF', concurrency: int = 4,
+                       skip_existing: bool = True, progress=None):
+        """ Асинхронно скачать квитанции многих транзакций, см. QIWIWallet.export_cheques. """
+        return aexport_cheques(self, cheques, directory, format, concurrency, skip_existing, progress)
+
+
+class AsyncWallet:
+    """ Класс создаёт асинхронный кошелёк для P2P API или QIWI API.
+
+    :param wallet_number:
+    :param wallet_token:
+    :param p2p_sec_key:
+    :param kwargs: параметры кошелька, например pool=AsyncConnectionPool(...)
+    :return: Object AsyncQIWIWallet or AsyncP2PWallet
+    """
+    def __new__(cls, wallet_number, wallet_token=None, p2p_sec_key=None, **kwargs):
+        if wallet_token:
+            return AsyncQIWIWallet(wallet_number, token=wallet_token, **kwargs)
+        elif p2p_sec_key:
+            return AsyncP2PWallet(wallet_number, token=p2p_sec_key, **kwargs)
+        else:
+            raise AttributeError('Enter wallet_token or p2p_token')
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Кэш ответов редко меняющихся эндпоинтов Wallet API. """
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Время жизни ответов в секундах. Кэшируются только эндпоинты из этого списка.
+DEFAULT_TTLS = (('cross-rates', re.compile(r'/sinap/crossRates$'), 60),
+                ('nickname', re.compile(r'/qw-nicknames/v1/persons/[^/]+/nickname$'), 3600),
+                ('funding-offer', re.compile(r'/funding-sources/v2/persons/[^/]+/accounts/offer$'), 3600),
+                ('profile', re.compile(r'/person-profile/v1/profile/current$'), 600),
+                ('restrictions', re.compile(r'/person-profile/v1/persons/[^/]+/status/restrictions$'), 600),
+                ('limits', re.compile(r'/qw-limits/v1/persons/[^/]+/actual-limits$'), 300),
+                ('provider-search', re.compile(r'qiwi\.com/search/results/json\.action$'), 86400),
+                ('mobile-provider', re.compile(r'qiwi\.com/mobile/detect\.action$'), 86400))
+
+# Изменяющие запросы (не GET и HEAD), после которых устаревают закэшированные ответы:
+# (шаблон URL, имена эндпоинтов из DEFAULT_TTLS)
+DEFAULT_INVALIDATIONS = ((re.compile(r'/funding-sources/v2/persons/[^/]+/accounts'), ('funding-offer',)),
+                         (re.compile(r'/identification/v1/persons/'), ('profile', 'restrictions', 'limits')))
+
+
+class MemoryBackend:
+    """ Кэш в памяти процесса: LRU не больше maxsize записей.
+
+    :param maxsize: максимальное число записей.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry[3]
+
+    def set(self, key, scope, endpoint, value, ttl):
+        with self._lock:
+            self._data[key] = (time.time() + ttl, scope, endpoint, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, scope=None, endpoints=None):
+        with self._lock:
+            for key in [key for key, (_, entry_scope, endpoint, _) in self._data.items()
+                        if (scope is None or entry_scope == scope) and (endpoints is None or endpoint in endpoints)]:
+                del self._data[key]
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteBackend:
+    """ Кэш в файле SQLite, общий для нескольких процессов. Значения хранятся в JSON,
+    LRU не больше maxsize записей.
+
+    :param path: путь к файлу кэша.
+    :param maxsize: максимальное число записей.
+    """
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS cache (
+        key TEXT PRIMARY KEY,
+        scope TEXT NOT NULL,
+        endpoint TEXT NOT NULL,
+        value TEXT NOT NULL,
+        expires REAL NOT NULL,
+        used REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS cache_used ON cache (used);
+    """
+
+    def __init__(self, path: str = 'qiwipyapi-cache.db', maxsize: int = 10000):
+        self.maxsize = maxsize
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        if path != ':memory:':
+            self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(self._SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute('SELECT value, expires FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._db.execute('DELETE FROM cache WHERE key = ?', (key,))
+                return None
+            self._db.execute('UPDATE cache SET used = ? WHERE key = ?', (now, key))
+        return json.loads(row[0])
+
+    def set(self, key, scope, endpoint, value, ttl):
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?)',
+                             (key, scope, endpoint, json.dumps(value), now + ttl, now))
+            excess = self._db.execute('SELECT COUNT(*) FROM cache').fetchone()[0] - self.maxsize
+            if excess > 0:
+                self._db.execute('DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY used LIMIT ?)',
+                                 (excess,))
+                self.evictions += excess
+
+    def invalidate(self, scope=None, endpoints=None):
+        query, args = 'DELETE FROM cache WHERE 1', []
+        if scope is not None:
+            query += ' AND scope = ?'
+            args.append(scope)
+        if endpoints is not None:
+            query += f' AND endpoint IN ({",".join("?" * len(endpoints))})'
+            args.extend(endpoints)
+        with self._lock, self._db:
+            self._db.execute(query, args)
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+
+class CacheStats:
+    """ Статистика кэша: попадания и промахи по эндпоинтам. """
+
+    def __init__(self):
+        self.hits = {}
+        self.misses = {}
+        self._lock = threading.Lock()
+
+    def _count(self, counter, endpoint):
+        with self._lock:
+            counter[endpoint] = counter.get(endpoint, 0) + 1
+
+    @property
+    def hit_ratio(self) -> float:
+        hits, misses = sum(self.hits.values()), sum(self.misses.values())
+        return hits / (hits + misses) if hits + misses else 0.0
+
+    def __repr__(self):
+        return f'CacheStats(hits={self.hits}, misses={self.misses}, hit_ratio={self.hit_ratio:.2f})'
+
+
+class Cache:
+    """ Кэш ответов редко меняющихся эндпоинтов (курсы валют, никнейм, профиль, лимиты, поиск провайдеров).
+    Подключается к кошельку параметром cache. Записи разделяются по токену кошелька, поэтому один кэш
+    можно использовать для нескольких кошельков. После запросов, которые меняют данные (create_balance,
+    default_account, идентификация), связанные записи кошелька удаляются.
+
+    Закэшированный ответ возвращается всем вызывающим, изменять его нельзя.
+
+    :param backend: хранилище MemoryBackend (по умолчанию) или SQLiteBackend для кэша, общего для процессов.
+    :param ttls: время жизни по эндпоинтам {'cross-rates': 30, ...}, дополняет DEFAULT_TTLS.
+    Значение 0 отключает кэш эндпоинта.
+    """
+
+    def __init__(self, backend=None, ttls: dict = None):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttls = dict({endpoint: ttl for endpoint, _, ttl in DEFAULT_TTLS}, **(ttls or {}))
+        self.stats = CacheStats()
+
+    @staticmethod
+    def scope(headers) -> str:
+        token = (headers or {}).get('Authorization') or ''
+        return hashlib.sha1(token.encode()).hexdigest()
+
+    def endpoint(self, request_url):
+        """ Имя кэшируемого эндпоинта или None, если ответы URL не кэшируются. """
+        path = request_url.split('?', 1)[0]
+        for endpoint, pattern, _ in DEFAULT_TTLS:
+            if pattern.search(path):
+                return endpoint if self.ttls.get(endpoint) else None
+        return None
+
+    def key(self, method, request_url, kwargs) -> str:
+        request = [method.upper(), request_url, self.scope(kwargs.get('headers'))]
+        request.extend(kwargs.get(name) for name in ('params', 'data', 'json'))
+        return hashlib.sha1(json.dumps(request, sort_keys=True, default=str).encode()).hexdigest()
+
+    def get(self, method, request_url, kwargs):
+        """ Закэшированный ответ на запрос или None. """
+        endpoint = self.endpoint(request_url)
+        if endpoint is None:
+            return None
+        value = self.backend.get(self.key(method, request_url, kwargs))
+        self.stats._count(self.stats.misses if value is None else self.stats.hits, endpoint)
+        return value
+
+    def set(self, method, request_url, kwargs, value):
+        """ Сохранить ответ на запрос или удалить записи, которые устарели после этого запроса. """
+        endpoint = self.endpoint(request_url)
+        if endpoint is not None:
+            if isinstance(value, (dict, list)):
+                self.backend.set(self.key(method, request_url, kwargs), self.scope(kwargs.get('headers')),
+                                 endpoint, value, self.ttls[endpoint])
+            return
+        if method.upper() in ('GET', 'HEAD'):  # чтение ничего не меняет
+            return
+        for pattern, endpoints in DEFAULT_INVALIDATIONS:
+            if pattern.search(request_url):
+                self.backend.invalidate(self.scope(kwargs.get('headers')), endpoints)
+
+    def invalidate(self, endpoints=None, wallet=None):
+        """ Удалить записи кэша.
+
+        :param endpoints: имена эндпоинтов из DEFAULT_TTLS, по умолчанию все.
+        :param wallet: удалить только записи этого кошелька.
+        """
+        scope = self.scope(wallet._HEADERS) if wallet is not None else None
+        self.backend.invalidate(scope, tuple(endpoints) if endpoints is not None else None)
+
+    def clear(self):
+        self.invalidate()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Выгрузка квитанций (чеков) по транзакциям. Тело квитанции пишется на диск кусками по мере получения,
+поэтому память не зависит ни от размера квитанций, ни от их числа.
+"""
+
+import os
+from contextlib import contextmanager
+
+from .utils import abounded_map, bounded_map
+
+
+class ChequeExport:
+    """ Итоги выгрузки квитанций: saved и skipped - число сохранённых и пропущенных (уже скачанных) квитанций,
+    failed - {номер транзакции: ошибка}.
+    """
+
+    def __init__(self):
+        self.saved = 0
+        self.skipped = 0
+        self.failed = {}
+
+    @property
+    def done(self) -> int:
+        return self.saved + self.skipped + len(self.failed)
+
+    def __repr__(self):
+        return f'ChequeExport(saved={self.saved}, skipped={self.skipped}, failed={len(self.failed)})'
+
+
+def cheque_path(directory, transaction_id, format: str = 'PDF') -> str:
+    """ Путь к файлу квитанции транзакции в каталоге directory. """
+    return os.path.join(directory, f'{transaction_id}.{format.lower()}')
+
+
+@contextmanager
+def open_destination(destination):
+    """ Файл для записи квитанции. destination - путь или объект с методом write.
+    Квитанция пишется во временный файл .part и переименовывается только после получения целиком,
+    поэтому на месте файла никогда не остаётся недокачанная квитанция.
+    """
+    if hasattr(destination, 'write'):
+        yield destination
+        return
+    path = os.fspath(destination)
+    part = path + '.part'
+    try:
+        with open(part, 'wb') as f:
+            yield f
+        os.replace(part, path)
+    finally:
+        if os.path.exists(part):
+            os.remove(part)
+
+
+def _pending(cheques, directory, format, skip_existing, export, progress):
+    """ Квитанции, которые нужно скачать. Уже скачанные пропускаются, не занимая потоков. """
+    for transaction_id, type in cheques:
+        path = cheque_path(directory, transaction_id, format)
+        if skip_existing and os.path.exists(path):
+            export.skipped += 1
+            if progress:
+                progress(export, transaction_id)
+            continue
+        yield transaction_id, type, path
+
+
+def _collect(export, progress, item, error):
+    transaction_id = item[0]
+    if error is None:
+        export.saved += 1
+    else:
+        export.failed[transaction_id] = error
+    if progress:
+        progress(export, transaction_id)
+
+
+def export_cheques(wallet, cheques, directory, format: str = 'PDF', concurrency: int = 4, skip_existing: bool = True,
+                   progress=None) -> ChequeExport:
+    """ Скачать квитанции в каталог directory в concurrency потоков.
+
+    :param wallet: кошелёк QIWIWallet.
+    :param cheques: пары (номер транзакции, тип транзакции), например из истории платежей. Может быть генератором.
+    :param directory: каталог для файлов квитанций <номер транзакции>.pdf или .jpeg.
+    :param format: PDF или JPEG.
+    :param concurrency: число одновременных загрузок.
+    :param skip_existing: не скачивать квитанции, файлы которых уже есть.
+    :param progress: функция progress(export, transaction_id), вызывается после каждой квитанции.
+    :return: ChequeExport. Ошибка одной квитанции не прерывает выгрузку остальных.
+    """
+    os.makedirs(directory, exist_ok=True)
+    export = ChequeExport()
+    for item, _, error in bounded_map(lambda item: wallet.save_cheque(item[0], item[1], item[2], format=format),
+                                      _pending(cheques, directory, format, skip_existing, export, progress),
+                                      concurrency):
+        _collect(export, progress, item, error)
+    return export
+
+
+async def aexport_cheques(wallet, cheques, directory, format: str = 'PDF', concurrency: int = 4,
+                          skip_existing: bool = True, progress=None) -> ChequeExport:
+    """ Асинхронный вариант export_cheques для асинхронного кошелька. """
+    os.makedirs(directory, exist_ok=True)
+    export = ChequeExport()
+    async for item, _, error in abounded_map(lambda item: wallet.save_cheque(item[0], item[1], item[2], format=format),
+                                             _pending(cheques, directory, format, skip_existing, export, progress),
+                                             concurrency):
+        _collect(export, progress, item, error)
+    return export
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Кодирование и разбор JSON. Используется самая быстрая из установленных библиотек: orjson, ujson
+или стандартный json. Библиотеку можно выбрать переменной окружения QIWIPYAPI_JSON или функцией use().
+
+loads принимает bytes и разбирает тело ответа без промежуточной строки, dumps возвращает bytes.
+"""
+
+import json
+import os
+from collections import namedtuple
+from datetime import date, datetime
+from decimal import Decimal
+
+Codec = namedtuple('Codec', ['name', 'loads', 'dumps'])
+
+
+def _default(obj):
+    """ Типы, которых нет в JSON: объекты models, суммы Decimal и даты. Decimal записывается строкой
+    без перевода в float, чтобы сумма не потеряла точность.
+    """
+    if hasattr(obj, 'to_json'):
+        return obj.to_json()
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def _orjson():
+    import orjson
+
+    def dumps(obj) -> bytes:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+    return Codec('orjson', orjson.loads, dumps)
+
+
+def _ujson():
+    import ujson
+
+    def dumps(obj) -> bytes:
+        return ujson.dumps(obj, ensure_ascii=False, default=_default).encode()
+
+    return Codec('ujson', ujson.loads, dumps)
+
+
+def _json():
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_default)
+
+    def dumps(obj) -> bytes:
+        return encoder.encode(obj).encode()
+
+    return Codec('json', json.loads, dumps)
+
+
+CODECS = {'orjson': _orjson, 'ujson': _ujson, 'json': _json}
+
+
+def get_codec(name: str) -> Codec:
+    """ Кодек по имени: orjson, ujson или json. Если библиотека не установлена, будет ImportError. """
+    return CODECS[name]()
+
+
+def available() -> list:
+    """ Имена кодеков, библиотеки которых установлены. """
+    names = []
+    for name in CODECS:
+        try:
+            get_codec(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+codec = None
+loads = None
+dumps = None
+
+
+def use(name: str = None) -> Codec:
+    """ Выбрать кодек. Без имени выбирается первый установленный из orjson, ujson, json.
+
+    :param name: orjson, ujson или json.
+    :return: выбранный кодек
+    """
+    global codec, loads, dumps
+    if name:
+        codec = get_codec(name)
+    else:
+        for candidate in CODECS:
+            try:
+                codec = get_codec(candidate)
+                break
+            except ImportError:
+                continue
+    loads, dumps = codec.loads, codec.dumps
+    return codec
+
+
+use(os.environ.get('QIWIPYAPI_JSON'))
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Расчёт комиссий за платежи с запоминанием тарифов провайдеров. """
+
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+
+from .utils import abounded_map, bounded_map
+
+_KOPECK = Decimal('0.01')
+
+FeeStructure = namedtuple('FeeStructure', ['fixed', 'percent', 'min', 'max'])
+FeeStructure.__doc__ = """ Тариф провайдера: комиссия = fixed + percent% от суммы, но не меньше min и не больше max.
+Неизвестные части тарифа равны None.
+"""
+
+
+def _decimal(value) -> Decimal:
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+class FeeSchedule:
+    """ Наблюдаемые комиссии одного провайдера, отсортированные по сумме.
+
+    Тариф QIWI - линейная функция суммы, ограниченная минимумом и максимумом, то есть не больше трёх линейных
+    участков. Комиссия для суммы между двумя соседними наблюдениями считается интерполяцией, только если
+    эти наблюдения лежат на одной прямой с третьим соседним наблюдением: тогда между ними нет излома тарифа.
+
+    :param ttl: время жизни наблюдения в секундах.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._amounts = []
+        self._fees = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._amounts)
+
+    def _expire(self, now):
+        expired = [amount for amount in self._amounts if self._fees[amount][1] <= now]
+        for amount in expired:
+            del self._fees[amount]
+        if expired:
+            self._amounts = [amount for amount in self._amounts if amount in self._fees]
+
+    def add(self, amount, fee):
+        amount, fee = _decimal(amount), _decimal(fee)
+        with self._lock:
+            if amount not in self._fees:
+                insort(self._amounts, amount)
+            self._fees[amount] = (fee, time.time() + self.ttl)
+
+    def _fee(self, amount):
+        return self._fees[amount][0]
+
+    def _collinear(self, a, b, c) -> bool:
+        """ Точка b лежит на прямой через a и c с точностью до округления комиссии. """
+        fa, fb, fc = self._fee(a), self._fee(b), self._fee(c)
+        return abs(fa + (fc - fa) * (b - a) / (c - a) - fb) <= _KOPECK
+
+    def get(self, amount):
+        """ Комиссия для суммы: наблюдённая, интерполированная или None, если её нельзя вычислить локально.
+
+        :return: (комиссия, наблюдённая ли комиссия) или None
+        """
+        amount = _decimal(amount)
+        with self._lock:
+            self._expire(time.time())
+            if amount in self._fees:
+                return self._fee(amount), True
+            i = bisect_left(self._amounts, amount)
+            if i == 0 or i == len(self._amounts):
+                return None
+            a, b = self._amounts[i - 1], self._amounts[i]
+            if not ((i >= 2 and self._collinear(self._amounts[i - 2], a, b))
+                    or (i + 1 < len(self._amounts) and self._collinear(a, b, self._amounts[i + 1]))):
+                return None
+            fa, fb = self._fee(a), self._fee(b)
+            fee = fa + (fb - fa) * (amount - a) / (b - a)
+            return fee.quantize(_KOPECK, rounding=ROUND_HALF_UP), False
+
+    def structure(self) -> FeeStructure:
+        """ Оценка тарифа по наблюдениям. """
+        with self._lock:
+            self._expire(time.time())
+            points = [(amount, self._fee(amount)) for amount in self._amounts]
+        fixed = percent = minimum = maximum = None
+        if len(points) >= 2 and points[0][1] == points[1][1]:
+            minimum = points[0][1]
+        if len(points) >= 2 and points[-1][1] == points[-2][1] and points[-1][1] != minimum:
+            maximum = points[-1][1]
+        for (a, fa), (b, fb), (c, fc) in zip(points, points[1:], points[2:]):
+            if fa != fc and abs(fa + (fc - fa) * (b - a) / (c - a) - fb) <= _KOPECK:
+                slope = (fc - fa) / (c - a)
+                percent = (slope * 100).quantize(_KOPECK)
+                fixed = (fa - slope * a).quantize(_KOPECK)
+                break
+        return FeeStructure(fixed, percent, minimum, maximum)
+
+
+class CommissionQuoter:
+    """ Расчёт комиссий с запоминанием ответов onlineCommission по (провайдер, тип счёта, сумма) на ttl секунд.
+    По наблюдённым комиссиям восстанавливается тариф провайдера, и комиссия для суммы внутри изученного
+    участка тарифа считается локально, без запроса. Локальный расчёт округляется до копейки.
+
+    :param wallet: кошелёк QIWIWallet или AsyncQIWIWallet.
+    :param ttl: время жизни наблюдённых комиссий в секундах.
+    :param concurrency: число одновременных запросов комиссии.
+    """
+
+    def __init__(self, wallet, ttl: float = 3600, concurrency: int = 4):
+        self.wallet = wallet
+        self.ttl = ttl
+        self.concurrency = concurrency
+        self.hits = 0
+        self.interpolated = 0
+        self.misses = 0
+        self._schedules = {}
+        self._lock = threading.Lock()
+
+    def schedule(self, provider_id, account_type=None) -> FeeSchedule:
+        key = (str(provider_id), account_type)
+        with self._lock:
+            schedule = self._schedules.get(key)
+            if schedule is None:
+                schedule = self._schedules[key] = FeeSchedule(self.ttl)
+        return schedule
+
+    def structure(self, provider_id, account_type=None) -> FeeStructure:
+        """ Изученный тариф провайдера. """
+        return self.schedule(provider_id, account_type).structure()
+
+    def _local(self, schedule, amount):
+        result = schedule.get(amount)
+        if result is None:
+            return None
+        fee, observed = result
+        if observed:
+            self.hits += 1
+        else:
+            self.interpolated += 1
+        return float(fee)
+
+    def _observe(self, schedule, amount, fee):
+        self.misses += 1
+        schedule.add(amount, fee)
+        return fee
+
+    def quote(self, provider_id, amount, account: str = None, account_type=None) -> float:
+        """ Комиссия за платёж amount провайдеру provider_id, см. QIWIWallet.get_commission.
+
+        :param account_type: тип счёта получателя, если комиссия провайдера от него зависит (например, карта
+        или кошелёк). Комиссии разных типов счёта запоминаются отдельно.
+        """
+        schedule = self.schedule(provider_id, account_type)
+        fee = self._local(schedule, amount)
+        if fee is None:
+            fee = self._observe(schedule, amount, self.wallet.get_commission(provider_id, amount, account=account))
+        return fee
+
+    async def aquote(self, provider_id, amount, account: str = None, account_type=None) -> float:
+        """ Асинхронный вариант quote для асинхронного кошелька. """
+        schedule = self.schedule(provider_id, account_type)
+        fee = self._local(schedule, amount)
+        if fee is None:
+            fee = self._observe(schedule, amount,
+                                await self.wallet.get_commission(provider_id, amount, account=account))
+        return fee
+
+    @staticmethod
+    def _waves(amounts):
+        """ Сначала запрашиваются крайние и средняя суммы: после них остальные часто считаются локально. """
+        amounts = sorted(set(amounts), key=_decimal)
+        probes = {amounts[0], amounts[len(amounts) // 2], amounts[-1]} if amounts else set()
+        return [a for a in amounts if a in probes], [a for a in amounts if a not in probes]
+
+    def quote_many(self, provider_id, amounts, account: str = None, account_type=None) -> dict:
+        """ Комиссии для многих сумм. Неизвестные комиссии запрашиваются параллельно.
+
+        :return: {сумма: комиссия}
+        """
+        fees = {}
+        for wave in self._waves(amounts):
+            for amount, fee, error in bounded_map(
+                    lambda amount: self.quote(provider_id, amount, account=account, account_type=account_type),
+                    wave, self.concurrency):
+                if error is not None:
+                    raise error
+                fees[amount] = fee
+        return fees
+
+    async def aquote_many(self, provider_id, amounts, account: str = None, account_type=None) -> dict:
+        """ Асинхронный вариант quote_many для асинхронного кошелька. """
+        fees = {}
+        for wave in self._waves(amounts):
+            async for amount, fee, error in abounded_map(
+                    lambda amount: self.aquote(provider_id, amount, account=account, account_type=account_type),
+                    wave, self.concurrency):
+                if error is not None:
+                    raise error
+                fees[amount] = fee
+        return fees
@@ -3,7 +3,13 @@
 
 
 class QiwiError(Exception):
-    pass
+    def __init__(self, *args, status_code=None):
+        super().__init__(*args)
+        self.status_code = status_code
+
+
+class ProviderNotFoundError(QiwiError):
+    """ Провайдер для номера карты или телефона не определён: detect.action вернул code.value, отличный от 0. """
 
 
 class QiwiServerError(Exception):
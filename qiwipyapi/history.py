@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Постраничный обход истории платежей QIWI Wallet API. """
+
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import islice
+
+
+def iter_payments(wallet, start_date=None, end_date=None, operation='ALL', sources=None, rows=50):
+    """ Генератор платежей из истории кошелька. Следующая страница запрашивается в фоновом потоке
+    сразу после получения текущей, поэтому сеть и обработка платежей идут параллельно.
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(wallet.payments_page, rows, operation, sources, start_date, end_date)
+        try:
+            while future is not None:
+                page = future.result()
+                next_txn_id, next_txn_date = page.get('nextTxnId'), page.get('nextTxnDate')
+                future = None
+                if next_txn_id:
+                    future = executor.submit(wallet.payments_page, rows, operation, sources, start_date, end_date,
+                                             next_txn_date, next_txn_id)
+                yield from page.get('data') or ()
+        finally:
+            if future is not None:
+                future.cancel()
+
+
+async def aiter_payments(wallet, start_date=None, end_date=None, operation='ALL', sources=None, rows=50):
+    """ Асинхронный вариант iter_payments для асинхронных кошельков. """
+    task = asyncio.ensure_future(wallet.payments_page(rows, operation, sources, start_date, end_date))
+    try:
+        while task is not None:
+            page = await task
+            next_txn_id, next_txn_date = page.get('nextTxnId'), page.get('nextTxnDate')
+            task = None
+            if next_txn_id:
+                task = asyncio.ensure_future(wallet.payments_page(rows, operation, sources, start_date, end_date,
+                                                                  next_txn_date, next_txn_id))
+            for txn in page.get('data') or ():
+                yield txn
+    finally:
+        if task is not None:
+            task.cancel()
+
+
+# Максимальный период поиска в истории платежей QIWI
+MAX_WINDOW = timedelta(days=90)
+
+
+def date_windows(start_date, end_date, window=timedelta(days=7)) -> list:
+    """ Разбить период [start_date, end_date] на окна не длиннее window, от новых к старым.
+    Соседние окна имеют общую границу и больше не пересекаются.
+    """
+    if not timedelta(0) < window <= MAX_WINDOW:
+        raise ValueError(f'History window must be positive and not longer than {MAX_WINDOW.days} days, got {window}')
+    windows = []
+    end = end_date
+    while end > start_date:
+        start = max(start_date, end - window)
+        windows.append((start, end))
+        end = start
+    return windows
+
+
+def _fetch_window(wallet, start_date, end_date, operation, sources, rows):
+    txns = []
+    page = wallet.payments_page(rows, operation, sources, start_date, end_date)
+    txns.extend(page.get('data') or ())
+    while page.get('nextTxnId'):
+        page = wallet.payments_page(rows, operation, sources, start_date, end_date, page.get('nextTxnDate'),
+                                    page.get('nextTxnId'))
+        txns.extend(page.get('data') or ())
+    return txns
+
+
+async def _afetch_window(wallet, start_date, end_date, operation, sources, rows):
+    txns = []
+    page = await wallet.payments_page(rows, operation, sources, start_date, end_date)
+    txns.extend(page.get('data') or ())
+    while page.get('nextTxnId'):
+        page = await wallet.payments_page(rows, operation, sources, start_date, end_date, page.get('nextTxnDate'),
+                                          page.get('nextTxnId'))
+        txns.extend(page.get('data') or ())
+    return txns
+
+
+def _dedup(txns, previous_ids):
+    """ Платёж может попасть в два окна, только если его время совпадает с их общей границей, поэтому платежи
+    сверяются по txnId лишь с предыдущим окном, а не со всеми загруженными.
+    """
+    for txn in txns:
+        if txn.get('txnId') not in previous_ids:
+            yield txn
+
+
+def backfill_payments(wallet, start_date, end_date, window=timedelta(days=7), workers=4, operation='ALL',
+                      sources=None, rows=50):
+    """ Загрузка истории платежей за длинный период. Период делится на окна, окна загружаются параллельно
+    в workers потоках (частоту запросов по-прежнему ограничивает RateLimiter кошелька), а платежи отдаются
+    в порядке от новых к старым без дублей. В памяти держится не больше workers окон.
+    Окно длиннее MAX_WINDOW сразу вызывает ValueError, до запросов к API.
+    """
+    return _backfill(wallet, iter(date_windows(start_date, end_date, window)), workers, operation, sources, rows)
+
+
+def _backfill(wallet, windows, workers, operation, sources, rows):
+    previous_ids = set()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque(executor.submit(_fetch_window, wallet, start, end, operation, sources, rows)
+                        for start, end in islice(windows, workers))
+        try:
+            while pending:
+                txns = pending.popleft().result()
+                for start, end in islice(windows, 1):
+                    pending.append(executor.submit(_fetch_window, wallet, start, end, operation, sources, rows))
+                yield from _dedup(txns, previous_ids)
+                previous_ids = {txn.get('txnId') for txn in txns}
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def abackfill_payments(wallet, start_date, end_date, window=timedelta(days=7), workers=4, operation='ALL',
+                       sources=None, rows=50):
+    """ Асинхронный вариант backfill_payments для асинхронных кошельков. """
+    return _abackfill(wallet, iter(date_windows(start_date, end_date, window)), workers, operation, sources, rows)
+
+
+async def _abackfill(wallet, windows, workers, operation, sources, rows):
+    previous_ids = set()
+    pending = deque(asyncio.ensure_future(_afetch_window(wallet, start, end, operation, sources, rows))
+                    for start, end in islice(windows, workers))
+    try:
+        while pending:
+            txns = await pending.popleft()
+            for start, end in islice(windows, 1):
+                pending.append(asyncio.ensure_future(_afetch_window(wallet, start, end, operation, sources, rows)))
+            for txn in _dedup(txns, previous_ids):
+                yield txn
+            previous_ids = {txn.get('txnId') for txn in txns}
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Потоковый разбор списков в ответах API: элементы массива верхнего уровня (data[], bills[]) разбираются
+по мере получения тела ответа, не дожидаясь конца ответа и не строя дерево всего ответа.
+"""
+
+import codecs
+import json
+import re
+
+# Строка целиком (группа 2 пуста, если строка ещё не получена до конца) или значимый символ
+_TOKEN = re.compile(r'"((?:[^"\\]|\\.)*)(")?|[{}\[\],:]', re.S)
+_SEPARATOR = re.compile(r'[\s,]*')
+
+
+class ItemParser:
+    """ Инкрементальный парсер элементов массива key объекта верхнего уровня, например data в
+    {"data": [{...}, {...}], "nextTxnId": ...}. Структура ответа вокруг массива разбирается по символам,
+    а каждый элемент целиком разбирается сканером стандартного json, как только получен полностью.
+    В памяти держится только необработанный хвост полученных данных: не больше одного элемента.
+
+    :param key: ключ массива в объекте верхнего уровня.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._scanner = json.JSONDecoder()
+        self._text = ''
+        self._depth = 0
+        self._last_string = None
+        self._current_key = None
+        self._in_target = False
+
+    def feed(self, chunk: bytes) -> list:
+        """ Передать очередной кусок тела ответа.
+
+        :return: список элементов, которые завершились в этом куске
+        """
+        text = self._text + self._decoder.decode(chunk)
+        items, pos = [], 0
+        while True:
+            if self._in_target:
+                pos = _SEPARATOR.match(text, pos).end()
+                if pos == len(text):
+                    break
+                if text[pos] == ']':
+                    self._in_target = False
+                    self._depth -= 1
+                    pos += 1
+                    continue
+                try:
+                    item, pos = self._scanner.raw_decode(text, pos)
+                except ValueError:
+                    break  # элемент ещё не получен целиком, разбор продолжится со следующим куском
+                items.append(item)
+                continue
+            match = _TOKEN.search(text, pos)
+            if match is None:
+                pos = len(text)
+                break
+            token = match.group()
+            if token[0] == '"':
+                if match.group(2) is None:
+                    pos = match.start()  # строка не закончилась
+                    break
+                if self._depth == 1:
+                    self._last_string = match.group(1)
+            elif token in '{[':
+                self._depth += 1
+                if token == '[' and self._depth == 2 and self._current_key == self.key:
+                    self._in_target = True
+            elif token in '}]':
+                self._depth -= 1
+            elif self._depth == 1:
+                self._current_key = self._last_string if token == ':' else None
+            pos = match.end()
+        self._text = text[pos:]
+        return items
+
+    def close(self):
+        """ Проверить, что ответ получен полностью. """
+        if self._depth or self._text.strip() or self._decoder.decode(b'', final=True):
+            raise ValueError(f'Incomplete JSON response, unparsed: {self._text[:100]!r}')
+
+
+def iter_items(chunks, key: str):
+    """ Генератор элементов массива key из кусков тела ответа. """
+    parser = ItemParser(key)
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    parser.close()
+
+
+async def aiter_items(chunks, key: str):
+    """ Асинхронный вариант iter_items для асинхронного итератора кусков. """
+    parser = ItemParser(key)
+    async for chunk in chunks:
+        for item in parser.feed(chunk):
+            yield item
+    parser.close()
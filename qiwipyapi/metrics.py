@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Метрики запросов к API: время ответа по эндпоинтам, коды ответов, повторы, ответы 423, число запросов
+в работе, время разбора JSON. Метрики собираются только после enable(), до этого запросы выполняются
+без замеров.
+
+    from qiwipyapi import metrics
+
+    m = metrics.enable(metrics.PrometheusExporter())
+    m.add_hook(after=lambda event: print(event.endpoint, event.duration))
+    m.snapshot()
+
+Эндпоинт - шаблон URL без параметров запроса, в котором номера кошельков, транзакций и счетов заменены на {id},
+например GET edge.qiwi.com/payment-history/v2/persons/{id}/payments.
+"""
+
+import re
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+# Границы корзин гистограмм времени в секундах
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Сегмент пути с номером: кошелёк, транзакция, провайдер, счёт
+_ID_SEGMENT = re.compile(r'^\+?\d+$|(?:.*\d){3}')
+
+
+@lru_cache(maxsize=4096)
+def _template(method, request_url):
+    url = urlsplit(request_url)
+    path = '/'.join('{id}' if _ID_SEGMENT.match(segment) else segment for segment in url.path.split('/'))
+    return f'{method.upper()} {url.netloc}{path}'
+
+
+def endpoint(method, request_url) -> str:
+    """ Шаблон эндпоинта запроса. """
+    return _template(method, request_url.split('?', 1)[0])
+
+
+class Histogram:
+    """ Гистограмма значений с фиксированными границами корзин. """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q) -> float:
+        """ Оценка квантиля q: верхняя граница корзины, в которую он попадает. """
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if count and seen >= rank:
+                return bound
+        return 0.0
+
+    def as_dict(self) -> dict:
+        return {'count': self.count, 'sum': self.sum, 'p50': self.quantile(0.5), 'p99': self.quantile(0.99),
+                'buckets': dict(zip(self.buckets + (float('inf'),), self.counts))}
+
+
+def _as_dict(histograms, name):
+    histogram = histograms.get(name)
+    return None if histogram is None else histogram.as_dict()
+
+
+class RequestEvent:
+    """ Запрос к API, передаётся в хуки. Все времена в секундах.
+
+    endpoint - шаблон эндпоинта; attempts - число попыток; status_code - код последнего ответа;
+    error - исключение, если запрос не выполнен; duration - время всего вызова с повторами;
+    network - время попыток (отправка запроса и получение ответа); wait - остальное время: ожидание
+    ограничителя частоты и задержки перед повторами; context - словарь для данных хуков и экспортёров.
+    """
+
+    __slots__ = ('method', 'url', 'endpoint', 'started', 'attempts', 'statuses', 'status_code', 'error',
+                 'duration', 'network', 'context', '_metrics')
+
+    def __init__(self, metrics, method, request_url):
+        self._metrics = metrics
+        self.method = method.upper()
+        self.url = request_url
+        self.endpoint = endpoint(method, request_url)
+        self.started = time.perf_counter()
+        self.attempts = 0
+        self.statuses = []
+        self.status_code = None
+        self.error = None
+        self.duration = None
+        self.network = 0.0
+        self.context = {}
+
+    @property
+    def retries(self) -> int:
+        return max(self.attempts - 1, 0)
+
+    @property
+    def wait(self) -> float:
+        return max((self.duration or 0.0) - self.network, 0.0)
+
+    def _attempted(self, started, r):
+        self.attempts += 1
+        self.network += time.perf_counter() - started
+        self.status_code = r.status_code
+        self.statuses.append(r.status_code)
+        return r
+
+    def send(self, send, *args, **kwargs):
+        """ Попытка запроса: send(*args, **kwargs) с замером времени. """
+        started = time.perf_counter()
+        try:
+            r = send(*args, **kwargs)
+        except BaseException:
+            self.attempts += 1
+            self.network += time.perf_counter() - started
+            raise
+        return self._attempted(started, r)
+
+    async def asend(self, send, *args, **kwargs):
+        """ Асинхронный вариант send. """
+        started = time.perf_counter()
+        try:
+            r = await send(*args, **kwargs)
+        except BaseException:
+            self.attempts += 1
+            self.network += time.perf_counter() - started
+            raise
+        return self._attempted(started, r)
+
+    def finish(self, error=None):
+        self.duration = time.perf_counter() - self.started
+        self.error = error
+        self._metrics._finish(self)
+
+    def __repr__(self):
+        return f'RequestEvent({self.endpoint!r}, status_code={self.status_code}, attempts={self.attempts})'
+
+
+class Metrics:
+    """ Потокобезопасный сборщик метрик по эндпоинтам.
+
+    :param buckets: границы корзин гистограмм времени.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.latency = {}
+        self.network = {}
+        self.decode = {}
+        self.responses = {}
+        self.retries = {}
+        self.throttled = {}
+        self.errors = {}
+        self.in_flight = {}
+        self._before = []
+        self._after = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, before=None, after=None):
+        """ Добавить хуки: before(event) вызывается перед запросом, after(event) - после запроса со всеми повторами. """
+        if before is not None:
+            self._before.append(before)
+        if after is not None:
+            self._after.append(after)
+
+    def add_exporter(self, exporter):
+        """ Добавить экспортёр: объект с методами before_request(event) и after_request(event). """
+        self.add_hook(exporter.before_request, exporter.after_request)
+
+    def _histogram(self, histograms, name):
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = Histogram(self.buckets)
+        return histogram
+
+    def start(self, method, request_url) -> RequestEvent:
+        event = RequestEvent(self, method, request_url)
+        with self._lock:
+            self.in_flight[event.endpoint] = self.in_flight.get(event.endpoint, 0) + 1
+        for hook in self._before:
+            hook(event)
+        return event
+
+    def _finish(self, event):
+        name = event.endpoint
+        with self._lock:
+            self.in_flight[name] -= 1
+            self._histogram(self.latency, name).observe(event.duration)
+            self._histogram(self.network, name).observe(event.network)
+            for status_code in event.statuses:
+                key = (name, status_code)
+                self.responses[key] = self.responses.get(key, 0) + 1
+                if status_code == 423:
+                    self.throttled[name] = self.throttled.get(name, 0) + 1
+            if event.retries:
+                self.retries[name] = self.retries.get(name, 0) + event.retries
+            if event.error is not None:
+                self.errors[name] = self.errors.get(name, 0) + 1
+        for hook in self._after:
+            hook(event)
+
+    def observe_decode(self, method, request_url, seconds):
+        """ Время разбора JSON ответа. """
+        name = endpoint(method, request_url)
+        with self._lock:
+            self._histogram(self.decode, name).observe(seconds)
+
+    def snapshot(self) -> dict:
+        """ Метрики по эндпоинтам: {эндпоинт: {latency, network, decode, responses, retries, throttled, errors,
+        in_flight}}.
+        """
+        with self._lock:
+            names = set(self.latency) | set(self.in_flight) | set(self.decode)
+            return {name: {'latency': _as_dict(self.latency, name),
+                           'network': _as_dict(self.network, name),
+                           'decode': _as_dict(self.decode, name),
+                           'responses': {status: count for (endpoint_, status), count in self.responses.items()
+                                         if endpoint_ == name},
+                           'retries': self.retries.get(name, 0),
+                           'throttled': self.throttled.get(name, 0),
+                           'errors': self.errors.get(name, 0),
+                           'in_flight': self.in_flight.get(name, 0)}
+                    for name in sorted(names)}
+
+    def reset(self):
+        with self._lock:
+            for values in (self.latency, self.network, self.decode, self.responses, self.retries, self.throttled,
+                           self.errors):
+                values.clear()
+
+
+# Сборщик, в который пишут все запросы, или None, если метрики выключены
+active = None
+
+
+def enable(*exporters, metrics: Metrics = None) -> Metrics:
+    """ Включить сбор метрик.
+
+    :param exporters: экспортёры, например PrometheusExporter() или OpenTelemetryExporter().
+    :param metrics: свой сборщик. По умолчанию создаётся новый Metrics.
+    :return: включённый сборщик
+    """
+    global active
+    metrics = metrics or Metrics()
+    for exporter in exporters:
+        metrics.add_exporter(exporter)
+    active = metrics
+    return metrics
+
+
+def disable():
+    """ Выключить сбор метрик. """
+    global active
+    active = None
+
+
+def start(method, request_url):
+    """ Начать замер запроса. Возвращает RequestEvent или None, если метрики выключены. """
+    return None if active is None else active.start(method, request_url)
+
+
+class PrometheusExporter:
+    """ Экспорт метрик в prometheus_client. Требуется установленный prometheus_client.
+
+    :param registry: реестр prometheus_client. По умолчанию REGISTRY.
+    :param namespace: префикс имён метрик.
+    :param buckets: границы корзин гистограмм времени.
+    """
+
+    def __init__(self, registry=None, namespace: str = 'qiwipyapi', buckets=DEFAULT_BUCKETS):
+        from prometheus_client import REGISTRY, Counter, Gauge, Histogram as PrometheusHistogram
+
+        registry = registry or REGISTRY
+        labels = ('endpoint',)
+        self.duration = PrometheusHistogram('request_duration_seconds', 'Время запроса с повторами', labels,
+                                            namespace=namespace, buckets=buckets, registry=registry)
+        self.network = PrometheusHistogram('request_network_seconds', 'Время попыток запроса', labels,
+                                           namespace=namespace, buckets=buckets, registry=registry)
+        self.responses = Counter('responses', 'Ответы по кодам', labels + ('status',), namespace=namespace,
+                                 registry=registry)
+        self.retries = Counter('retries', 'Повторы запросов', labels, namespace=namespace, registry=registry)
+        self.throttled = Counter('throttled', 'Ответы 423', labels, namespace=namespace, registry=registry)
+        self.errors = Counter('errors', 'Запросы, завершившиеся исключением', labels, namespace=namespace,
+                              registry=registry)
+        self.in_flight = Gauge('in_flight', 'Запросы в работе', labels, namespace=namespace, registry=registry)
+
+    def before_request(self, event):
+        self.in_flight.labels(event.endpoint).inc()
+
+    def after_request(self, event):
+        name = event.endpoint
+        self.in_flight.labels(name).dec()
+        self.duration.labels(name).observe(event.duration)
+        self.network.labels(name).observe(event.network)
+        for status_code in event.statuses:
+            self.responses.labels(name, str(status_code)).inc()
+            if status_code == 423:
+                self.throttled.labels(name).inc()
+        if event.retries:
+            self.retries.labels(name).inc(event.retries)
+        if event.error is not None:
+            self.errors.labels(name).inc()
+
+
+class OpenTelemetryExporter:
+    """ Спаны OpenTelemetry для запросов к API. Требуется установленный opentelemetry-api.
+
+    :param tracer: трассировщик. По умолчанию trace.get_tracer('qiwipyapi').
+    """
+
+    def __init__(self, tracer=None):
+        from opentelemetry import trace
+
+        self._trace = trace
+        self.tracer = tracer or trace.get_tracer('qiwipyapi')
+
+    def before_request(self, event):
+        event.context['span'] = self.tracer.start_span(
+            event.endpoint, kind=self._trace.SpanKind.CLIENT,
+            attributes={'http.request.method': event.method, 'url.full': event.url.split('?', 1)[0]})
+
+    def after_request(self, event):
+        span = event.context.pop('span', None)
+        if span is None:
+            return
+        if event.status_code is not None:
+            span.set_attribute('http.response.status_code', event.status_code)
+        span.set_attribute('qiwipyapi.attempts', event.attempts)
+        span.set_attribute('qiwipyapi.network_seconds', event.network)
+        if event.error is not None:
+            span.record_exception(event.error)
+            span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, str(event.error)))
+        elif event.status_code is not None and event.status_code >= 400:
+            span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, f'HTTP {event.status_code}'))
+        span.end()
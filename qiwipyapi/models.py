@@ -1,91 +1,300 @@
-import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from . import codec
+from .utils import next_payment_id
+
+
+def _decimal(value):
+    return None if value is None else Decimal(str(value))
+
+
+def _money(value):
+    """ Сумма из объекта {'amount': 10, 'currency': 643} или {'value': '10.00', 'currency': 'RUB'}. """
+    if not value:
+        return None
+    return _decimal(value.get('amount', value.get('value')))
+
+
+def _datetime(value):
+    """ Дата из строки ISO 8601 или из Unix-time в миллисекундах. """
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value / 1000, timezone.utc)
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+class Model:
+    """ Базовый класс объектов API. Поля объекта перечислены в __slots__ подкласса и хранят значения
+    из JSON без преобразования, поэтому объект создаётся быстро и занимает мало памяти. Поля, которых нет
+    в __slots__, сохраняются в словаре _extra. Суммы (Decimal) и даты (datetime) вычисляются только
+    при обращении к соответствующим свойствам.
+
+    Объект поддерживает доступ как к словарю: obj['txnId'], obj.get('comment'), поэтому его можно передавать
+    туда, где ожидается ответ API.
+    """
+
+    __slots__ = ('_extra',)
+    # Ключи JSON, которые нельзя использовать как имя атрибута: {ключ JSON: атрибут}
+    _renamed = {}
+    _attributes = {}
+    _names = frozenset()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        keys = {attribute: key for key, attribute in cls._renamed.items()}
+        cls._attributes = {keys.get(slot, slot): slot for slot in cls.__dict__.get('__slots__', ())}
+        cls._names = frozenset(cls._attributes.values())
+
+    def __init__(self, **kwargs):
+        self._load(kwargs)
+
+    def _load(self, data):
+        attributes, extra = self._attributes, None
+        for key, value in data.items():
+            attribute = attributes.get(key)
+            if attribute is not None:
+                setattr(self, attribute, value)
+            elif extra is None:
+                extra = {key: value}
+            else:
+                extra[key] = value
+        self._extra = extra
+
+    @classmethod
+    def from_json(cls, data):
+        """ Объект из ответа API: словаря, строки или bytes JSON. """
+        if isinstance(data, (str, bytes, bytearray)):
+            data = codec.loads(data)
+        obj = cls.__new__(cls)
+        obj._load(data)
+        return obj
+
+    def to_json(self) -> dict:
+        """ Словарь с полями объекта в том виде, в котором они пришли в ответе API. """
+        data = {}
+        for key, attribute in self._attributes.items():
+            try:
+                data[key] = object.__getattribute__(self, attribute)
+            except AttributeError:
+                pass
+        if self._extra:
+            data.update(self._extra)
+        return data
+
+    def dumps(self) -> bytes:
+        """ JSON объекта в bytes. """
+        return codec.dumps(self.to_json())
+
+    def __getstate__(self):
+        return self.to_json()
+
+    def __setstate__(self, state):
+        self._load(state)
+
+    def __getattr__(self, name):
+        # вызывается только для незаполненных полей и полей, которых нет в __slots__
+        if not name.startswith('_'):
+            if self._extra and name in self._extra:
+                return self._extra[name]
+            if name in self._names:
+                return None
+        raise AttributeError(f'{type(self).__name__!r} object has no attribute {name!r}')
+
+    def __getitem__(self, key):
+        attribute = self._attributes.get(key)
+        if attribute is not None:
+            try:
+                return object.__getattribute__(self, attribute)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.to_json() == other.to_json()
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.to_json()!r})'
+
+    def __str__(self):
+        return str(self.to_json())
 
 
 # https://developer.qiwi.com/ru/qiwi-wallet-personal/index.html#payments_model
-class Payment:
+class Payment(Model):
     """
     Объект, описывающий данные для платежа на провайдера в QIWI Кошельке.
     """
 
+    __slots__ = ('id', 'sum', 'paymentMethod', 'fields', 'comment')
+
     def __init__(self, amount=None, **kwargs):
-        # TODO set to default .get('', default=None)
-        self.id = kwargs.get('id') or str(int(time.time() * 1000))  # max 19 len int
-        self.sum = kwargs.get('sum') or {'amount': amount, 'currency': '643'}
-        self.paymentMethod = {"type": "Account", "accountId": "643"}
-        self.fields = kwargs.get('fields')  # Optional
-        self.comment = kwargs.get('comment')  # Optional
-        self.__dict__.update(kwargs)
+        kwargs['id'] = kwargs.get('id') or next_payment_id()  # max 19 len int
+        kwargs['sum'] = kwargs.get('sum') or {'amount': amount, 'currency': '643'}
+        kwargs.setdefault('paymentMethod', {'type': 'Account', 'accountId': '643'})
+        super().__init__(**kwargs)
 
-    def __repr__(self):
-        return self.__dict__
+    @property
+    def amount(self):
+        return _money(self.sum)
 
-    def __str__(self):
-        return str(self.__dict__)
 
-    def to_json(self):
-        return self.__dict__
+class PaymentInfo(Model):
+    """
+    Объект, описывающий данные платежной транзакции в QIWI Кошельке. Возвращается в ответ на запросы к платежному API.
+    """
+
+    __slots__ = ('id', 'terms', 'fields', 'sum', 'source', 'comment', 'transaction', 'state')
+
+    @property
+    def amount(self):
+        return _money(self.sum)
+
+    @property
+    def transaction_id(self):
+        return (self.transaction or {}).get('id')
+
+    @property
+    def state_code(self):
+        """ Состояние транзакции: Accepted - платёж принят к проведению. """
+        return ((self.transaction or {}).get('state') or {}).get('code')
 
 
-class PaymentInfo:
+class Transaction(Model):
     """
-    Объект, описывающий данные платежной транзакции в QIWI Кошельке. Возвращается в ответ на запросы к платежному API.
+    Объект, описывающий транзакцию из истории платежей QIWI Кошелька и уведомлений веб-хука.
+    https://developer.qiwi.com/ru/qiwi-wallet-personal/index.html#payments_history
     """
-    def __init__(self, amount=None, **kwargs):
-        # TODO set to default .get('', default=None)
-        self.id = kwargs.get('id')
-        self.terms = kwargs.get('terms')
-        self.fields = kwargs.get('fields')
-        self.sum = kwargs.get('sum')
-        self.source = kwargs.get('source')
-        self.comment = kwargs.get('comment')
-        self.transaction = kwargs.get('transaction')
-        # self.transaction.id = kwargs.get('')
-        # self.transaction.state = kwargs.get('')
-        self.state = kwargs.get('state')
-        # self.state.code = kwargs.get('state')
-        self.__dict__.update(kwargs)
 
-    def __repr__(self):
-        return self.__dict__
+    __slots__ = ('txnId', 'personId', 'date', 'errorCode', 'error', 'status', 'type', 'statusText', 'trmTxnId',
+                 'account', 'sum', 'commission', 'total', 'provider', 'source', 'comment', 'currencyRate',
+                 'paymentExtras', 'serviceExtras', 'features', 'view', 'signFields')
 
-    def __str__(self):
-        return str(self.__dict__)
-
-    def to_json(self):
-        return self.__dict__
-
-
-class Transaction:
-    pass
-
-
-# class Invoice:
-#     def __init__(self, *args, **kwargs):
-#         self.__dict__.update(kwargs)
-#     # x = {'siteId': 'w0drif-00',
-#     #      'billId': '6ea4405a-ef62-11ea-a84e-4b5ddf829e3f',
-#     #      'amount': {'currency': 'RUB', 'value': '10.00'},
-#     #      'status': {'value': 'WAITING', 'changedDateTime': '2020-09-05T13:27:43.141+03:00'},
-#     #      'creationDateTime': '2020-09-05T13:27:43.141+03:00',
-#     #      'expirationDateTime': '2020-09-05T17:09:43+03:00',
-#     #      'payUrl': 'https://oplata.qiwi.com/form/?invoice_uid=76b407cf-aaca-467d-a1cd-545f56383dab'}
-#     # pass
-#     # При выставление счёта в ответе приходит payUrl к ссылке можно добавить параметры:
-#     # https://developer.qiwi.com/ru/p2p-payments/  # option
-#     # paySource
-#     # allowedPaySources
-#     # successUrl
-#     # lifetime
-#
-#     def __repr__(self):
-#         return self.__dict__.get('payUrl')
-#
-#     def to_json(self):
-#         return self.__dict__
-
-
-class Balance:
-    pass
+    @property
+    def amount(self):
+        return _money(self.sum)
+
+    @property
+    def currency(self):
+        return (self.sum or {}).get('currency')
+
+    @property
+    def commission_amount(self):
+        return _money(self.commission)
+
+    @property
+    def total_amount(self):
+        return _money(self.total)
+
+    @property
+    def date_time(self):
+        return _datetime(self.date)
+
+
+class Invoice(Model):
+    """
+    Объект, описывающий счёт P2P. Возвращается при выставлении и проверке счёта и приходит в уведомлениях об оплате.
+    https://developer.qiwi.com/ru/p2p-payments/#invoice-status
+    """
+    # При выставление счёта в ответе приходит payUrl к ссылке можно добавить параметры:
+    # https://developer.qiwi.com/ru/p2p-payments/  # option
+    # paySource
+    # allowedPaySources
+    # successUrl
+    # lifetime
+
+    __slots__ = ('siteId', 'billId', 'amount', 'status', 'customer', 'customFields', 'comment', 'creationDateTime',
+                 'expirationDateTime', 'payUrl')
+
+    @property
+    def value(self):
+        """ Сумма счёта. """
+        return _money(self.amount)
+
+    @property
+    def currency(self):
+        return (self.amount or {}).get('currency')
+
+    @property
+    def status_value(self):
+        """ Статус счёта: WAITING, PAID, REJECTED, EXPIRED. """
+        return (self.status or {}).get('value')
+
+    @property
+    def creation_date_time(self):
+        return _datetime(self.creationDateTime)
+
+    @property
+    def expiration_date_time(self):
+        return _datetime(self.expirationDateTime)
+
+
+class Bill(Model):
+    """
+    Объект, описывающий выставленный на кошелёк счёт из списка счетов.
+    https://developer.qiwi.com/ru/qiwi-wallet-personal/index.html#list_invoice
+    """
+
+    __slots__ = ('id', 'externalId', 'creationDatetime', 'expirationDatetime', 'sum', 'status', 'type',
+                 'repetitive', 'provider', 'comment', 'payUrl')
+
+    @property
+    def amount(self):
+        return _money(self.sum)
+
+    @property
+    def creation_date_time(self):
+        return _datetime(self.creationDatetime)
+
+    @property
+    def expiration_date_time(self):
+        return _datetime(self.expirationDatetime)
+
+
+class Balance(Model):
+    """
+    Объект, описывающий счёт QIWI Кошелька и его баланс.
+    https://developer.qiwi.com/ru/qiwi-wallet-personal/index.html#balances_list
+    """
+
+    __slots__ = ('alias', 'fsAlias', 'bankAlias', 'title', 'type', 'hasBalance', 'balance', 'currency',
+                 'defaultAccount')
+
+    @property
+    def amount(self):
+        return _money(self.balance)
+
+
+class CrossRate(Model):
+    """
+    Объект, описывающий курс обмена валюты from на валюту to.
+    https://developer.qiwi.com/ru/qiwi-wallet-personal/index.html#exchange
+    """
+
+    __slots__ = ('from_', 'to', 'rate')
+    _renamed = {'from': 'from_'}
+
+    @property
+    def decimal_rate(self):
+        return _decimal(self.rate)
 
 # response payment_to_card
 # p = {'id': '11111111', 'terms': '1963', 'fields': {'account': '4276550078757633'},
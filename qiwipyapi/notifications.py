@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Приём уведомлений QIWI: проверка подписи, защита от повторной доставки и передача обработчикам.
+Обработчики уведомлений можно подключить как WSGI- или ASGI-приложение.
+"""
+
+import abc
+import asyncio
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from http import HTTPStatus
+
+from .models import Invoice, Transaction
+
+logger = logging.getLogger('qiwipyapi')
+
+_OK = b'{"error": "0"}'
+
+
+class NotificationHandler(abc.ABC):
+    """ Базовый обработчик уведомлений. Проверяет подпись, отбрасывает повторные доставки
+    и передаёт уведомление callback в пуле из workers потоков, не задерживая ответ QIWI.
+    Асинхронный callback в ASGI-приложении запускается задачей в цикле событий.
+
+    :param callback: функция, которая получает разобранное уведомление.
+    :param workers: число потоков для вызова callback.
+    :param dedupe_size: сколько последних уведомлений помнить для защиты от повторной доставки.
+    """
+
+    def __init__(self, callback, workers: int = 4, dedupe_size: int = 10000):
+        self.callback = callback
+        self.dedupe_size = dedupe_size
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+        self._tasks = set()  # задачи асинхронного callback, ссылки держатся до завершения
+
+    def loads(self, body: bytes):
+        return json.loads(body)
+
+    @abc.abstractmethod
+    def verify(self, payload: dict, headers: dict) -> bool:
+        """ Проверить подпись уведомления. """
+
+    @abc.abstractmethod
+    def parse(self, payload: dict):
+        """ Уведомление для callback. """
+
+    @abc.abstractmethod
+    def dedupe_key(self, payload: dict):
+        """ Ключ, по которому распознаётся повторная доставка уведомления. """
+
+    def _is_duplicate(self, key) -> bool:
+        with self._lock:
+            if key in self._seen:
+                self._seen.move_to_end(key)
+                return True
+            self._seen[key] = None
+            if len(self._seen) > self.dedupe_size:
+                self._seen.popitem(last=False)
+            return False
+
+    def _call(self, notification):
+        try:
+            self.callback(notification)
+        except Exception:
+            logger.exception('Notification callback failed')
+
+    async def _acall(self, notification):
+        try:
+            await self.callback(notification)
+        except Exception:
+            logger.exception('Notification callback failed')
+
+    def handle(self, body: bytes, headers: dict):
+        """ Обработать тело запроса уведомления.
+
+        :param body: тело запроса.
+        :param headers: заголовки запроса, имена в нижнем регистре.
+        :return: (HTTP-код ответа, уведомление или None, если его не нужно передавать обработчику)
+        """
+        try:
+            payload = self.loads(body)
+        except ValueError:
+            return 400, None
+        if not isinstance(payload, dict) or not self.verify(payload, headers):
+            return 403, None
+        if self._is_duplicate(self.dedupe_key(payload)):
+            return 200, None
+        return 200, self.parse(payload)
+
+    def wsgi(self, environ, start_response):
+        """ WSGI-приложение для приёма уведомлений. """
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        body = environ['wsgi.input'].read(length) if length else b''
+        headers = {key[5:].replace('_', '-').lower(): value for key, value in environ.items()
+                   if key.startswith('HTTP_')}
+        status, notification = self.handle(body, headers)
+        if notification is not None:
+            self._executor.submit(self._call, notification)
+        start_response(f'{status} {HTTPStatus(status).phrase}', [('Content-Type', 'application/json')])
+        return [_OK if status == 200 else b'']
+
+    __call__ = wsgi
+
+    async def asgi(self, scope, receive, send):
+        """ ASGI-приложение для приёма уведомлений. """
+        if scope['type'] != 'http':
+            return
+        chunks, more_body = [], True
+        while more_body:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        headers = {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope['headers']}
+        status, notification = self.handle(b''.join(chunks), headers)
+        if notification is not None:
+            if asyncio.iscoroutinefunction(self.callback):
+                task = asyncio.ensure_future(self._acall(notification))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            else:
+                self._executor.submit(self._call, notification)
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': _OK if status == 200 else b''})
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+class P2PNotificationHandler(NotificationHandler):
+    """ Обработчик уведомлений об изменении статуса счёта QIWI P2P.
+    https://developer.qiwi.com/ru/p2p-payments/#notification
+
+    Подпись из заголовка X-Api-Signature-SHA256 сверяется с HMAC-SHA256 строки
+    amount.currency|amount.value|billId|siteId|status.value на секретном ключе P2P.
+    Callback получает объект Invoice.
+
+    :param secret_key: секретный ключ P2P.
+    """
+
+    def __init__(self, secret_key: str, callback, **kwargs):
+        super().__init__(callback, **kwargs)
+        self._secret_key = secret_key.encode()
+
+    def verify(self, payload, headers) -> bool:
+        signature = headers.get('x-api-signature-sha256')
+        bill = payload.get('bill')
+        if not signature or not isinstance(bill, dict):
+            return False
+        try:
+            message = '|'.join((bill['amount']['currency'], bill['amount']['value'], bill['billId'], bill['siteId'],
+                                bill['status']['value']))
+        except (KeyError, TypeError):
+            return False
+        expected = hmac.new(self._secret_key, message.encode(), hashlib.sha256).hexdigest()
+        # подпись сравнивается в bytes: compare_digest не принимает строки с символами не из ASCII
+        return hmac.compare_digest(expected.encode(), signature.encode())
+
+    def dedupe_key(self, payload):
+        bill = payload['bill']
+        return bill['billId'], bill['status']['value']
+
+    def parse(self, payload) -> Invoice:
+        return Invoice(**payload['bill'])
+
+
+class WalletHookHandler(NotificationHandler):
+    """ Обработчик уведомлений веб-хука QIWI Кошелька о входящих и исходящих платежах.
+    https://developer.qiwi.com/ru/qiwi-wallet-personal/index.html#hook
+
+    Поле hash уведомления сверяется с HMAC-SHA256 значений полей payment.signFields, объединённых через |.
+    Ключ подписи выдаёт метод QIWIWallet.hook_secret в кодировке base64. Callback получает объект Transaction,
+    тестовые уведомления (QIWIWallet.test_hook) тоже передаются, у них payload test=True.
+
+    :param secret_key: ключ подписи веб-хука в base64.
+    """
+
+    def __init__(self, secret_key: str, callback, **kwargs):
+        super().__init__(callback, **kwargs)
+        try:
+            self._secret_key = base64.b64decode(secret_key, validate=True)
+        except (binascii.Error, ValueError):
+            raise ValueError('Ключ подписи веб-хука должен быть в base64, как его возвращает hook_secret') from None
+
+    def loads(self, body):
+        # суммы разбираются в Decimal, чтобы строка для подписи совпала с исходной записью числа
+        return json.loads(body, parse_float=Decimal)
+
+    @staticmethod
+    def _field(payment, path):
+        value = payment
+        for key in path.split('.'):
+            value = value[key]
+        return str(value)
+
+    def verify(self, payload, headers) -> bool:
+        signature = payload.get('hash')
+        payment = payload.get('payment')
+        if not isinstance(signature, str) or not isinstance(payment, dict):
+            return False
+        try:
+            message = '|'.join(self._field(payment, path) for path in payment['signFields'].split(','))
+        except (KeyError, TypeError, AttributeError):
+            return False
+        expected = hmac.new(self._secret_key, message.encode(), hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected.encode(), signature.encode())
+
+    def dedupe_key(self, payload):
+        return payload.get('messageId') or payload['payment'].get('txnId')
+
+    def parse(self, payload) -> Transaction:
+        return Transaction(test=payload.get('test', False), **payload['payment'])
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Журнал исходящих платежей для безопасных повторов после сбоев. """
+
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from . import codec
+from .errors import QiwiError
+from .models import Payment
+from .utils import next_payment_id
+
+logger = logging.getLogger('qiwipyapi')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS payouts (
+    id TEXT PRIMARY KEY,
+    provider_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL,
+    response TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS payouts_state ON payouts (state, created);
+"""
+
+
+def is_rejected(error) -> bool:
+    """ QIWI точно не провёл платёж: ответ 4xx, кроме 423 (запрос не обработан из-за лимита частоты). """
+    status_code = getattr(error, 'status_code', None)
+    return status_code is not None and 400 <= status_code < 500 and status_code != 423
+
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class PaymentOutbox:
+    """ Журнал платежей в SQLite (WAL, synchronous=FULL). Платёж записывается вместе со своим id до отправки,
+    поэтому после падения процесса известно, какие платежи могли уйти, и их можно проверить
+    по истории (trmTxnId) или отправить повторно с тем же id.
+
+    Платёж остаётся в состоянии pending, если ответ не получен (ошибка сети, 5xx): QIWI мог его провести.
+    Ответ 4xx означает отказ, такой платёж помечается failed и повторно не отправляется.
+
+    :param wallet: кошелёк QIWIWallet (AsyncQIWIWallet - только для asend).
+    :param path: путь к файлу журнала.
+    """
+
+    def __init__(self, wallet, path: str = 'payouts.db'):
+        self.wallet = wallet
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        if path != ':memory:':
+            self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=FULL')
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def record(self, provider_id, payment) -> dict:
+        """ Записать намерение платежа до отправки. Повторная запись платежа с тем же id ничего не меняет.
+
+        :param provider_id: Идентификатор провайдера.
+        :param payment: Payment или словарь с данными платежа.
+        :return: данные платежа с назначенным id
+        """
+        payload = payment.to_json() if isinstance(payment, Payment) else dict(payment)
+        payload['id'] = str(payload.get('id') or next_payment_id())
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute('INSERT OR IGNORE INTO payouts VALUES (?, ?, ?, ?, NULL, NULL, ?, ?)',
+                             (payload['id'], str(provider_id), codec.dumps(payload).decode(), PENDING, now, now))
+        return payload
+
+    def _set_state(self, payment_id, state, response=None, error=None):
+        with self._lock, self._db:
+            self._db.execute('UPDATE payouts SET state = ?, response = ?, error = ?, updated = ? WHERE id = ?',
+                             (state, None if response is None else codec.dumps(response).decode(),
+                              None if error is None else str(error), time.time(), str(payment_id)))
+
+    def mark_done(self, payment_id, response=None):
+        self._set_state(payment_id, DONE, response=response)
+
+    def mark_failed(self, payment_id, error=None):
+        self._set_state(payment_id, FAILED, error=error)
+
+    def state(self, payment_id):
+        """ Состояние платежа: pending, done, failed или None, если платежа нет в журнале. """
+        with self._lock:
+            row = self._db.execute('SELECT state FROM payouts WHERE id = ?', (str(payment_id),)).fetchone()
+        return row['state'] if row else None
+
+    def pending(self) -> list:
+        """ Платежи, результат которых неизвестен: (id, provider_id, payload, created). """
+        with self._lock:
+            rows = self._db.execute('SELECT id, provider_id, payload, created FROM payouts WHERE state = ? '
+                                    'ORDER BY created', (PENDING,)).fetchall()
+        return [(row['id'], row['provider_id'], codec.loads(row['payload']), row['created']) for row in rows]
+
+    def _deliver(self, provider_id, payload):
+        try:
+            response = self.wallet.send_payment(provider_id, payload)
+        except QiwiError as e:
+            if is_rejected(e):
+                self.mark_failed(payload['id'], e)
+            raise
+        self.mark_done(payload['id'], response)
+        return response
+
+    async def _adeliver(self, provider_id, payload):
+        try:
+            response = await self.wallet.send_payment(provider_id, payload)
+        except QiwiError as e:
+            if is_rejected(e):
+                self.mark_failed(payload['id'], e)
+            raise
+        self.mark_done(payload['id'], response)
+        return response
+
+    def send(self, provider_id, payment):
+        """ Записать платёж в журнал и отправить его.
+
+        :param provider_id: Идентификатор провайдера.
+        :param payment: Payment или словарь с данными платежа.
+        :return: PaymentInfo
+        """
+        return self._deliver(provider_id, self.record(provider_id, payment))
+
+    async def asend(self, provider_id, payment):
+        """ Вариант send() для асинхронного кошелька. """
+        return await self._adeliver(provider_id, self.record(provider_id, payment))
+
+    def recover(self, margin: timedelta = timedelta(hours=1)) -> dict:
+        """ Восстановление после сбоя. Незавершённые платежи ищутся в истории исходящих платежей
+        по trmTxnId (клиентский id платежа). Найденные помечаются done, ненайденные отправляются снова с тем же id.
+
+        :param margin: насколько раньше самого старого незавершённого платежа начинать поиск в истории.
+        :return: {id платежа: состояние после восстановления}
+        """
+        pending = self.pending()
+        if not pending:
+            return {}
+        ids = {payment_id for payment_id, _, _, _ in pending}
+        start = datetime.fromtimestamp(min(created for _, _, _, created in pending), timezone.utc) - margin
+        found = {}
+        for txn in self.wallet.backfill_payments(start, datetime.now(timezone.utc), window=timedelta(days=30),
+                                                 operation='OUT'):
+            trm_txn_id = str(txn.get('trmTxnId'))
+            if trm_txn_id in ids:
+                found[trm_txn_id] = txn
+        result = {}
+        for payment_id, provider_id, payload, _ in pending:
+            if payment_id in found:
+                self.mark_done(payment_id, found[payment_id])
+            else:
+                try:
+                    self._deliver(provider_id, payload)
+                except Exception as e:
+                    logger.warning('Payment %s recovery failed: %s', payment_id, e)
+            result[payment_id] = self.state(payment_id)
+        return result
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Лёгкий клиент QIWI P2P API для выставления, проверки и отмены счетов. Модуль не импортирует requests,
+aiohttp и Wallet API: запросы отправляются через http.client стандартной библиотеки с keep-alive,
+поэтому импорт быстрый, что важно для короткоживущих процессов (serverless-функций).
+
+    from qiwipyapi.p2p import P2PClient
+
+    client = P2PClient(p2p_sec_key)
+    invoice = client.create_invoice(100, bill_id='order-1')
+"""
+
+import threading
+import uuid
+from datetime import datetime, timedelta
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
+from urllib.parse import urlencode, urlsplit
+
+from . import codec, metrics
+from .models import Invoice
+from .ratelimit import default_rate_limiter
+from .response import response
+from .retry import default_retry_policy
+from .transport import Response
+
+BILLS_URL = 'https://api.qiwi.com/partner/bill/v1/bills'
+
+
+def bill_url(bill_id=None) -> str:
+    """ URL счёта. Без bill_id создаётся новый идентификатор счёта. """
+    return f'{BILLS_URL}/{bill_id if bill_id else uuid.uuid1()}'
+
+
+def invoice_data(value, expirationDateTime=None, **kwargs) -> dict:
+    """ Тело запроса выставления счёта.
+
+    :param value: сумма счёта.
+    :param expirationDateTime: срок оплаты, datetime или строка ISO 8601. По умолчанию через час.
+    :param kwargs: дополнительные параметры счёта: comment, customer, customFields.
+    """
+    if expirationDateTime is None:
+        expirationDateTime = datetime.now().astimezone() + timedelta(hours=1)
+    if isinstance(expirationDateTime, datetime):
+        expirationDateTime = expirationDateTime.astimezone().isoformat(timespec='seconds')
+    json_data = {'amount': {'value': value, 'currency': 'RUB'}, 'expirationDateTime': expirationDateTime}
+    json_data.update(kwargs)
+    return json_data
+
+
+class HTTPPool:
+    """ Соединения http.client с keep-alive: по одному соединению с хостом на поток.
+
+    :param timeout: таймаут запроса в секундах.
+    """
+
+    exceptions = (OSError, HTTPException)
+
+    def __init__(self, timeout: float = 30):
+        self._timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self, scheme, netloc):
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        connection = connections.get((scheme, netloc))
+        if connection is None:
+            connection_class = HTTPSConnection if scheme == 'https' else HTTPConnection
+            connection = connections[(scheme, netloc)] = connection_class(netloc, timeout=self._timeout)
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def send(self, method, request_url, **kwargs):
+        url = urlsplit(request_url)
+        path = url.path + (f'?{url.query}' if url.query else '')
+        params = {key: value for key, value in (kwargs.get('params') or {}).items() if value is not None}
+        if params:
+            path += ('&' if url.query else '?') + urlencode(params)
+        connection = self._connection(url.scheme, url.netloc)
+        try:
+            connection.request(method.upper(), path, body=kwargs.get('data'), headers=kwargs.get('headers') or {})
+            resp = connection.getresponse()
+            content = resp.read()
+        except self.exceptions:
+            connection.close()  # соединение откроется заново при следующем запросе
+            raise
+        return Response(resp.status, content, resp.headers, request_url, method.upper())
+
+    def close(self):
+        """ Закрыть все соединения пула. """
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
+
+
+class P2PClient:
+    """ Клиент QIWI P2P API: счета. Методы совпадают с P2PWallet.
+
+    :param token: секретный ключ P2P.
+    :param pool: пул соединений HTTPPool. По умолчанию у клиента свой пул.
+    :param transport: транспорт запросов (см. qiwipyapi.transport). Синоним pool.
+    :param retry_policy: политика повтора запросов RetryPolicy. По умолчанию default_retry_policy.
+    :param rate_limiter: ограничитель частоты запросов RateLimiter. По умолчанию default_rate_limiter.
+    :param models: возвращать объекты Invoice вместо словарей.
+    """
+
+    def __init__(self, token, pool=None, retry_policy=None, rate_limiter=None, models: bool = False, transport=None):
+        self._TOKEN = token
+        self._HEADERS = {'Accept': 'application/json',
+                         'Content-Type': 'application/json',
+                         'Authorization': f'Bearer {self._TOKEN}'}
+        self._pool = transport or pool or HTTPPool()
+        self._retry_policy = retry_policy or default_retry_policy
+        self._rate_limiter = rate_limiter or default_rate_limiter
+        self._models = models
+
+    def _request(self, method, request_url, json_data=None):
+        kwargs = {'headers': self._HEADERS}
+        if json_data is not None:
+            kwargs['data'] = codec.dumps(json_data)
+        event = metrics.start(method, request_url)
+
+        def send():
+            bucket = self._rate_limiter.acquire(request_url, self._HEADERS)
+            if event is None:
+                r = self._pool.send(method, request_url, **kwargs)
+            else:
+                r = event.send(self._pool.send, method, request_url, **kwargs)
+            bucket.feedback(r.status_code)
+            return r
+
+        try:
+            r = self._retry_policy.call(send, method, request_url, exceptions=getattr(self._pool, 'exceptions', ()))
+        except BaseException as e:
+            if event is not None:
+                event.finish(e)
+            raise
+        if event is not None:
+            event.finish()
+        r = response(r)
+        return Invoice.from_json(r) if self._models else r
+
+    def create_invoice(self, value, bill_id=None, expirationDateTime=None, **kwargs):
+        """ Выставить новый счёт, см. P2PWallet.create_invoice. """
+        return self._request('put', bill_url(bill_id), invoice_data(value, expirationDateTime, **kwargs))
+
+    def invoice_status(self, bill_id):
+        """ Проверка счёта, см. P2PWallet.invoice_status. """
+        return self._request('get', f'{BILLS_URL}/{bill_id}')
+
+    def cancel_invoice(self, bill_id):
+        """ Отмена счёта, см. P2PWallet.cancel_invoice. """
+        return self._request('post', f'{BILLS_URL}/{bill_id}/reject')
+
+    def notification_handler(self, callback, **kwargs):
+        """ Обработчик уведомлений об оплате счетов, см. P2PWallet.notification_handler. """
+        from .notifications import P2PNotificationHandler
+
+        return P2PNotificationHandler(self._TOKEN, callback, **kwargs)
+
+    def close(self):
+        """ Закрыть соединения пула клиента. """
+        self._pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Массовые выплаты на карты, QIWI кошельки и телефоны. """
+
+import asyncio
+import json
+import logging
+import re
+import time
+from collections import namedtuple
+from decimal import Decimal
+
+from .errors import ProviderNotFoundError, QiwiError, QiwiServerError
+from .models import Payment
+from .outbox import is_rejected
+from .utils import abounded_map, bounded_map
+
+logger = logging.getLogger('qiwipyapi')
+
+CARD = 'card'
+WALLET = 'wallet'
+MOBILE = 'mobile'
+
+WALLET_PROVIDER_ID = '99'
+
+PayoutOrder = namedtuple('PayoutOrder', ['kind', 'account', 'amount', 'provider_id', 'id', 'comment'],
+                         defaults=(None, None, None))
+PayoutOrder.__doc__ = """ Заявка на выплату.
+
+kind - card, wallet или mobile;
+account - номер карты, кошелька или телефона (без префикса 8);
+amount - сумма в рублях;
+provider_id - идентификатор провайдера, если уже известен;
+id - идентификатор платежа, если нужен свой (повтор заявки с тем же id не создаёт второй платёж);
+comment - комментарий к платежу.
+"""
+
+PayoutResult = namedtuple('PayoutResult', ['order', 'payment_id', 'payment', 'commission', 'error', 'failure'])
+PayoutResult.__doc__ = """ Результат выплаты: payment - PaymentInfo при успехе, error и failure - ошибка и её класс. """
+
+# Коды ошибок платежей QIWI (errorCode и code вида QWPRC-220), см. errors.py
+FAILURE_CODES = {'technical': (3, 8),
+                 'bad_account': (4, 5),
+                 'insufficient_funds': (220,),
+                 'limit_exceeded': (241, 242, 705, 746, 852, 1050),
+                 'bad_card': (522, 547, 548),
+                 'rejected': (131, 202, 319, 500, 561, 702, 893)}
+_FAILURES = {code: failure for failure, codes in FAILURE_CODES.items() for code in codes}
+
+# Ошибки, после которых платёж точно не проведён и его можно отправить ещё раз с тем же id. После ошибок server
+# и network результат неизвестен: такой платёж не повторяется, его проверяет PaymentOutbox.recover() по trmTxnId
+RETRYABLE_FAILURES = ('technical', 'throttled')
+
+
+def _error_code(error):
+    for arg in getattr(error, 'args', ()):
+        if not isinstance(arg, str):
+            continue
+        try:
+            body = json.loads(arg)
+        except ValueError:
+            continue
+        if isinstance(body, dict):
+            code = body.get('errorCode') or body.get('code')
+            match = re.search(r'(\d+)$', str(code or ''))
+            if match:
+                return int(match.group(1))
+    return None
+
+
+def classify(error) -> str:
+    """ Класс ошибки выплаты: insufficient_funds, limit_exceeded, bad_card, bad_account, rejected, technical,
+    throttled, server, network или unknown.
+    """
+    if isinstance(error, QiwiServerError):
+        return 'server'
+    if isinstance(error, ProviderNotFoundError):
+        return 'bad_account'
+    if isinstance(error, QiwiError):
+        failure = _FAILURES.get(_error_code(error))
+        if failure:
+            return failure
+        if error.status_code == 423:
+            return 'throttled'
+        if error.status_code is not None and error.status_code >= 500:
+            return 'server'
+        return 'rejected' if is_rejected(error) else 'unknown'
+    # requests.RequestException наследует OSError, ошибки aiohttp проверяются по модулю, чтобы не импортировать его
+    if isinstance(error, (OSError, asyncio.TimeoutError)) or type(error).__module__.startswith('aiohttp'):
+        return 'network'
+    return 'unknown'
+
+
+class PayoutEngine:
+    """ Выплаты из потока заявок PayoutOrder. Для каждой заявки определяется провайдер (карта - по номеру карты,
+    телефон - по номеру телефона), при quote=True запрашивается комиссия, затем платёж отправляется.
+    Заявки выполняются в concurrency потоках (или задачах для асинхронного кошелька), частоту платежей
+    ограничивает RateLimiter кошелька. Ошибки классифицируются, с тем же id платежа повторяются только ошибки,
+    после которых платёж точно не проведён (RETRYABLE_FAILURES). После ошибок server и network QIWI мог
+    провести платёж, поэтому он не отправляется снова: с outbox платёж остаётся в журнале в состоянии pending,
+    и PaymentOutbox.recover() проверяет его по истории (trmTxnId), прежде чем отправить ещё раз.
+
+    :param wallet: кошелёк QIWIWallet или AsyncQIWIWallet.
+    :param concurrency: число одновременно выполняемых заявок.
+    :param quote: запрашивать комиссию перед платежом.
+    :param outbox: PaymentOutbox для записи платежей в журнал до отправки.
+    :param resolver: объект с методами card_provider(card_number) и mobile_provider(phone) для определения
+    провайдера без запросов к API. По умолчанию провайдер определяется через API кошелька.
+    :param retries: сколько раз повторять платёж после повторяемой ошибки.
+    :param retry_delay: задержка перед первым повтором в секундах, дальше удваивается.
+    """
+
+    def __init__(self, wallet, concurrency: int = 4, quote: bool = False, outbox=None, resolver=None,
+                 retries: int = 2, retry_delay: float = 1):
+        self.wallet = wallet
+        self.concurrency = concurrency
+        self.quote = quote
+        self.outbox = outbox
+        self.resolver = resolver or wallet
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+    def _resolver_method(self, kind):
+        if kind == CARD:
+            return getattr(self.resolver, 'card_provider', None) or self.resolver.search_provider_for_card
+        return getattr(self.resolver, 'mobile_provider', None) or self.resolver.search_mobile_provider
+
+    @staticmethod
+    def _payment(order):
+        kwargs = {'id': str(order.id)} if order.id else {}
+        return Payment(amount=float(Decimal(str(order.amount))), fields={'account': order.account},
+                       comment=order.comment, **kwargs).to_json()
+
+    def _send(self, provider_id, payment):
+        if self.outbox is not None:
+            return self.outbox.send(provider_id, payment)
+        return self.wallet.send_payment(provider_id, payment)
+
+    def _execute(self, order) -> PayoutResult:
+        payment_id, commission = None, None
+        try:
+            provider_id = order.provider_id or (WALLET_PROVIDER_ID if order.kind == WALLET
+                                                else self._resolver_method(order.kind)(order.account))
+            if self.quote:
+                commission = self.wallet.get_commission(provider_id, order.amount, account=order.account)
+            payment = self._payment(order)
+            payment_id = payment['id']
+            for attempt in range(self.retries + 1):
+                try:
+                    return PayoutResult(order, payment_id, self._send(provider_id, payment), commission, None, None)
+                except Exception as e:
+                    if attempt == self.retries or classify(e) not in RETRYABLE_FAILURES:
+                        raise
+                    logger.warning('Payout %s failed: %s, retrying', payment_id, e)
+                    time.sleep(self.retry_delay * 2 ** attempt)
+        except Exception as e:
+            return PayoutResult(order, payment_id, None, commission, e, classify(e))
+
+    async def _aexecute(self, order) -> PayoutResult:
+        payment_id, commission = None, None
+        try:
+            provider_id = order.provider_id or (WALLET_PROVIDER_ID if order.kind == WALLET
+                                                else await self._aresolve(order))
+            if self.quote:
+                commission = await self.wallet.get_commission(provider_id, order.amount, account=order.account)
+            payment = self._payment(order)
+            payment_id = payment['id']
+            for attempt in range(self.retries + 1):
+                try:
+                    return PayoutResult(order, payment_id, await self._asend(provider_id, payment), commission,
+                                        None, None)
+                except Exception as e:
+                    if attempt == self.retries or classify(e) not in RETRYABLE_FAILURES:
+                        raise
+                    logger.warning('Payout %s failed: %s, retrying', payment_id, e)
+                    await asyncio.sleep(self.retry_delay * 2 ** attempt)
+        except Exception as e:
+            return PayoutResult(order, payment_id, None, commission, e, classify(e))
+
+    async def _aresolve(self, order):
+        provider_id = self._resolver_method(order.kind)(order.account)
+        return await provider_id if asyncio.iscoroutine(provider_id) else provider_id
+
+    async def _asend(self, provider_id, payment):
+        if self.outbox is not None:
+            return await self.outbox.asend(provider_id, payment)
+        return await self.wallet.send_payment(provider_id, payment)
+
+    def run(self, orders):
+        """ Выполнить заявки.
+
+        :param orders: итерируемый объект PayoutOrder, читается по мере выполнения заявок.
+        :return: генератор PayoutResult в порядке завершения выплат
+        """
+        for _, result, _ in bounded_map(self._execute, orders, self.concurrency):
+            yield result
+
+    async def arun(self, orders):
+        """ Асинхронный вариант run для асинхронного кошелька. """
+        async for _, result, _ in abounded_map(self._aexecute, orders, self.concurrency):
+            yield result
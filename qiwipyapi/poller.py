@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Опрос статусов счетов P2P с учётом срока действия счёта. """
+
+import asyncio
+import heapq
+import inspect
+import itertools
+import logging
+import threading
+import time
+from datetime import datetime
+
+from .utils import abounded_map, bounded_map
+
+logger = logging.getLogger('qiwipyapi')
+
+TERMINAL_STATUSES = ('PAID', 'REJECTED', 'EXPIRED')
+
+
+def _timestamp(date):
+    if date is None or isinstance(date, (int, float)):
+        return date
+    if isinstance(date, str):
+        date = datetime.fromisoformat(date)
+    return (date if date.tzinfo else date.astimezone()).timestamp()
+
+
+class _PolledBill:
+    __slots__ = ('bill_id', 'status', 'interval', 'expiration', 'seq')
+
+    def __init__(self, bill_id, status, interval, expiration):
+        self.bill_id = bill_id
+        self.status = status
+        self.interval = interval
+        self.expiration = expiration
+        self.seq = None
+
+
+class InvoicePoller:
+    """ Планировщик проверки статусов счетов. Счета лежат в очереди с приоритетом по времени следующей проверки.
+    Если статус счёта не меняется, интервал проверки растёт до max_interval, а за near_expiration секунд
+    до expirationDateTime счёт проверяется каждые min_interval секунд. Счета в конечном статусе
+    (PAID, REJECTED, EXPIRED) из очереди удаляются.
+
+    :param wallet: кошелёк P2PWallet или AsyncP2PWallet.
+    :param on_change: функция on_change(bill_id, old_status, new_status, bill), вызывается при смене статуса.
+    Для асинхронного кошелька может быть корутиной.
+    :param concurrency: число одновременных запросов статуса.
+    :param min_interval: минимальный интервал между проверками одного счёта в секундах.
+    :param max_interval: максимальный интервал между проверками одного счёта в секундах.
+    :param backoff: множитель интервала, если статус не изменился.
+    :param near_expiration: за сколько секунд до истечения счёта проверять его с минимальным интервалом.
+    """
+
+    def __init__(self, wallet, on_change=None, concurrency: int = 4, min_interval: float = 5,
+                 max_interval: float = 300, backoff: float = 2, near_expiration: float = 60):
+        self.wallet = wallet
+        self.on_change = on_change
+        self.concurrency = concurrency
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.near_expiration = near_expiration
+        self._bills = {}
+        self._queue = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._bills)
+
+    def add(self, bill_id, expiration=None, status: str = None):
+        """ Добавить счёт в очередь.
+
+        :param bill_id: идентификатор счёта.
+        :param expiration: expirationDateTime счёта: строка ISO 8601, datetime или Unix-time.
+        :param status: известный статус счёта.
+        """
+        bill = _PolledBill(str(bill_id), status, self.min_interval, _timestamp(expiration))
+        with self._lock:
+            self._bills[bill.bill_id] = bill
+            self._schedule(bill, time.time(), delay=0)
+
+    def add_invoice(self, invoice):
+        """ Добавить счёт из ответа create_invoice или invoice_status. """
+        self.add(invoice['billId'], invoice.get('expirationDateTime'), (invoice.get('status') or {}).get('value'))
+
+    def remove(self, bill_id):
+        with self._lock:
+            self._bills.pop(str(bill_id), None)
+
+    def _schedule(self, bill, now, delay=None):
+        delay = bill.interval if delay is None else delay
+        if bill.expiration is not None:
+            remaining = bill.expiration - now
+            if remaining <= self.near_expiration:
+                delay = min(delay, self.min_interval)
+            else:
+                delay = min(delay, remaining - self.near_expiration)
+        bill.seq = next(self._seq)
+        heapq.heappush(self._queue, (now + delay, bill.seq, bill))
+
+    def _is_current(self, seq, bill):
+        """ Запись очереди устарела, если счёт перепланирован или удалён. """
+        return bill.seq == seq and self._bills.get(bill.bill_id) is bill
+
+    def next_check(self):
+        """ Время ближайшей проверки (Unix-time) или None, если очередь пуста. """
+        with self._lock:
+            while self._queue and not self._is_current(*self._queue[0][1:]):
+                heapq.heappop(self._queue)
+            return self._queue[0][0] if self._queue else None
+
+    def _due(self, now):
+        due = []
+        with self._lock:
+            while self._queue and self._queue[0][0] <= now:
+                _, seq, bill = heapq.heappop(self._queue)
+                if self._is_current(seq, bill):
+                    due.append(bill)
+        return due
+
+    def _update(self, bill, result, error):
+        """ Обновить счёт по ответу и вернуть аргументы для on_change или None. """
+        change = None
+        with self._lock:
+            if error is not None:
+                logger.warning('invoice_status %s failed: %s', bill.bill_id, error)
+            else:
+                status = result['status']['value']
+                if status != bill.status:
+                    change = (bill.bill_id, bill.status, status, result)
+                    bill.status = status
+                    bill.interval = self.min_interval
+                else:
+                    bill.interval = min(self.max_interval, bill.interval * self.backoff)
+            if bill.status in TERMINAL_STATUSES:
+                self._bills.pop(bill.bill_id, None)
+            elif self._bills.get(bill.bill_id) is bill:
+                self._schedule(bill, time.time())
+        return change
+
+    def poll_once(self) -> int:
+        """ Проверить все счета, время проверки которых наступило.
+
+        :return: число проверенных счетов
+        """
+        due = self._due(time.time())
+        for bill, result, error in bounded_map(lambda bill: self.wallet.invoice_status(bill.bill_id), due,
+                                               self.concurrency):
+            change = self._update(bill, result, error)
+            if change and self.on_change:
+                self.on_change(*change)
+        return len(due)
+
+    async def apoll_once(self) -> int:
+        """ Асинхронный вариант poll_once для асинхронного кошелька. """
+        due = self._due(time.time())
+        async for bill, result, error in abounded_map(lambda bill: self.wallet.invoice_status(bill.bill_id), due,
+                                                      self.concurrency):
+            change = self._update(bill, result, error)
+            if change and self.on_change:
+                callback = self.on_change(*change)
+                if inspect.isawaitable(callback):
+                    await callback
+        return len(due)
+
+    def run(self, stop: threading.Event = None):
+        """ Опрашивать счета, пока очередь не опустеет или не будет установлен stop. """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            next_check = self.next_check()
+            if next_check is None:
+                return
+            if stop.wait(max(0.0, next_check - time.time())):
+                return
+            self.poll_once()
+
+    async def arun(self, stop: asyncio.Event = None):
+        """ Асинхронный вариант run для асинхронного кошелька. """
+        stop = stop or asyncio.Event()
+        while not stop.is_set():
+            next_check = self.next_check()
+            if next_check is None:
+                return
+            try:
+                await asyncio.wait_for(stop.wait(), max(0.0, next_check - time.time()))
+                return
+            except asyncio.TimeoutError:
+                await self.apoll_once()
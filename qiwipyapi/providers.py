@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Локальное определение провайдера по BIN карты и префиксу номера телефона. """
+
+import inspect
+import json
+import os
+import re
+import threading
+
+from .errors import ProviderNotFoundError
+
+
+class _Node:
+    __slots__ = ('children', 'value')
+
+    def __init__(self):
+        self.children = {}
+        self.value = None
+
+
+class PrefixTrie:
+    """ Префиксное дерево цифровых ключей: значение ищется по самому длинному известному префиксу. """
+
+    def __init__(self):
+        self._root = _Node()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def insert(self, prefix: str, value):
+        node = self._root
+        for char in prefix:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = _Node()
+            node = child
+        if node.value is None:
+            self._size += 1
+        node.value = value
+
+    def get(self, key: str):
+        """ Значение самого длинного префикса key или None. """
+        node, value = self._root, self._root.value
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                break
+            if node.value is not None:
+                value = node.value
+        return value
+
+    def items(self):
+        """ Пары (префикс, значение). """
+        stack = [('', self._root)]
+        while stack:
+            prefix, node = stack.pop()
+            if node.value is not None:
+                yield prefix, node.value
+            stack.extend((prefix + char, child) for char, child in node.children.items())
+
+
+def _digits(number) -> str:
+    return re.sub(r'\D', '', str(number))
+
+
+def _is_provider_id(provider_id) -> bool:
+    """ Идентификатор провайдера QIWI - число. Всё остальное (например, текст ошибки detect.action) не запоминается. """
+    if isinstance(provider_id, bool) or not isinstance(provider_id, (str, int)):
+        return False
+    return str(provider_id).isascii() and str(provider_id).isdigit()
+
+
+def _phone_key(phone) -> str:
+    """ Номер без кода страны: 10 цифр, начиная с кода DEF. """
+    phone = _digits(phone)
+    return phone[1:] if len(phone) == 11 and phone[0] in '78' else phone
+
+
+class ProviderResolver:
+    """ Определение провайдера перевода на карту и оператора мобильной связи без запроса к API.
+    Провайдеры хранятся в префиксных деревьях: BIN карты -> провайдер и префикс номера (DEF-диапазон) -> оператор.
+    Если префикс неизвестен, провайдер запрашивается через search_provider_for_card или search_mobile_provider
+    кошелька и запоминается для префикса длиной bin_length или phone_prefix_length. Запоминаются только числовые
+    идентификаторы провайдера, на другой ответ бросается ProviderNotFoundError.
+
+    Номера телефонов переносятся между операторами, поэтому префикс номера определяет оператора приблизительно.
+    Для точного определения задайте phone_prefix_length=10, тогда запоминаются целые номера.
+
+    :param wallet: кошелёк QIWIWallet или AsyncQIWIWallet для запросов при промахе. Без кошелька
+    при промахе возвращается None. Для асинхронного кошелька при промахе возвращается корутина.
+    :param path: файл JSON, из которого загружаются и в который сохраняются префиксы.
+    :param bin_length: длина BIN карты.
+    :param phone_prefix_length: длина префикса номера телефона без кода страны.
+    """
+
+    def __init__(self, wallet=None, path: str = None, bin_length: int = 6, phone_prefix_length: int = 6):
+        self.wallet = wallet
+        self.path = path
+        self.bin_length = bin_length
+        self.phone_prefix_length = phone_prefix_length
+        self.cards = PrefixTrie()
+        self.phones = PrefixTrie()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def add_card_range(self, prefix, provider_id):
+        """ Запомнить провайдера для карт с префиксом prefix. """
+        with self._lock:
+            self.cards.insert(_digits(prefix), str(provider_id))
+
+    def add_phone_range(self, prefix, provider_id):
+        """ Запомнить оператора для номеров с префиксом prefix (без кода страны). """
+        with self._lock:
+            self.phones.insert(_digits(prefix), str(provider_id))
+
+    def _resolve(self, trie, key, prefix_length, fetch, number):
+        provider_id = trie.get(key)
+        if provider_id is not None:
+            self.hits += 1
+            return provider_id
+        self.misses += 1
+        if fetch is None:
+            return None
+        provider_id = fetch(number)
+        if inspect.isawaitable(provider_id):
+            return self._alearn(trie, key, prefix_length, provider_id)
+        self._learn(trie, key, prefix_length, provider_id)
+        return provider_id
+
+    def _learn(self, trie, key, prefix_length, provider_id):
+        if not _is_provider_id(provider_id):
+            raise ProviderNotFoundError(provider_id)
+        # короткий или неполный номер не запоминается, чтобы не закрыть провайдером слишком широкий диапазон
+        if len(key) >= prefix_length:
+            with self._lock:
+                trie.insert(key[:prefix_length], str(provider_id))
+
+    async def _alearn(self, trie, key, prefix_length, provider_id):
+        provider_id = await provider_id
+        self._learn(trie, key, prefix_length, provider_id)
+        return provider_id
+
+    def card_provider(self, card_number):
+        """ Провайдер перевода на карту по номеру карты. """
+        fetch = self.wallet.search_provider_for_card if self.wallet is not None else None
+        return self._resolve(self.cards, _digits(card_number), self.bin_length, fetch, card_number)
+
+    def mobile_provider(self, phone):
+        """ Оператор мобильной связи по номеру телефона. """
+        fetch = self.wallet.search_mobile_provider if self.wallet is not None else None
+        return self._resolve(self.phones, _phone_key(phone), self.phone_prefix_length, fetch, phone)
+
+    def load(self, path: str = None):
+        """ Загрузить префиксы из файла JSON. """
+        with open(path or self.path, encoding='utf-8') as f:
+            data = json.load(f)
+        # записи с нечисловым провайдером (ошибки, сохранённые старыми версиями) пропускаются
+        for prefix, provider_id in data.get('cards', {}).items():
+            if _is_provider_id(provider_id):
+                self.add_card_range(prefix, provider_id)
+        for prefix, provider_id in data.get('phones', {}).items():
+            if _is_provider_id(provider_id):
+                self.add_phone_range(prefix, provider_id)
+
+    def save(self, path: str = None):
+        """ Сохранить префиксы в файл JSON. Файл заменяется целиком, поэтому при сбое старый файл не портится. """
+        path = path or self.path
+        with self._lock:
+            data = {'cards': dict(self.cards.items()), 'phones': dict(self.phones.items())}
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+            json.dump(data, f, sort_keys=True)
+        os.replace(f'{path}.tmp', path)
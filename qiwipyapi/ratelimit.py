@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Семейства эндпоинтов, для которых QIWI ограничивает частоту запросов отдельно
+ENDPOINT_FAMILIES = (('payment-history', re.compile(r'/payment-history/')),
+                     ('sinap', re.compile(r'/sinap/')),
+                     ('bills', re.compile(r'/partner/bill/|/checkout-api/')))
+
+# Лимиты по умолчанию: (запросов в секунду, размер пачки).
+# История платежей ограничена 100 запросами в минуту, при превышении кошелёк блокируется ответами 423.
+DEFAULT_LIMITS = {'payment-history': (1.5, 5),
+                  'sinap': (5, 10),
+                  'bills': (10, 20),
+                  'default': (10, 20)}
+
+
+def endpoint_family(request_url) -> str:
+    for family, pattern in ENDPOINT_FAMILIES:
+        if pattern.search(request_url):
+            return family
+    return 'default'
+
+
+class TokenBucket:
+    """ Потокобезопасный token bucket. Токен резервируется сразу, а вызывающий ждёт возвращённое время,
+    поэтому ожидание можно сделать как через time.sleep, так и через asyncio.sleep.
+
+    :param rate: скорость пополнения, токенов в секунду.
+    :param capacity: максимальное число токенов (допустимая пачка запросов).
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """ Взять токен и вернуть, сколько секунд нужно подождать перед запросом. """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def feedback(self, status_code):
+        pass
+
+
+class AdaptiveTokenBucket(TokenBucket):
+    """ Token bucket, который уменьшает скорость при ответе 423 (слишком много запросов)
+    и медленно восстанавливает её после успешных запросов.
+
+    :param min_rate: скорость, ниже которой лимит не опускается.
+    :param decrease: множитель скорости при ответе 423.
+    :param recovery: доля исходной скорости, возвращаемая после каждого успешного запроса.
+    :param cooldown: интервал в секундах, в течение которого повторные 423 не уменьшают скорость ещё раз.
+    """
+
+    def __init__(self, rate: float, capacity: float, min_rate: float = None, decrease: float = 0.5,
+                 recovery: float = 0.02, cooldown: float = 1):
+        super().__init__(rate, capacity)
+        self.max_rate = rate
+        self.min_rate = min_rate or rate / 20
+        self.decrease = decrease
+        self.recovery = recovery
+        self.cooldown = cooldown
+        self._throttled = 0.0
+
+    def feedback(self, status_code):
+        with self._lock:
+            now = time.monotonic()
+            if status_code == 423:
+                if now - self._throttled >= self.cooldown:
+                    self._refill(now)
+                    self.rate = max(self.min_rate, self.rate * self.decrease)
+                    self._tokens = min(self._tokens, 0)
+                    self._throttled = now
+            elif status_code < 400 and self.rate < self.max_rate:
+                self._refill(now)
+                self.rate = min(self.max_rate, self.rate + self.max_rate * self.recovery)
+
+
+class RateLimiter:
+    """ Ограничитель частоты запросов на стороне клиента. Держит отдельный bucket для каждой тройки
+    (токен, хост, семейство эндпоинтов) и общий для всех потоков процесса.
+
+    :param limits: лимиты по семействам эндпоинтов {'payment-history': (rate, burst), ...},
+    дополняют DEFAULT_LIMITS.
+    :param adaptive: уменьшать скорость при ответах 423.
+    """
+
+    def __init__(self, limits: dict = None, adaptive: bool = True):
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.adaptive = adaptive
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, request_url, headers=None) -> TokenBucket:
+        token = (headers or {}).get('Authorization')
+        family = endpoint_family(request_url)
+        key = (hashlib.sha1(token.encode()).hexdigest() if token else None, urlsplit(request_url).netloc, family)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    rate, burst = self.limits.get(family, self.limits['default'])
+                    bucket = (AdaptiveTokenBucket if self.adaptive else TokenBucket)(rate, burst)
+                    self._buckets[key] = bucket
+        return bucket
+
+    def acquire(self, request_url, headers=None):
+        bucket = self.bucket(request_url, headers)
+        delay = bucket.reserve()
+        if delay:
+            time.sleep(delay)
+        return bucket
+
+    async def aacquire(self, request_url, headers=None):
+        import asyncio  # default_rate_limiter нужен и qiwipyapi.p2p, который импортируется без asyncio
+
+        bucket = self.bucket(request_url, headers)
+        delay = bucket.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+        return bucket
+
+
+default_rate_limiter = RateLimiter()
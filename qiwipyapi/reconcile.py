@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Сверка выставленных счетов P2P с их статусами и входящими платежами кошелька. """
+
+from collections import defaultdict, deque, namedtuple
+from decimal import Decimal
+
+BillMatch = namedtuple('BillMatch', ['bill_id', 'amount', 'paid', 'status'])
+
+ReconciliationResult = namedtuple('ReconciliationResult',
+                                  ['matched', 'unmatched', 'overpaid', 'underpaid', 'expired', 'unknown'])
+ReconciliationResult.__doc__ = """ Результат сверки.
+
+matched - оплаченные счета, сумма совпадает;
+unmatched - счета без оплаты;
+overpaid - счета, оплаченные на большую сумму;
+underpaid - счета, оплаченные частично;
+expired - неоплаченные счета в статусе EXPIRED или REJECTED;
+unknown - входящие платежи, для которых счёт не найден.
+"""
+
+_CLOSED = ('EXPIRED', 'REJECTED')
+
+
+def _amount(value):
+    """ Сумма из ответа API: числа, строки или словаря value/amount. None, если суммы нет. """
+    if hasattr(value, 'get'):
+        value = value.get('value', value.get('amount'))
+    return None if value is None else Decimal(str(value))
+
+
+class _Bill:
+    __slots__ = ('bill_id', 'amount', 'comment', 'paid', 'status')
+
+    def __init__(self, bill_id, amount, comment):
+        self.bill_id = bill_id
+        self.amount = amount
+        self.comment = comment
+        self.paid = Decimal(0)
+        self.status = None
+
+
+class Reconciler:
+    """ Сверка счетов за один проход. Счета индексируются по billId, комментарию и сумме,
+    поэтому каждый статус или платёж сопоставляется за O(1) и сверка линейна по числу счетов и платежей.
+
+    :param match_by_amount: сопоставлять платежи без узнаваемого комментария с неоплаченными счетами
+    на ту же сумму (по порядку добавления счетов).
+    """
+
+    def __init__(self, match_by_amount: bool = False):
+        self.match_by_amount = match_by_amount
+        self._bills = {}
+        self._by_comment = {}
+        self._by_amount = defaultdict(deque)
+        self._unknown = []
+
+    def add_bills(self, bills):
+        """ Добавить счета: кортежи (bill_id, amount) или (bill_id, amount, comment),
+        либо ответы create_invoice/invoice_status: словари или объекты Invoice.
+        """
+        for bill in bills:
+            if hasattr(bill, 'get'):
+                bill_id, amount, comment = bill['billId'], _amount(bill['amount']), bill.get('comment')
+            else:
+                bill_id, amount, comment = bill[0], _amount(bill[1]), bill[2] if len(bill) > 2 else None
+            record = _Bill(str(bill_id), amount, comment)
+            self._bills[record.bill_id] = record
+            if comment:
+                self._by_comment[comment] = record
+            if self.match_by_amount:
+                self._by_amount[amount].append(record)
+        return self
+
+    def add_statuses(self, statuses):
+        """ Добавить статусы счетов из P2PWallet.invoice_status или уведомлений об оплате. """
+        for status in statuses:
+            record = self._bills.get(str(status['billId']))
+            if record is None:
+                continue
+            record.status = status['status']['value']
+            if record.status == 'PAID':
+                record.paid = _amount(status['amount'])
+        return self
+
+    def add_transactions(self, txns):
+        """ Добавить платежи из истории кошелька. Учитываются только успешные входящие платежи,
+        платежи без суммы попадают в unknown.
+        """
+        for txn in txns:
+            if txn.get('type') != 'IN' or txn.get('status') != 'SUCCESS':
+                continue
+            amount = _amount(txn.get('sum') or txn.get('total'))
+            if amount is None:
+                self._unknown.append(txn)
+                continue
+            comment = txn.get('comment')
+            record = (self._bills.get(comment) or self._by_comment.get(comment)) if comment else None
+            if record is None and self.match_by_amount:
+                candidates = self._by_amount.get(amount)
+                while candidates and candidates[0].paid:
+                    candidates.popleft()
+                record = candidates.popleft() if candidates else None
+            if record is None:
+                self._unknown.append(txn)
+                continue
+            if record.status != 'PAID':
+                record.paid += amount
+        return self
+
+    def result(self) -> ReconciliationResult:
+        result = ReconciliationResult([], [], [], [], [], list(self._unknown))
+        for record in self._bills.values():
+            match = BillMatch(record.bill_id, record.amount, record.paid, record.status)
+            if record.paid > record.amount:
+                result.overpaid.append(match)
+            elif record.paid and record.paid == record.amount:
+                result.matched.append(match)
+            elif record.paid:
+                result.underpaid.append(match)
+            elif record.status in _CLOSED:
+                result.expired.append(match)
+            else:
+                result.unmatched.append(match)
+        return result
+
+
+def reconcile(bills, statuses=(), transactions=(), match_by_amount: bool = False) -> ReconciliationResult:
+    """ Сверить счета со статусами и/или платежами из истории, см. Reconciler. """
+    reconciler = Reconciler(match_by_amount).add_bills(bills)
+    return reconciler.add_statuses(statuses).add_transactions(transactions).result()
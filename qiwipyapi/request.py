@@ -1,16 +1,136 @@
+import threading
+
 import requests
 from requests import RequestException
+from requests.adapters import HTTPAdapter
+
+from qiwipyapi import codec, metrics
+from qiwipyapi.ratelimit import default_rate_limiter
+from qiwipyapi.retry import default_retry_policy
+
+
+class ConnectionPool:
+    """ Потокобезопасный пул HTTP-соединений с keep-alive.
+    Одна сессия requests переиспользуется всеми запросами, поэтому соединение TCP+TLS с хостами QIWI
+    открывается один раз и дальше используется повторно, а не создаётся на каждый вызов API.
+
+    :param pool_connections: количество хостов, для которых кешируются пулы соединений.
+    :param pool_maxsize: максимальное число сохраняемых соединений с одним хостом.
+    :param pool_block: ждать освобождения соединения, а не открывать новое сверх pool_maxsize.
+    :param hosts: размеры пулов для отдельных хостов, например {'https://edge.qiwi.com': 20}.
+    :param timeout: таймаут запроса в секундах.
+    """
+
+    exceptions = (RequestException,)
+
+    def __init__(self, pool_connections: int = 10, pool_maxsize: int = 10, pool_block: bool = False,
+                 hosts: dict = None, timeout: float = 30):
+        self._pool_connections = pool_connections
+        self._pool_maxsize = pool_maxsize
+        self._pool_block = pool_block
+        self._hosts = dict(hosts or {})
+        self._timeout = timeout
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._create_session()
+        return self._session
+
+    def _create_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self._pool_connections, pool_maxsize=self._pool_maxsize,
+                              pool_block=self._pool_block)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        for host, maxsize in self._hosts.items():
+            session.mount(host, HTTPAdapter(pool_connections=1, pool_maxsize=maxsize, pool_block=self._pool_block))
+        return session
+
+    def send(self, method, request_url, **kwargs):
+        """ Отправить запрос. С stream=True тело ответа не читается сразу, его читают через iter_content. """
+        return self.session.request(method=method, url=request_url, headers=kwargs.get('headers'),
+                                    params=kwargs.get('params'), data=kwargs.get('data'), json=kwargs.get('json'),
+                                    timeout=kwargs.get('timeout') or self._timeout, stream=kwargs.get('stream', False))
+
+    def close(self):
+        """ Закрыть все соединения пула. Пул можно использовать и после закрытия, соединения откроются заново. """
+        with self._lock:
+            session, self._session = self._session, None
+        if session is not None:
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_pool() -> ConnectionPool:
+    """ Общий пул соединений, который используют все кошельки, созданные без своего пула. """
+    global _default_pool
+    if _default_pool is None:
+        with _default_pool_lock:
+            if _default_pool is None:
+                _default_pool = ConnectionPool()
+    return _default_pool
+
+
+def configure_default_pool(**kwargs) -> ConnectionPool:
+    """ Пересоздать общий пул соединений с новыми параметрами (см. ConnectionPool). """
+    global _default_pool
+    with _default_pool_lock:
+        old, _default_pool = _default_pool, ConnectionPool(**kwargs)
+    if old is not None:
+        old.close()
+    return _default_pool
+
+
+def encode_json(kwargs) -> dict:
+    """ Закодировать тело json= кодеком codec в data. Тело кодируется один раз, а не при каждом повторе запроса. """
+    if kwargs.get('json') is None:
+        return kwargs
+    kwargs = dict(kwargs)
+    headers = dict(kwargs.get('headers') or {})
+    headers.setdefault('Content-Type', 'application/json')
+    kwargs['data'], kwargs['headers'] = codec.dumps(kwargs.pop('json')), headers
+    return kwargs
+
 
-from qiwipyapi.utils import retry
+def request(method, request_url, pool=None, retry_policy=None, rate_limiter=None, **kwargs):
+    kwargs = encode_json(kwargs)
+    pool = pool or get_default_pool()
+    retry_policy = retry_policy or default_retry_policy
+    rate_limiter = rate_limiter or default_rate_limiter
+    event = metrics.start(method, request_url)
 
+    def send():
+        bucket = rate_limiter.acquire(request_url, kwargs.get('headers'))
+        if event is None:
+            r = pool.send(method, request_url, **kwargs)
+        else:
+            r = event.send(pool.send, method, request_url, **kwargs)
+        bucket.feedback(r.status_code)
+        return r
 
-@retry(RequestException, tries=3, delay=5)
-def request(method, request_url, **kwargs):
     try:
-        response = requests.Session().request(method=method, url=request_url, headers=kwargs.get('headers'),
-                                              params=kwargs.get('params'), data=kwargs.get('data'),
-                                              json=kwargs.get('json'))
-    except RequestException as e:
-        raise RequestException(e, method, request_url, kwargs)
-    else:
-        return response
+        response = retry_policy.call(send, method, request_url,
+                                     exceptions=getattr(pool, 'exceptions', (RequestException,)))
+    except BaseException as e:
+        if event is not None:
+            event.finish(e)
+        if isinstance(e, RequestException):
+            raise RequestException(e, method, request_url, kwargs)
+        raise
+    if event is not None:
+        event.finish()
+    return response
@@ -1,13 +1,28 @@
+import time
+
+from qiwipyapi import codec, metrics
 from qiwipyapi.errors import main_exception, QiwiError
 
 
 def response(response):
     if response.status_code in [200, 201]:
         try:
-            response_json = response.json()
+            # тело разбирается из bytes, без декодирования в строку
+            if metrics.active is None:
+                return codec.loads(response.content)
+            started = time.perf_counter()
+            response_json = codec.loads(response.content)
+            _observe_decode(response, time.perf_counter() - started)
             return response_json
-        except AttributeError:
+        except (AttributeError, ValueError):
             return response
     else:
         e = main_exception(response)
-        raise QiwiError(e, response.text)
+        raise QiwiError(e, response.text, status_code=response.status_code)
+
+
+def _observe_decode(response, seconds):
+    method = getattr(response, 'method', None) or getattr(getattr(response, 'request', None), 'method', None)
+    url = getattr(response, 'url', None)
+    if method and url and metrics.active is not None:
+        metrics.active.observe_decode(method, url, seconds)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import random
+import re
+import threading
+import time
+
+logger = logging.getLogger('qiwipyapi')
+
+# POST-запросы, которые ничего не меняют в кошельке и поэтому безопасны для повтора
+SAFE_POST_URLS = re.compile(r'/onlineCommission$|/detect\.action$|/search/results/json\.action$')
+# PUT-запросы, повтор которых не создаёт ничего нового: счёт P2P с заданным bill_id
+SAFE_PUT_URLS = re.compile(r'/partner/bill/v1/bills/[^/]+$')
+
+
+class RetryStats:
+    """ Потокобезопасные счётчики повторов запросов. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {'calls': 0, 'retries': 0, 'gave_up': 0, 'deadline_exceeded': 0}
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def __getitem__(self, name):
+        return self._counters.get(name, 0)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+    def reset(self):
+        with self._lock:
+            for name in self._counters:
+                self._counters[name] = 0
+
+
+class RetryPolicy:
+    """ Политика повтора запросов: экспоненциальная задержка со случайным разбросом (full jitter),
+    общий бюджет времени на вызов и правила идемпотентности. Повторяются только запросы, которые
+    безопасно отправить ещё раз: GET, PUT счёта P2P с заданным bill_id и справочные POST.
+    Платёжные POST, остальные PUT (веб-хуки) и DELETE не повторяются.
+
+    :param tries: максимальное число попыток (не повторов).
+    :param base_delay: задержка перед первым повтором в секундах, дальше удваивается.
+    :param max_delay: максимальная задержка между попытками в секундах.
+    :param deadline: общий бюджет времени на вызов со всеми повторами в секундах.
+    :param jitter: выбирать задержку случайно в интервале [0, задержка].
+    :param statuses: HTTP-коды ответа, при которых запрос повторяется.
+    """
+
+    def __init__(self, tries: int = 3, base_delay: float = 0.5, max_delay: float = 5, deadline: float = 15,
+                 jitter: bool = True, statuses=(423, 500, 502, 503, 504)):
+        self.tries = tries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.jitter = jitter
+        self.statuses = frozenset(statuses)
+        self.stats = RetryStats()
+
+    @staticmethod
+    def is_idempotent(method, request_url) -> bool:
+        method = method.upper()
+        if method in ('GET', 'HEAD', 'OPTIONS'):
+            return True
+        if method == 'POST':
+            return bool(SAFE_POST_URLS.search(request_url.split('?', 1)[0]))
+        if method == 'PUT':
+            return bool(SAFE_PUT_URLS.search(request_url.split('?', 1)[0]))
+        return False
+
+    def backoff(self, attempt) -> float:
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return random.uniform(0, delay) if self.jitter else delay
+
+    def _next_delay(self, attempt, started, method, request_url, reason):
+        """ Задержка перед следующей попыткой или None, если повторять нельзя. """
+        if not self.is_idempotent(method, request_url):
+            return None
+        if attempt + 1 >= self.tries:
+            self.stats.incr('gave_up')
+            return None
+        delay = self.backoff(attempt)
+        if time.monotonic() - started + delay > self.deadline:
+            self.stats.incr('deadline_exceeded')
+            return None
+        self.stats.incr('retries')
+        logger.warning('%s %s: %s, retrying in %.2f seconds (attempt %d of %d)',
+                       method.upper(), request_url, reason, delay, attempt + 2, self.tries)
+        return delay
+
+    def _check(self, attempt, started, method, request_url, result):
+        if getattr(result, 'status_code', None) not in self.statuses:
+            return None
+        delay = self._next_delay(attempt, started, method, request_url, f'HTTP {result.status_code}')
+        if delay is not None and hasattr(result, 'close'):
+            result.close()  # отброшенный потоковый ответ держит соединение пула, пока его не закрыть
+        return delay
+
+    def call(self, send, method, request_url, exceptions=()):
+        """ Выполнить send() с повторами.
+
+        :param send: функция без аргументов, отправляющая запрос.
+        :param exceptions: исключения транспорта, при которых запрос можно повторить.
+        """
+        self.stats.incr('calls')
+        started, attempt = time.monotonic(), 0
+        while True:
+            try:
+                result = send()
+            except exceptions as e:
+                delay = self._next_delay(attempt, started, method, request_url, e)
+                if delay is None:
+                    raise
+            else:
+                delay = self._check(attempt, started, method, request_url, result)
+                if delay is None:
+                    return result
+            time.sleep(delay)
+            attempt += 1
+
+    async def acall(self, send, method, request_url, exceptions=()):
+        """ Асинхронный вариант call(): send() возвращает корутину, ожидание не блокирует цикл событий. """
+        import asyncio  # retry импортирует лёгкий qiwipyapi.p2p, которому asyncio не нужен
+
+        self.stats.incr('calls')
+        started, attempt = time.monotonic(), 0
+        while True:
+            try:
+                result = await send()
+            except exceptions as e:
+                delay = self._next_delay(attempt, started, method, request_url, e)
+                if delay is None:
+                    raise
+            else:
+                delay = self._check(attempt, started, method, request_url, result)
+                if delay is None:
+                    return result
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+default_retry_policy = RetryPolicy()
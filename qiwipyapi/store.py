@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Локальное хранилище транзакций QIWI кошелька в SQLite с инкрементальной синхронизацией. """
+
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from . import codec
+from .models import Transaction
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    person TEXT NOT NULL,
+    txn_id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    ts REAL NOT NULL,
+    status TEXT,
+    type TEXT,
+    account TEXT,
+    amount TEXT,
+    currency INTEGER,
+    comment TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (person, txn_id)
+);
+CREATE INDEX IF NOT EXISTS transactions_txn_id ON transactions (txn_id);
+CREATE INDEX IF NOT EXISTS transactions_ts ON transactions (person, ts);
+CREATE INDEX IF NOT EXISTS transactions_status ON transactions (person, status, ts);
+CREATE INDEX IF NOT EXISTS transactions_type ON transactions (person, type, ts);
+CREATE INDEX IF NOT EXISTS transactions_account ON transactions (person, account, ts);
+CREATE TABLE IF NOT EXISTS sync_state (
+    person TEXT PRIMARY KEY,
+    last_ts REAL NOT NULL,
+    synced_at REAL NOT NULL
+);
+"""
+
+_UPSERT = 'INSERT OR REPLACE INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+
+
+def _timestamp(date):
+    if isinstance(date, datetime):
+        return (date if date.tzinfo else date.astimezone()).timestamp()
+    return datetime.fromisoformat(date).timestamp()
+
+
+class _SyncBatch:
+    """ Транзакции синхронизации: сохраняются в хранилище пачками по size штук, дата последней из них
+    запоминается в конце синхронизации.
+    """
+
+    def __init__(self, store, size):
+        self.store = store
+        self.size = size
+        self.txns = []
+        self.count = 0
+        self.last_ts = None
+
+    def append(self, txn):
+        self.txns.append(txn)
+        if len(self.txns) >= self.size:
+            self.flush()
+
+    def flush(self):
+        if self.txns:
+            self.count += self.store.add(self.txns)
+            self.last_ts = max(self.last_ts or 0, max(_timestamp(txn['date']) for txn in self.txns))
+            self.txns = []
+
+    def finish(self) -> int:
+        self.flush()
+        self.store._save_state(self.last_ts)
+        return self.count
+
+
+class TransactionStore:
+    """ Хранилище транзакций кошелька в SQLite с индексами по txnId, дате, статусу, типу и счёту.
+    Синхронизация запоминает дату последней загруженной транзакции и при следующем вызове загружает
+    только новые платежи и платежи, статус которых ещё мог измениться.
+
+    :param wallet: кошелёк QIWIWallet или AsyncQIWIWallet.
+    :param path: путь к файлу базы, по умолчанию база в памяти.
+    :param overlap: на сколько раньше последней загруженной транзакции начинать синхронизацию,
+    чтобы обновить статусы недавних платежей.
+    :param since: с какой даты загружать историю при первой синхронизации, по умолчанию 90 дней назад.
+    """
+
+    def __init__(self, wallet, path: str = ':memory:', overlap: timedelta = timedelta(days=1), since=None):
+        self.wallet = wallet
+        self.person = str(wallet._WALLET_NUMBER)
+        self.overlap = overlap
+        self.since = since
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        if path != ':memory:':
+            self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _row(self, txn):
+        total = txn.get('sum') or txn.get('total') or {}
+        return (self.person, txn['txnId'], txn['date'], _timestamp(txn['date']), txn.get('status'), txn.get('type'),
+                txn.get('account'), None if total.get('amount') is None else str(total['amount']),
+                total.get('currency'), txn.get('comment'),
+                codec.dumps(txn.to_json() if isinstance(txn, Transaction) else txn).decode())
+
+    def add(self, txns) -> int:
+        """ Сохранить транзакции из ответа payments_history. Существующие транзакции обновляются. """
+        rows = [self._row(txn) for txn in txns]
+        with self._lock, self._db:
+            self._db.executemany(_UPSERT, rows)
+        return len(rows)
+
+    def _sync_period(self):
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            state = self._db.execute('SELECT last_ts FROM sync_state WHERE person = ?', (self.person,)).fetchone()
+            waiting = self._db.execute("SELECT MIN(ts) FROM transactions WHERE person = ? AND status = 'WAITING'",
+                                       (self.person,)).fetchone()[0]
+        if state is None:
+            return self.since or now - timedelta(days=90), now
+        start = state['last_ts'] - self.overlap.total_seconds()
+        if waiting is not None:
+            start = min(start, waiting)
+        return datetime.fromtimestamp(start, timezone.utc), now
+
+    def _save_state(self, last_ts):
+        with self._lock, self._db:
+            previous = self._db.execute('SELECT last_ts FROM sync_state WHERE person = ?', (self.person,)).fetchone()
+            if previous is not None and last_ts is None:
+                last_ts = previous['last_ts']
+            self._db.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?)',
+                             (self.person, last_ts or time.time(), time.time()))
+
+    def sync(self, workers: int = 1, batch: int = 500) -> int:
+        """ Загрузить новые и изменившиеся транзакции из API.
+
+        :param workers: число параллельно загружаемых окон истории (см. QIWIWallet.backfill_payments).
+        :param batch: сколько транзакций сохранять за одну запись в базу.
+        :return: число загруженных транзакций
+        """
+        start, end = self._sync_period()
+        batch = _SyncBatch(self, batch)
+        for txn in self.wallet.backfill_payments(start, end, window=timedelta(days=30), workers=workers):
+            batch.append(txn)
+        return batch.finish()
+
+    async def async_sync(self, workers: int = 1, batch: int = 500) -> int:
+        """ Вариант sync() для асинхронного кошелька. """
+        start, end = self._sync_period()
+        batch = _SyncBatch(self, batch)
+        async for txn in self.wallet.backfill_payments(start, end, window=timedelta(days=30), workers=workers):
+            batch.append(txn)
+        return batch.finish()
+
+    def get(self, txn_id):
+        """ Транзакция по txnId или None. """
+        with self._lock:
+            row = self._db.execute('SELECT data FROM transactions WHERE person = ? AND txn_id = ?',
+                                   (self.person, int(txn_id))).fetchone()
+        return codec.loads(row['data']) if row else None
+
+    def exists(self, txn_id) -> bool:
+        with self._lock:
+            return self._db.execute('SELECT 1 FROM transactions WHERE person = ? AND txn_id = ?',
+                                    (self.person, int(txn_id))).fetchone() is not None
+
+    def query(self, type: str = None, status: str = None, account: str = None, since=None, until=None,
+              limit: int = None) -> list:
+        """ Транзакции по фильтрам, от новых к старым.
+
+        :param type: тип транзакции: IN, OUT, QIWI_CARD.
+        :param status: статус транзакции: WAITING, SUCCESS, ERROR.
+        :param account: номер счёта или телефона контрагента.
+        :param since: транзакции не раньше этой даты.
+        :param until: транзакции не позже этой даты.
+        :param limit: максимальное число транзакций.
+        """
+        sql, args = ['SELECT data FROM transactions WHERE person = ?'], [self.person]
+        for column, value in (('type', type), ('status', status), ('account', account)):
+            if value is not None:
+                sql.append(f'AND {column} = ?')
+                args.append(value)
+        if since is not None:
+            sql.append('AND ts >= ?')
+            args.append(_timestamp(since))
+        if until is not None:
+            sql.append('AND ts <= ?')
+            args.append(_timestamp(until))
+        sql.append('ORDER BY ts DESC')
+        if limit:
+            sql.append('LIMIT ?')
+            args.append(limit)
+        with self._lock:
+            rows = self._db.execute(' '.join(sql), args).fetchall()
+        return [codec.loads(row['data']) for row in rows]
+
+    def last_sync(self):
+        """ Время последней синхронизации или None. """
+        with self._lock:
+            row = self._db.execute('SELECT synced_at FROM sync_state WHERE person = ?', (self.person,)).fetchone()
+        return datetime.fromtimestamp(row['synced_at'], timezone.utc) if row else None
@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Транспорт HTTP-запросов кошельков. Кошелёк принимает транспорт параметром transport (или pool) и отправляет
+через него все запросы; повторы, ограничение частоты, метрики и разбор ответа остаются на стороне кошелька.
+
+Реализации:
+    RequestsTransport (request.ConnectionPool) - requests, используется по умолчанию;
+    AiohttpTransport (aio.AsyncConnectionPool) - aiohttp, для асинхронных кошельков;
+    HTTPClientTransport (p2p.HTTPPool) - http.client стандартной библиотеки;
+    MockTransport, AsyncMockTransport - ответы из памяти без сети, для тестов и нагрузочных прогонов;
+    ReplayTransport, AsyncReplayTransport - воспроизведение ответов, записанных RecordingTransport.
+"""
+
+import base64
+import json
+import re
+import threading
+from collections import namedtuple
+from typing import Protocol, runtime_checkable
+from urllib.parse import parse_qsl, urlencode
+
+from . import codec
+
+
+@runtime_checkable
+class Transport(Protocol):
+    """ Синхронный транспорт.
+
+    send(method, request_url, headers=None, params=None, data=None, timeout=None, stream=False) отправляет запрос
+    и возвращает ответ с атрибутами status_code, content, headers, url и методами text, json(). С stream=True
+    тело ответа читается через iter_content(chunk_size), после чего ответ закрывается close().
+    Атрибут exceptions - ошибки транспорта, после которых запрос можно повторить.
+    """
+
+    exceptions: tuple
+
+    def send(self, method, request_url, **kwargs):
+        ...
+
+    def close(self):
+        ...
+
+
+@runtime_checkable
+class AsyncTransport(Protocol):
+    """ Асинхронный транспорт: send и close - корутины. С stream=True тело ответа читается через
+    асинхронный итератор iter_chunks(chunk_size) или целиком через await read().
+    """
+
+    exceptions: tuple
+
+    async def send(self, method, request_url, **kwargs):
+        ...
+
+    async def close(self):
+        ...
+
+
+class Response:
+    """ Прочитанный ответ с тем же интерфейсом, что у requests.Response. """
+
+    def __init__(self, status_code, content, headers, url, method=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.url = url
+        self.method = method
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return codec.loads(self.content)
+
+    def iter_content(self, chunk_size: int = 65536):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+
+class AsyncBufferedResponse(Response):
+    """ Ответ асинхронных транспортов в памяти: тело читается так же, как у потокового ответа aiohttp. """
+
+    async def iter_chunks(self, chunk_size: int = 65536):
+        for chunk in self.iter_content(chunk_size):
+            yield chunk
+
+    async def read(self):
+        return self
+
+
+class Request(namedtuple('Request', ['method', 'url', 'params', 'headers', 'data'])):
+    """ Запрос, полученный MockTransport: method в верхнем регистре, url без параметров запроса. """
+
+    __slots__ = ()
+
+    def json(self):
+        return codec.loads(self.data) if self.data else None
+
+
+def _params(params) -> list:
+    """ Параметры запроса списком пар строк: как и requests, принимаются словарь, список пар и строка запроса. """
+    if not params:
+        return []
+    if isinstance(params, str):
+        return parse_qsl(params, keep_blank_values=True)
+    items = params.items() if isinstance(params, dict) else params
+    return [(str(key), str(value)) for key, value in items if value is not None]
+
+
+def _full_url(request_url, params):
+    params = _params(params)
+    if not params:
+        return request_url
+    return request_url + ('&' if '?' in request_url else '?') + urlencode(params)
+
+
+def _body(body) -> bytes:
+    if isinstance(body, bytes):
+        return body
+    if isinstance(body, str):
+        return body.encode()
+    return codec.dumps(body)
+
+
+class MockTransport:
+    """ Транспорт без сети: ответы задаются правилами (метод, шаблон URL, ответ). Правила проверяются
+    в порядке добавления, ответ - тело (словарь, список, строка или bytes), пара (HTTP-код, тело)
+    или функция handler(request), которая возвращает одно из этого. Тело-словарь кодируется в JSON
+    один раз при добавлении правила.
+
+    :param routes: правила (метод, шаблон URL, ответ); метод '*' подходит для любого запроса.
+    :param record: сохранять запросы в calls.
+    """
+
+    exceptions = ()
+    _response_class = Response
+
+    def __init__(self, routes=(), record: bool = False):
+        self.record = record
+        self.calls = []
+        self._routes = []
+        self._lock = threading.Lock()
+        for method, pattern, reply in routes:
+            self.add(method, pattern, reply)
+
+    def add(self, method, pattern, reply, status_code: int = 200):
+        """ Добавить правило. pattern - регулярное выражение, которое ищется в URL запроса без параметров. """
+        if not callable(reply):
+            if isinstance(reply, tuple):
+                status_code, reply = reply
+            reply = (status_code, _body(reply))
+        self._routes.append((method.upper(), re.compile(pattern), reply))
+        return self
+
+    def _reply(self, request):
+        for method, pattern, reply in self._routes:
+            if method in ('*', request.method) and pattern.search(request.url):
+                if callable(reply):
+                    reply = reply(request)
+                    if isinstance(reply, Response):
+                        return reply
+                    status_code, reply = reply if isinstance(reply, tuple) else (200, reply)
+                    return status_code, _body(reply)
+                return reply
+        return 404, b'{"errorCode": "not.found", "description": "No mock route"}'
+
+    def _send(self, method, request_url, **kwargs):
+        request = Request(method.upper(), request_url.split('?', 1)[0], kwargs.get('params'),
+                          kwargs.get('headers'), kwargs.get('data'))
+        if self.record:
+            with self._lock:
+                self.calls.append(request)
+        reply = self._reply(request)
+        if isinstance(reply, Response):
+            return reply
+        status_code, content = reply
+        return self._response_class(status_code, content, {'Content-Type': 'application/json'},
+                                    _full_url(request_url, kwargs.get('params')), request.method)
+
+    def send(self, method, request_url, **kwargs):
+        return self._send(method, request_url, **kwargs)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class AsyncMockTransport(MockTransport):
+    """ Асинхронный вариант MockTransport для асинхронных кошельков. """
+
+    _response_class = AsyncBufferedResponse
+
+    async def send(self, method, request_url, **kwargs):
+        return self._send(method, request_url, **kwargs)
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
+def _key(method, request_url, params):
+    return method.upper(), request_url, tuple(sorted(_params(params)))
+
+
+def _dump_record(method, request_url, params, r) -> str:
+    record = {'method': method.upper(), 'url': request_url,
+              'params': _params(params),
+              'status_code': r.status_code}
+    try:
+        record['body'] = r.content.decode('utf-8')
+    except UnicodeDecodeError:
+        record['body_base64'] = base64.b64encode(r.content).decode()
+    return json.dumps(record, ensure_ascii=False)
+
+
+class RecordingTransport:
+    """ Транспорт-обёртка, которая записывает запросы и ответы транспорта transport в файл JSON Lines для
+    ReplayTransport. Потоковые ответы записываются целиком.
+
+    :param transport: синхронный транспорт, например RequestsTransport().
+    :param path: файл записи, дополняется.
+    """
+
+    def __init__(self, transport, path):
+        self.transport = transport
+        self.exceptions = getattr(transport, 'exceptions', ())
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def send(self, method, request_url, **kwargs):
+        r = self.transport.send(method, request_url, **kwargs)
+        line = _dump_record(method, request_url, kwargs.get('params'), r)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+        return r
+
+    def close(self):
+        self._file.close()
+        self.transport.close()
+
+
+class ReplayTransport:
+    """ Транспорт без сети, который воспроизводит ответы, записанные RecordingTransport. Запрос сопоставляется
+    с записью по методу, URL и параметрам. Если записей для запроса несколько, они отдаются по очереди,
+    последняя повторяется.
+
+    :param path: файл записи или список записей (словарей).
+    """
+
+    exceptions = ()
+    _response_class = Response
+
+    def __init__(self, path):
+        if isinstance(path, (list, tuple)):
+            records = path
+        else:
+            with open(path, encoding='utf-8') as f:
+                records = [json.loads(line) for line in f if line.strip()]
+        self._replies = {}
+        self._lock = threading.Lock()
+        for record in records:
+            content = (base64.b64decode(record['body_base64']) if 'body_base64' in record
+                       else record.get('body', '').encode())
+            key = _key(record['method'], record['url'], record.get('params'))
+            self._replies.setdefault(key, []).append((record['status_code'], content))
+
+    def _send(self, method, request_url, **kwargs):
+        key = _key(method, request_url, kwargs.get('params'))
+        with self._lock:
+            replies = self._replies.get(key)
+            if not replies:
+                raise LookupError(f'No recorded response for {key[0]} {key[1]} {dict(key[2])}')
+            status_code, content = replies[0] if len(replies) == 1 else replies.pop(0)
+        return self._response_class(status_code, content, {}, _full_url(request_url, kwargs.get('params')),
+                                    key[0])
+
+    def send(self, method, request_url, **kwargs):
+        return self._send(method, request_url, **kwargs)
+
+    def close(self):
+        pass
+
+
+class AsyncReplayTransport(ReplayTransport):
+    """ Асинхронный вариант ReplayTransport. """
+
+    _response_class = AsyncBufferedResponse
+
+    async def send(self, method, request_url, **kwargs):
+        return self._send(method, request_url, **kwargs)
+
+    async def close(self):
+        pass
+
+
+# Реализации на сторонних библиотеках импортируются при первом обращении
+_LAZY = {'RequestsTransport': ('request', 'ConnectionPool'),
+         'AiohttpTransport': ('aio', 'AsyncConnectionPool'),
+         'HTTPClientTransport': ('p2p', 'HTTPPool')}
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    from importlib import import_module
+
+    module, attribute = _LAZY[name]
+    return getattr(import_module(f'{__package__}.{module}'), attribute)
@@ -3,32 +3,158 @@
 
 
 import uuid
+from collections import namedtuple
 
-from .request import request
+from .request import get_default_pool, request
 from .response import response
 
-from .errors import payment_history_exception, PaymentHistoryError
-from .models import Payment, PaymentInfo
+from . import history
+from .cheques import export_cheques, open_destination
+from .commission import CommissionQuoter
+from .errors import payment_history_exception, PaymentHistoryError, ProviderNotFoundError
+from .models import Balance, Bill, CrossRate, Invoice, Payment, PaymentInfo, Transaction
+from .jsonstream import iter_items
+from .notifications import P2PNotificationHandler
+from .p2p import bill_url, invoice_data
+from .utils import bounded_map, format_date
 
 from datetime import datetime, timedelta
-from dateutil.tz import tzlocal
+from operator import itemgetter
+
+InvoiceResult = namedtuple('InvoiceResult', ['bill_id', 'invoice', 'error'])
+
+
+def _parse_payment_info(r):
+    return PaymentInfo.from_json(r)
+
+
+def _parse_detected_provider(r):
+    # Ответ с HTTP Status 200: code.value = 0 - идентификатор провайдера в параметре message,
+    # code.value = 2 - провайдер не определён, в message текст ошибки
+    code = r.get('code') if isinstance(r, dict) else None
+    if not isinstance(code, dict) or str(code.get('value')) != '0' or not r.get('message'):
+        raise ProviderNotFoundError(r.get('message') if isinstance(r, dict) else r, status_code=200)
+    return r['message']
+
+
+def _parse_payments_history(r):
+    r = r.get('data')
+    # TODO обрабатывать здесь или в response()
+    if r == '':  # ответ получен без ошибки, но данные пусты
+        e = payment_history_exception(r)
+        raise PaymentHistoryError(e)
+    return r
 
 
 class BaseWallet:
     """ Родительский класс для работы с QIWI Wallet API и QIWI P2P API.
     Определяёт __init__ и общие методы кошельков.
 
+    :param wallet_number: Qiwi wallet number in format 79219876543 without +
+    :param token: токен API или секретный ключ P2P
+    :param pool: пул соединений ConnectionPool. По умолчанию используется общий пул всех кошельков,
+    close() кошелька закрывает только переданный ему пул, а не общий.
+    :param transport: транспорт запросов (см. qiwipyapi.transport), например MockTransport для работы без сети.
+    Синоним pool.
+    :param retry_policy: политика повтора запросов RetryPolicy. По умолчанию default_retry_policy.
+    :param rate_limiter: ограничитель частоты запросов RateLimiter. По умолчанию общий для процесса
+    default_rate_limiter.
+    :param cache: кэш ответов редко меняющихся эндпоинтов Cache. По умолчанию ответы не кэшируются.
+    :param models: возвращать объекты models (Invoice, Transaction, Balance, Bill, CrossRate) вместо словарей.
     """
 
-    def __init__(self, wallet_number, token):
+    _STREAM_CHUNK_SIZE = 65536
+
+    def __init__(self, wallet_number, token, pool=None, retry_policy=None, rate_limiter=None, cache=None,
+                 models: bool = False, transport=None):
         self._WALLET_NUMBER = wallet_number
         self._TOKEN = token
         self._HEADERS = {'Accept': 'application/json',
                          'Content-Type': 'application/json',
                          'Authorization': f'Bearer {self._TOKEN}'}
+        self._owns_pool = (transport or pool) is not None
+        self._pool = transport or pool or get_default_pool()
+        self._retry_policy = retry_policy
+        self._rate_limiter = rate_limiter
+        self._cache = cache
+        self._models = models
+
+    def _request(self, method, request_url, parse=None, model=None, **kwargs):
+        """ Выполнить запрос к API и вернуть ответ.
+
+        :param parse: функция, которая извлекает результат из ответа API. Методы кошельков передают
+        обработку ответа сюда, а не делают её сами, поэтому асинхронные кошельки переиспользуют их без изменений.
+        :param model: класс models, в объекты которого преобразуется результат, если кошелёк создан с models=True.
+        """
+        r = self._cache and self._cache.get(method, request_url, kwargs)
+        if r is not None:
+            return self._result(r, parse, model)
+        r = response(request(method, request_url, pool=self._pool, retry_policy=self._retry_policy,
+                             rate_limiter=self._rate_limiter, **kwargs))
+        result = self._result(r, parse, model)  # ответ, который parse отверг, не кэшируется
+        if self._cache is not None:
+            self._cache.set(method, request_url, kwargs, r)
+        return result
+
+    def _stream(self, method, request_url, key, model=None, **kwargs):
+        """ Выполнить запрос и отдавать элементы массива key ответа по мере получения тела ответа,
+        не загружая ответ целиком. Запрос отправляется при получении первого элемента.
+        """
+        r = request(method, request_url, pool=self._pool, retry_policy=self._retry_policy,
+                    rate_limiter=self._rate_limiter, stream=True, **kwargs)
+        try:
+            if r.status_code not in (200, 201):
+                response(r)  # бросает QiwiError
+            for item in iter_items(r.iter_content(chunk_size=self._STREAM_CHUNK_SIZE), key):
+                yield self._result(item, None, model)
+        finally:
+            r.close()
+
+    def _download(self, method, request_url, destination, **kwargs) -> int:
+        """ Выполнить запрос и записать тело ответа кусками в destination: путь или объект с методом write.
 
-    def _request(self, method, request_url, **kwargs):
-        return response(request(method, request_url, **kwargs))
+        :return: число записанных байт
+        """
+        r = request(method, request_url, pool=self._pool, retry_policy=self._retry_policy,
+                    rate_limiter=self._rate_limiter, stream=True, **kwargs)
+        try:
+            if r.status_code not in (200, 201):
+                response(r)  # бросает QiwiError
+            size = 0
+            with open_destination(destination) as f:
+                for chunk in r.iter_content(chunk_size=self._STREAM_CHUNK_SIZE):
+                    f.write(chunk)
+                    size += len(chunk)
+            return size
+        finally:
+            r.close()
+
+    def _result(self, r, parse, model):
+        r = parse(r) if parse else r
+        if model is None or not self._models:
+            return r
+        return model.from_json(r) if isinstance(r, dict) else [model.from_json(item) for item in r]
+
+    @property
+    def transport(self):
+        """ Транспорт запросов кошелька. """
+        return self._pool
+
+    @property
+    def cache(self):
+        """ Кэш ответов кошелька Cache или None. """
+        return self._cache
+
+    def close(self):
+        """ Закрыть соединения пула, переданного кошельку. Общий пул остаётся открытым для других кошельков. """
+        if self._owns_pool:
+            self._pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
     def _payment(self, *args, **kwargs):
         return Payment(*args, **kwargs).to_json()
@@ -54,19 +180,37 @@ class P2PWallet(BaseWallet):
 
         :param value: данные о сумме счета
         :param bill_id: уникальный идентификатор счета в вашей системе
-        :param expirationDateTime:
+        :param expirationDateTime: срок оплаты, datetime или строка ISO 8601. По умолчанию через час.
         :param kwargs: дополнительные параметры
         :return: ??? подумать, что именно возвращать (урл или весь ответ) или вообще отдавать объект
         """
         method = 'put'
-        request_url = f'https://api.qiwi.com/partner/bill/v1/bills/{bill_id if bill_id else uuid.uuid1()}'
-        json_data = dict()
-        json_data['amount'] = {'value': value, 'currency': 'RUB'}
-        if expirationDateTime is None:
-            expirationDateTime = datetime.now(tz=tzlocal()) + timedelta(hours=1)
-            json_data['expirationDateTime'] = expirationDateTime.strftime('%Y-%m-%dT%H:%m:%S+00:00')
-        json_data.update(kwargs)
-        return self._request(method, request_url, headers=self._HEADERS, json=json_data)
+        request_url = bill_url(bill_id)
+        json_data = invoice_data(value, expirationDateTime, **kwargs)
+        return self._request(method, request_url, headers=self._HEADERS, json=json_data, model=Invoice)
+
+    def _invoice_specs(self, specs):
+        """ bill_id назначается до отправки, чтобы повтор PUT не создал второй счёт. """
+        for spec in specs:
+            spec = dict(spec)
+            spec['bill_id'] = str(spec.get('bill_id') or uuid.uuid1())
+            yield spec
+
+    def _create_invoice_result(self, spec, invoice, error):
+        return InvoiceResult(spec['bill_id'], invoice, error)
+
+    def create_invoices(self, specs, concurrency: int = 4):
+        """ Выставить много счетов параллельно.
+        Счета выставляются в concurrency потоках по мере чтения specs, ошибка одного счёта не прерывает остальные.
+
+        :param specs: итерируемый объект словарей с параметрами create_invoice: value, bill_id, expirationDateTime
+        и дополнительные параметры счёта.
+        :param concurrency: число одновременных запросов.
+        :return: генератор InvoiceResult(bill_id, invoice, error) в порядке завершения запросов
+        """
+        for spec, invoice, error in bounded_map(lambda spec: self.create_invoice(**spec), self._invoice_specs(specs),
+                                                concurrency):
+            yield self._create_invoice_result(spec, invoice, error)
 
     def invoice_status(self, bill_id):
         """ Проверка счёта
@@ -79,7 +223,18 @@ class P2PWallet(BaseWallet):
         """
         method = 'get'
         request_url = f'https://api.qiwi.com/partner/bill/v1/bills/{bill_id}'
-        return self._request(method, request_url, headers=self._HEADERS)
+        return self._request(method, request_url, headers=self._HEADERS, model=Invoice)
+
+    def notification_handler(self, callback, **kwargs):
+        """ Обработчик уведомлений об оплате счетов с проверкой подписи секретным ключом кошелька.
+        https://developer.qiwi.com/ru/p2p-payments/#notification
+
+        :param callback: функция, которая получает объект Invoice при изменении статуса счёта.
+        :param kwargs: параметры P2PNotificationHandler: workers, dedupe_size.
+        :return: P2PNotificationHandler, который подключается как WSGI- (handler.wsgi) или ASGI-приложение
+        (handler.asgi).
+        """
+        return P2PNotificationHandler(self._TOKEN, callback, **kwargs)
 
     def cancel_invoice(self, bill_id):
         """ Отмена счёта
@@ -90,7 +245,7 @@ class P2PWallet(BaseWallet):
         """
         method = 'post'
         request_url = f'https://api.qiwi.com/partner/bill/v1/bills/{bill_id}/reject'
-        return self._request(method, request_url, headers=self._HEADERS)
+        return self._request(method, request_url, headers=self._HEADERS, model=Invoice)
 
 
 class QIWIWallet(BaseWallet):
@@ -104,6 +259,8 @@ class QIWIWallet(BaseWallet):
     :return: New wallet
     """
 
+    _commission_quoter = None
+
     def wallet_profile(self, authInfoEnabled: bool = True, contractInfoEnabled: bool = True,
                        userInfoEnabled: bool = True):
         """ Метод возвращает информацию о вашем профиле - наборе пользовательских данных и настроек вашего QIWI кошелька.
@@ -202,32 +359,94 @@ class QIWIWallet(BaseWallet):
         request_url = f'https://edge.qiwi.com/person-profile/v1/persons/{self._WALLET_NUMBER}/status/restrictions'
         return self._request(method, request_url, headers=self._HEADERS)
 
-    def payments_history(self, rows: int = 10, operation='ALL', sources=None) -> list:
+    def _payments_history_params(self, rows, operation, sources, start_date, end_date, next_txn_date, next_txn_id):
+        params = dict()
+        params['rows'] = rows
+        params['operation'] = operation
+        if isinstance(sources, (list, tuple)):
+            for i, source in enumerate(sources):
+                params['sources[' + str(i) + ']'] = source
+        else:
+            params['sources'] = sources
+        params['startDate'] = format_date(start_date)
+        params['endDate'] = format_date(end_date)
+        params['nextTxnDate'] = format_date(next_txn_date)
+        params['nextTxnId'] = next_txn_id
+        return params
+
+    def payments_history(self, rows: int = 10, operation='ALL', sources=None, start_date=None, end_date=None,
+                         next_txn_date=None, next_txn_id=None, stream: bool = False) -> list:
         """ История платежей
         https://developer.qiwi.com/ru/qiwi-wallet-personal/index.html#payments_history
 
-        :param rows:
-        :param operation:
-        :param sources:
-        :return:
+        :param rows: Число платежей в ответе, для разбивки отчета на страницы. Целое число от 1 до 50.
+        :param operation: Тип операций в отчете, для отбора. ALL, IN, OUT, QIWI_CARD.
+        :param sources: Источники платежа, для отбора, например ['QW_RUB', 'CARD'].
+        :param start_date: Начальная дата поиска платежей. Используется только вместе с end_date.
+        :param end_date: Конечная дата поиска платежей. Используется только вместе с start_date.
+        :param next_txn_date: Дата транзакции для начала отчета (nextTxnDate из предыдущего ответа).
+        :param next_txn_id: Номер транзакции для начала отчета (nextTxnId из предыдущего ответа).
+        :param stream: отдавать платежи по мере получения ответа.
+        :return: список платежей (параметр data ответа), с stream=True - генератор платежей
         """
         method = 'get'
         request_url = f'https://edge.qiwi.com/payment-history/v2/persons/{self._WALLET_NUMBER}/payments'
-        params = dict()
-        params['rows'] = rows
-        params['operation'] = operation
-        params['sources'] = sources
+        params = self._payments_history_params(rows, operation, sources, start_date, end_date, next_txn_date,
+                                               next_txn_id)
         # TODO кидать ошибку, если платежей нет и всё что с этим связанно
         # Ошибки перечислены в параметре errorCode ответа
         # Возможно имеет смысл сделать отдельную ошибку и выводить код ошибки и описание
         # Или делать на каждую ошибку своё исключение
         # https://developer.qiwi.com/ru/qiwi-wallet-personal/index.html#search
-        r = self._request(method, request_url, headers=self._HEADERS, params=params).get('data')
-        # TODO обрабатывать здесь или в response()
-        if r == '':  # ответ получен без ошибки, но данные пусты
-            e = payment_history_exception(r)
-            raise PaymentHistoryError(e)
-        return r
+        if stream:
+            return self._stream(method, request_url, 'data', headers=self._HEADERS, params=params, model=Transaction)
+        return self._request(method, request_url, headers=self._HEADERS, params=params, parse=_parse_payments_history,
+                             model=Transaction)
+
+    def payments_page(self, rows: int = 50, operation='ALL', sources=None, start_date=None, end_date=None,
+                      next_txn_date=None, next_txn_id=None) -> dict:
+        """ Страница истории платежей вместе с курсором следующей страницы.
+        Параметры совпадают с payments_history.
+
+        :return: полный ответ API: data, nextTxnId, nextTxnDate
+        """
+        method = 'get'
+        request_url = f'https://edge.qiwi.com/payment-history/v2/persons/{self._WALLET_NUMBER}/payments'
+        params = self._payments_history_params(rows, operation, sources, start_date, end_date, next_txn_date,
+                                               next_txn_id)
+        return self._request(method, request_url, headers=self._HEADERS, params=params)
+
+    def iter_payments(self, start_date=None, end_date=None, operation='ALL', sources=None, rows: int = 50):
+        """ Итератор по всей истории платежей. Сам переходит по страницам (nextTxnId/nextTxnDate)
+        и загружает следующую страницу, пока обрабатывается текущая. В памяти держится не больше двух страниц.
+
+        :param start_date: Начальная дата поиска платежей. Используется только вместе с end_date.
+        :param end_date: Конечная дата поиска платежей. Используется только вместе с start_date.
+        :param operation: Тип операций в отчете, для отбора. ALL, IN, OUT, QIWI_CARD.
+        :param sources: Источники платежа, для отбора.
+        :param rows: Размер страницы, от 1 до 50.
+        :return: генератор платежей, от новых к старым
+        """
+        payments = history.iter_payments(self, start_date, end_date, operation, sources, rows)
+        return map(Transaction.from_json, payments) if self._models else payments
+
+    def backfill_payments(self, start_date: datetime, end_date: datetime, window: timedelta = timedelta(days=7),
+                          workers: int = 4, operation='ALL', sources=None, rows: int = 50):
+        """ Загрузка истории платежей за длинный период (например, за год для сверки).
+        Период делится на окна по window, окна загружаются параллельно в workers потоках с учётом лимитов
+        частоты запросов. Платежи отдаются одним потоком от новых к старым, без дублей по txnId.
+
+        :param start_date: Начальная дата периода.
+        :param end_date: Конечная дата периода.
+        :param window: Длина окна. QIWI допускает период поиска не больше 90 дней, более длинное окно - ValueError.
+        :param workers: Число окон, загружаемых одновременно.
+        :param operation: Тип операций в отчете, для отбора. ALL, IN, OUT, QIWI_CARD.
+        :param sources: Источники платежа, для отбора.
+        :param rows: Размер страницы, от 1 до 50.
+        :return: генератор платежей, от новых к старым
+        """
+        payments = history.backfill_payments(self, start_date, end_date, window, workers, operation, sources, rows)
+        return map(Transaction.from_json, payments) if self._models else payments
 
     def payment_stat(self, start_date: datetime, end_date: datetime, operation: str = 'ALL', source: list = None):
         """ Статистика платежей
@@ -258,12 +477,11 @@ class QIWIWallet(BaseWallet):
 
         :param transaction_id: номер транзакции из истории платежей (параметр data[].txnId в ответе).
         :param type: тип транзакции из истории платежей (параметр data[].type в ответе). Optional.
-        :return:
+        :return: транзакция в формате элемента истории платежей
         """
         method = 'get'
         request_url = f'https://edge.qiwi.com/payment-history/v2/transactions/{transaction_id}?type={type}'
-        # TODO if not transaction raise error
-        return self._request(method, request_url, headers=self._HEADERS)['Transaction']
+        return self._request(method, request_url, headers=self._HEADERS, model=Transaction)
 
     def cheque_file(self, transaction_id, type: str = None, format: str = 'PDF'):
         """ Данный метод используется для получения электронной квитанции (чека) по определенной транзакции
@@ -281,6 +499,29 @@ class QIWIWallet(BaseWallet):
         # response in binary format
         return self._request(method, request_url, headers=self._HEADERS)
 
+    def save_cheque(self, transaction_id, type: str, destination, format: str = 'PDF') -> int:
+        """ Сохранить квитанцию по транзакции, не загружая её в память целиком, см. cheque_file.
+
+        :param transaction_id: номер транзакции из истории платежей (параметр data[].txnId в ответе).
+        :param type: тип транзакции из истории платежей (параметр data[].type в ответе).
+        :param destination: путь к файлу или объект с методом write, например открытый на запись файл.
+        :param format: тип файла квитанции. Допустимые значения: JPEG, PDF
+        :return: размер квитанции в байтах
+        """
+        method = 'get'
+        request_url = f'https://edge.qiwi.com/payment-history/v1/transactions/{transaction_id}/cheque/file'
+        params = {'type': type, 'format': format}
+        return self._download(method, request_url, destination, headers=self._HEADERS, params=params)
+
+    def export_cheques(self, cheques, directory, format: str = 'PDF', concurrency: int = 4,
+                       skip_existing: bool = True, progress=None):
+        """ Скачать квитанции многих транзакций в каталог directory, см. qiwipyapi.cheques.export_cheques.
+
+        :param cheques: пары (номер транзакции, тип транзакции).
+        :return: ChequeExport с числом сохранённых и пропущенных квитанций и ошибками
+        """
+        return export_cheques(self, cheques, directory, format, concurrency, skip_existing, progress)
+
     def cheque_to_email(self, transaction_id, type: str, email: str):
         """ Данный метод используется для получения электронной квитанции (чека) по определенной транзакции
         из вашей истории платежей в формате PDF/JPEG в виде файла почтовым сообщением на заданный e-mail.
@@ -303,10 +544,13 @@ class QIWIWallet(BaseWallet):
         https://developer.qiwi.com/ru/qiwi-wallet-personal/index.html#balances_list
 
         :return: Ответ содержит массив счетов вашего QIWI Кошелька для фондирования платежей и текущие балансы счетов.
+        Если кошелёк создан с models=True, возвращается список Balance.
         """
         method = 'get'
         request_url = f'https://edge.qiwi.com/funding-sources/v2/persons/{self._WALLET_NUMBER}/accounts'
-        # TODO сделать отдельный класс балансы
+        if self._models:
+            return self._request(method, request_url, headers=self._HEADERS, parse=itemgetter('accounts'),
+                                 model=Balance)
         return self._request(method, request_url, headers=self._HEADERS)
 
     def create_balance(self, alias: str):
@@ -369,7 +613,27 @@ class QIWIWallet(BaseWallet):
         json_data['purchaseTotals']['total']['amount'] = float(amount)
         json_data['purchaseTotals']['total']['currency'] = '643'
         json_data.update(kwargs)
-        return self._request(method, request_url, headers=self._HEADERS, json=json_data)['qwCommission']['amount']
+        return self._request(method, request_url, headers=self._HEADERS, json=json_data,
+                             parse=lambda r: r['qwCommission']['amount'])
+
+    @property
+    def commission_quoter(self) -> CommissionQuoter:
+        """ Калькулятор комиссий кошелька, который запоминает комиссии и тарифы провайдеров. """
+        if self._commission_quoter is None:
+            self._commission_quoter = CommissionQuoter(self)
+        return self._commission_quoter
+
+    def get_commissions(self, id: str, amounts, account: str = None, account_type: str = None) -> dict:
+        """ Узнать комиссии для многих сумм. Запросы выполняются параллельно, комиссии запоминаются,
+        а для сумм внутри изученного тарифа провайдера считаются без запроса, см. CommissionQuoter.
+
+        :param id: Идентификатор провайдера.
+        :param amounts: Суммы платежа.
+        :param account: Номер счёта получателя.
+        :param account_type: Тип счёта получателя, если комиссия провайдера от него зависит.
+        :return: {сумма: комиссия}
+        """
+        return self.commission_quoter.quote_many(id, amounts, account=account, account_type=account_type)
 
     def autocomplete_form(self, id: int, amountInteger: int = None, amountFraction: int = None, comment: str = None,
                           account: str = None, blocked: list = None, accountType: str = None):
@@ -413,24 +677,24 @@ class QIWIWallet(BaseWallet):
         """
         method = 'get'
         request_url = f'https://edge.qiwi.com/qw-nicknames/v1/persons/{self._WALLET_NUMBER}/nickname'
-        return self._request(method, request_url, headers=self._HEADERS)['nickname']
+        return self._request(method, request_url, headers=self._HEADERS, parse=itemgetter('nickname'))
 
-    def payment_to_wallet(self, amount: float, pay_to: str):
+    def payment_to_wallet(self, amount: float, pay_to: str, **kwargs):
         """ Перевод на киви кошелёк.
         https://developer.qiwi.com/ru/qiwi-wallet-personal/index.html#p2p
 
         :param amount: Сумма перевода.
         :param pay_to: Номер кошелька для перевода.
+        :param kwargs: дополнительные параметры Payment, например id или comment.
         :return:
         """
         method = 'post'
         request_url = f'https://edge.qiwi.com/sinap/api/v2/terms/99/payments'
-        fields = {'fields': {'account': pay_to}}
-        payment = Payment(amount=amount, fields=fields)
-        r = self._request(method, request_url, headers=self._HEADERS, json=payment)
+        fields = {'account': pay_to}
+        payment = Payment(amount=amount, fields=fields, **kwargs)
         # TODO test
-        payment_info = PaymentInfo(r['PaymentInfo'])
-        return payment_info
+        return self._request(method, request_url, headers=self._HEADERS, json=payment.to_json(),
+                             parse=_parse_payment_info)
 
     def exchange(self, amount: float, currency: str, pay_to: str):
         """ Конвертировать средства.
@@ -444,16 +708,16 @@ class QIWIWallet(BaseWallet):
         method = 'post'
         request_url = f'https://edge.qiwi.com/sinap/api/v2/terms/1099/payments'
         currencies = ['398', '840', '978']
-        if currency not in currencies:
-            print('This currency not available')
-            return
+        try:
+            assert currency in currencies
+        except AssertionError:
+            raise AssertionError('This currency not available')
         sum = {'amount': amount, 'currency': currency}
         fields = {'account': pay_to}
         payment = Payment(sum=sum, fields=fields)
-        r = self._request(method, request_url, headers=self._HEADERS, json=payment)
         # TODO test
-        payment_info = PaymentInfo(r['PaymentInfo'])
-        return payment_info
+        return self._request(method, request_url, headers=self._HEADERS, json=payment.to_json(),
+                             parse=_parse_payment_info)
 
     def cross_rates(self):
         """  Курсы валют. Метод возвращает текущие курсы и кросс-курсы валют КИВИ Банка.
@@ -464,24 +728,25 @@ class QIWIWallet(BaseWallet):
         method = 'get'
         request_url = f'https://edge.qiwi.com/sinap/crossRates'
         # TODO return currency pair if request in method
-        return self._request(method, request_url, headers=self._HEADERS)['result']
+        return self._request(method, request_url, headers=self._HEADERS, parse=itemgetter('result'), model=CrossRate)
 
-    def pay_mobile(self, id: str, to_mobile: str):
+    def pay_mobile(self, id: str, to_mobile: str, amount: float = None, **kwargs):
         """ Оплата сотовой связи.
         https://developer.qiwi.com/ru/qiwi-wallet-personal/index.html#cell
 
         :param id: Идентификатор провайдера. Определяется с помощью метода проверки мобильного оператора.
         :param to_mobile: Номер мобильного телефона для пополнения (без префикса 8).
+        :param amount: Сумма платежа.
+        :param kwargs: дополнительные параметры Payment, например id.
         :return: PaymentInfo
         """
         method = 'post'
         request_url = f'https://edge.qiwi.com/sinap/api/v2/terms/{id}/payments'
         fields = {'account': to_mobile}
-        payment = Payment(fields=fields)  # TODO sum ???
-        r = self._request(method, request_url, headers=self._HEADERS, json=payment)
+        payment = Payment(amount=amount, fields=fields, **kwargs)
         # TODO test
-        payment_info = PaymentInfo(r['PaymentInfo'])
-        return payment_info
+        return self._request(method, request_url, headers=self._HEADERS, json=payment.to_json(),
+                             parse=_parse_payment_info)
 
     def payment_to_card(self, amount, card_number: str, provider_id: str, **kwargs):
         """ Перевод на карту. Метод выполняет денежный перевод на карты платежных систем Visa, MasterCard или МИР.
@@ -491,18 +756,29 @@ class QIWIWallet(BaseWallet):
         :param amount:
         :param card_number:
         :param provider_id:
-        :param kwargs:
+        :param kwargs: дополнительные параметры Payment, например id или comment.
         :return: PaymentInfo
         """
         method = 'post'
         request_url = f'https://edge.qiwi.com/sinap/api/v2/terms/{provider_id}/payments'
         fields = {'account': card_number}
-        json_data = self._payment(amount=amount, fields=fields, *kwargs)
-        print(json_data)
+        json_data = self._payment(amount=amount, fields=fields, **kwargs)
         # TODO кидать ошибку, если не хватает денег и всё что не связанно с корректностью данных
-        r = self._request(method, request_url, headers=self._HEADERS, json=json_data)
-        print(self._payment_info(r))
-        return r
+        return self._request(method, request_url, headers=self._HEADERS, json=json_data)
+
+    def send_payment(self, provider_id: str, payment):
+        """ Отправить подготовленный платёж на провайдера. Повторная отправка платежа с тем же id
+        не создаёт второй перевод.
+        https://developer.qiwi.com/ru/qiwi-wallet-personal/index.html#payments
+
+        :param provider_id: Идентификатор провайдера.
+        :param payment: Payment или словарь с данными платежа.
+        :return: PaymentInfo
+        """
+        method = 'post'
+        request_url = f'https://edge.qiwi.com/sinap/api/v2/terms/{provider_id}/payments'
+        json_data = payment.to_json() if isinstance(payment, Payment) else payment
+        return self._request(method, request_url, headers=self._HEADERS, json=json_data, parse=_parse_payment_info)
 
     def transfer_to_card(self, provider_id: str, account: str, account_type: str, mfo: str, lname: str,
                          fname: str, mname: str, exp_date: str = None):
@@ -530,10 +806,9 @@ class QIWIWallet(BaseWallet):
         fields['fname'] = fname
         fields['mname'] = mname
         payment = Payment(fields=fields)  # TODO sum ???
-        r = self._request(method, request_url, headers=self._HEADERS, json=payment)
         # TODO test
-        payment_info = PaymentInfo(r['PaymentInfo'])
-        return payment_info
+        return self._request(method, request_url, headers=self._HEADERS, json=payment.to_json(),
+                             parse=_parse_payment_info)
 
     def transfer_to_account(self, provider_id: str, account: str, urgent: str, mfo: str, account_type: str, lname: str,
                             fname: str, mname: str, agrnum: str = None):
@@ -565,10 +840,9 @@ class QIWIWallet(BaseWallet):
         fields['mname'] = mname
         fields['agrnum'] = agrnum
         payment = Payment(fields=fields)  # TODO sum ???
-        r = self._request(method, request_url, headers=self._HEADERS, json=payment)
         # TODO test
-        payment_info = PaymentInfo(r['PaymentInfo'])
-        return payment_info
+        return self._request(method, request_url, headers=self._HEADERS, json=payment.to_json(),
+                             parse=_parse_payment_info)
 
     def other_transfer(self, provider_id: str, account: str):
         """ Оплата услуги по идентификатору пользователя. Данный метод применяется для провайдеров, использующих в
@@ -584,10 +858,9 @@ class QIWIWallet(BaseWallet):
         fields = dict()
         fields['account'] = account
         payment = Payment(fields=fields)  # TODO sum ???
-        r = self._request(method, request_url, headers=self._HEADERS, json=payment)
         # TODO test
-        payment_info = PaymentInfo(r['PaymentInfo'])
-        return payment_info
+        return self._request(method, request_url, headers=self._HEADERS, json=payment.to_json(),
+                             parse=_parse_payment_info)
 
     def transfer_on_details(self, name: str, extra_to_bik: str, to_bik: str, city: str, to_name: str, to_inn: str,
                             to_kpp: str, nds: str, goal: str, urgent: str, account: str, from_name: str,
@@ -634,19 +907,19 @@ class QIWIWallet(BaseWallet):
         fields['requestProtocol'] = 'qw1'
         fields['toServiceId'] = '1717'
         payment = Payment(fields=fields)  # TODO sum ???
-        r = self._request(method, request_url, headers=self._HEADERS, json=payment)
         # TODO test
-        payment_info = PaymentInfo(r['PaymentInfo'])
-        return payment_info
+        return self._request(method, request_url, headers=self._HEADERS, json=payment.to_json(),
+                             parse=_parse_payment_info)
 
-    def search_provider_by_string(self, searchPhrase: str) -> list:
+    def search_provider_by_string(self, searchPhrase: str, stream: bool = False) -> list:
         """ Поиск провайдера по строке. Поиск провайдера может понадобиться,
         если вы не знаете значения ID провайдера услуг для оплаты по идентификатору пользователя,
         либо для определения провайдера мобильной связи по номеру телефона или перевода на карту по номеру карты.
         https://developer.qiwi.com/ru/qiwi-wallet-personal/index.html#search
 
         :param searchPhrase: Строка ключевых слов для поиска провайдера.
-        :return:
+        :param stream: отдавать провайдеров по мере получения ответа.
+        :return: список провайдеров, с stream=True - генератор провайдеров
         """
         method = 'post'
         request_url = 'https://qiwi.com/search/results/json.action'
@@ -655,15 +928,17 @@ class QIWIWallet(BaseWallet):
         headers['Content-Type'] = 'application/x-www-form-urlencoded'
         params = dict()
         params['searchPhrase'] = searchPhrase
-        return self._request(method, request_url, headers=headers, params=params)['data']
+        if stream:
+            return self._stream(method, request_url, 'data', headers=headers, params=params)
+        return self._request(method, request_url, headers=headers, params=params, parse=itemgetter('data'))
 
     def search_mobile_provider(self, phone_number: str):
         """ Определение мобильного оператора. Предварительное определение оператора мобильного номера выполняется
         данным запросом. В ответе возвращается идентификатор провайдера для запроса пополнения телефона.
         https://developer.qiwi.com/ru/qiwi-wallet-personal/index.html#search
 
-        :param phone_number:
-        :return:
+        :param phone_number: Номер телефона.
+        :return: идентификатор провайдера. Если оператор не определён, бросается ProviderNotFoundError.
         """
         method = 'post'
         request_url = 'https://qiwi.com/mobile/detect.action'
@@ -671,9 +946,7 @@ class QIWIWallet(BaseWallet):
         headers['Accept'] = 'application/json'
         headers['Content-Type'] = 'application/x-www-form-urlencoded'
         data = {'phone': phone_number}
-        # TODO Подумать по формату вывода
-        # Ответ с HTTP Status 200 и параметром code.value = 0 or 2
-        return self._request(method, request_url, headers=headers, data=data)['data']
+        return self._request(method, request_url, headers=headers, data=data, parse=_parse_detected_provider)
 
     def search_provider_for_card(self, card_number):
         """ Поиск провайдера для перевода на карту. Определение провайдера перевода на карту выполняется
@@ -681,7 +954,7 @@ class QIWIWallet(BaseWallet):
         https://developer.qiwi.com/ru/qiwi-wallet-personal/index.html#search
 
         :param card_number:
-        :return:
+        :return: идентификатор провайдера. Если провайдер не определён, бросается ProviderNotFoundError.
         """
         method = 'post'
         request_url = 'https://qiwi.com/card/detect.action'
@@ -690,7 +963,76 @@ class QIWIWallet(BaseWallet):
         headers['Content-Type'] = 'application/x-www-form-urlencoded'
         data = dict()
         data['cardNumber'] = card_number
-        return self._request(method, request_url, headers=headers, data=data).get('message')
+        return self._request(method, request_url, headers=headers, data=data, parse=_parse_detected_provider)
+
+    def register_hook(self, url: str, txn_type: int = 2):
+        """ Регистрация обработчика веб-хуков. У кошелька может быть только один активный веб-хук.
+        https://developer.qiwi.com/ru/qiwi-wallet-personal/index.html#hook_reg
+
+        :param url: Адрес обработчика веб-хуков.
+        :param txn_type: Тип транзакций, о которых приходят уведомления: 0 - входящие, 1 - исходящие, 2 - все.
+        :return: Описание веб-хука: hookId, hookParameters, hookType, txnType.
+        """
+        method = 'put'
+        request_url = 'https://edge.qiwi.com/payment-notifier/v1/hooks'
+        params = dict()
+        params['hookType'] = 1
+        params['param'] = url
+        params['txnType'] = txn_type
+        return self._request(method, request_url, headers=self._HEADERS, params=params)
+
+    def hook_info(self):
+        """ Данные об активном обработчике веб-хуков.
+        https://developer.qiwi.com/ru/qiwi-wallet-personal/index.html#hook_active
+
+        :return: Описание веб-хука: hookId, hookParameters, hookType, txnType.
+        """
+        method = 'get'
+        request_url = 'https://edge.qiwi.com/payment-notifier/v1/hooks/active'
+        return self._request(method, request_url, headers=self._HEADERS)
+
+    def test_hook(self):
+        """ Отправить тестовое уведомление на активный обработчик веб-хуков.
+        https://developer.qiwi.com/ru/qiwi-wallet-personal/index.html#hook_test
+
+        :return:
+        """
+        method = 'get'
+        request_url = 'https://edge.qiwi.com/payment-notifier/v1/hooks/test'
+        return self._request(method, request_url, headers=self._HEADERS)
+
+    def delete_hook(self, hook_id: str):
+        """ Удаление обработчика веб-хуков.
+        https://developer.qiwi.com/ru/qiwi-wallet-personal/index.html#hook_delete
+
+        :param hook_id: Идентификатор веб-хука (hookId из ответа register_hook или hook_info).
+        :return:
+        """
+        method = 'delete'
+        request_url = f'https://edge.qiwi.com/payment-notifier/v1/hooks/{hook_id}'
+        return self._request(method, request_url, headers=self._HEADERS)
+
+    def hook_secret(self, hook_id: str) -> str:
+        """ Ключ для проверки подписи уведомлений веб-хука.
+        https://developer.qiwi.com/ru/qiwi-wallet-personal/index.html#hook_key
+
+        :param hook_id: Идентификатор веб-хука.
+        :return: ключ в кодировке base64 для WalletHookHandler
+        """
+        method = 'get'
+        request_url = f'https://edge.qiwi.com/payment-notifier/v1/hooks/{hook_id}/key'
+        return self._request(method, request_url, headers=self._HEADERS, parse=itemgetter('key'))
+
+    def new_hook_secret(self, hook_id: str) -> str:
+        """ Сменить ключ для проверки подписи уведомлений веб-хука.
+        https://developer.qiwi.com/ru/qiwi-wallet-personal/index.html#hook_key_new
+
+        :param hook_id: Идентификатор веб-хука.
+        :return: новый ключ в кодировке base64
+        """
+        method = 'post'
+        request_url = f'https://edge.qiwi.com/payment-notifier/v1/hooks/{hook_id}/newkey'
+        return self._request(method, request_url, headers=self._HEADERS, parse=itemgetter('key'))
 
     def create_p2p_token(self, keysPairName: str, serverNotificationsUrl: str = None):
         """ Выпуск токена P2P. Вы можете получить токен P2P на p2p.qiwi.com в личном кабинете, или использовать
@@ -711,7 +1053,7 @@ class QIWIWallet(BaseWallet):
         return self._request(method, request_url, headers=self._HEADERS, json=json_data)
 
     def list_bills(self, rows: int = None, min_creation_datetime=None, max_creation_datetime=None, next_id=None,
-                   next_creation_datetime=None) -> list:
+                   next_creation_datetime=None, stream: bool = False) -> list:
         """ Список счетов. Метод получения списка неоплаченных счетов вашего кошелька.
         https://developer.qiwi.com/ru/qiwi-wallet-personal/index.html#list_invoice
 
@@ -721,7 +1063,9 @@ class QIWIWallet(BaseWallet):
         :param next_id: Начальный идентификатор счета для поиска.
         :param next_creation_datetime: Начальное время для поиска (возвращаются только счета,
         выставленные ранее этого времени), Unix-time.
-        :return: список неоплаченных счетов вашего кошелька, соответствующих заданному фильтру
+        :param stream: отдавать счета по мере получения ответа.
+        :return: список неоплаченных счетов вашего кошелька, соответствующих заданному фильтру,
+        с stream=True - генератор счетов
         """
         method = 'get'
         request_url = 'https://edge.qiwi.com/checkout-api/api/bill/search'
@@ -732,7 +1076,10 @@ class QIWIWallet(BaseWallet):
         params['max_creation_datetime'] = max_creation_datetime
         params['next_id'] = next_id
         params['next_creation_datetime'] = next_creation_datetime
-        return self._request(method, request_url, headers=self._HEADERS, params=params)['bills']
+        if stream:
+            return self._stream(method, request_url, 'bills', headers=self._HEADERS, params=params, model=Bill)
+        return self._request(method, request_url, headers=self._HEADERS, params=params, parse=itemgetter('bills'),
+                             model=Bill)
 
     def pay_bill(self, invoice_uid: str, currency: str):
         """ Оплата счета. Выполнение безусловной оплаты счета без SMS-подтверждения.
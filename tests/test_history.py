@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from qiwipyapi import history
+
+START = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+class History:
+    """ История платежей в памяти: по платежу в час, страницы по rows платежей. """
+
+    def __init__(self, days):
+        self.txns = [{'txnId': i, 'date': START + timedelta(hours=i)} for i in range(days * 24 + 1)]
+        self.calls = 0
+
+    def payments_page(self, rows, operation, sources, start_date, end_date, next_txn_date=None, next_txn_id=None):
+        self.calls += 1
+        # границы периода включаются, поэтому платёж на общей границе окон приходит дважды
+        txns = [txn for txn in reversed(self.txns) if start_date <= txn['date'] <= end_date
+                and (next_txn_id is None or txn['txnId'] <= next_txn_id)]
+        page, rest = txns[:rows], txns[rows:]
+        return {'data': page, 'nextTxnId': rest[0]['txnId'] if rest else None,
+                'nextTxnDate': rest[0]['date'] if rest else None}
+
+
+class AsyncHistory(History):
+    async def payments_page(self, *args):
+        return super().payments_page(*args)
+
+
+def test_date_windows_cover_period_newest_first():
+    windows = history.date_windows(START, START + timedelta(days=10), timedelta(days=4))
+    assert windows == [(START + timedelta(days=6), START + timedelta(days=10)),
+                       (START + timedelta(days=2), START + timedelta(days=6)),
+                       (START, START + timedelta(days=2))]
+
+
+@pytest.mark.parametrize('window', [timedelta(days=91), timedelta(0), timedelta(days=-1)])
+def test_invalid_window_is_rejected_before_requests(window):
+    wallet = History(1)
+    with pytest.raises(ValueError):
+        history.backfill_payments(wallet, START, START + timedelta(days=1), window)
+    with pytest.raises(ValueError):
+        history.abackfill_payments(AsyncHistory(1), START, START + timedelta(days=1), window)
+    assert wallet.calls == 0
+
+
+def test_backfill_returns_each_payment_once():
+    wallet = History(10)
+    txns = list(history.backfill_payments(wallet, START, START + timedelta(days=10), timedelta(days=1), rows=7))
+    assert [txn['txnId'] for txn in txns] == list(reversed(range(len(wallet.txns))))
+
+
+def test_abackfill_returns_each_payment_once():
+    wallet = AsyncHistory(10)
+
+    async def collect():
+        return [txn async for txn in history.abackfill_payments(wallet, START, START + timedelta(days=10),
+                                                                timedelta(days=1), rows=7)]
+
+    txns = asyncio.run(collect())
+    assert [txn['txnId'] for txn in txns] == list(reversed(range(len(wallet.txns))))
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import pytest
+
+from qiwipyapi.notifications import WalletHookHandler
+
+# Подпись посчитана заранее: HMAC-SHA256 строки подписанных полей на секретном ключе
+HOOK_SECRET = 'aG9vay1zZWNyZXQta2V5'  # base64 от hook-secret-key
+HOOK_BODY = ('{"messageId": "7814c49d-2d29-4b14-b2dc-36b377c76156", "hash": "%s", "payment": {"txnId": "13353941550", '
+             '"personId": 79001234567, "account": "79001234567", "type": "IN", "sum": {"amount": 1.00, '
+             '"currency": 643}, "signFields": "sum.currency,sum.amount,account,type,txnId"}}')
+HOOK_HASH = 'c6978cfd43178239e6746fc52fc62ce6d3c7a2c7a29470a568e21c6c093930db'
+
+
+@pytest.fixture
+def hook():
+    handler = WalletHookHandler(HOOK_SECRET, lambda txn: None)
+    yield handler
+    handler.close()
+
+
+def test_hook_valid_hash_is_accepted(hook):
+    # сумма 1.00 подписывается в исходной записи, а не как 1.0
+    status, txn = hook.handle((HOOK_BODY % HOOK_HASH).encode(), {})
+    assert status == 200
+    assert txn.txnId == '13353941550'
+
+
+@pytest.mark.parametrize('signature', ['', 'f' * 64, HOOK_HASH[:-1] + 'ё', 'хеш'])
+def test_hook_bad_hash_is_rejected(hook, signature):
+    assert hook.handle((HOOK_BODY % signature).encode(), {}) == (403, None)
+
+
+def test_hook_tampered_amount_is_rejected(hook):
+    body = (HOOK_BODY % HOOK_HASH).replace('"amount": 1.00', '"amount": 100.00')
+    assert hook.handle(body.encode(), {}) == (403, None)
+
+
+def test_hook_secret_must_be_base64():
+    with pytest.raises(ValueError):
+        WalletHookHandler('not a base64 key!', lambda txn: None)
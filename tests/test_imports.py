@@ -0,0 +1,10 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import subprocess
+import sys
+
+
+def test_p2p_does_not_import_asyncio():
+    # retry, ratelimit и utils импортируют asyncio только внутри асинхронного кода
+    code = 'import sys, qiwipyapi.p2p; assert "asyncio" not in sys.modules, "asyncio imported"'
+    subprocess.run([sys.executable, '-c', code], check=True)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from decimal import Decimal
+
+import pytest
+
+from qiwipyapi import MockTransport, RateLimiter, RetryPolicy, codec
+from qiwipyapi.errors import QiwiError
+from qiwipyapi.models import Payment
+from qiwipyapi.outbox import DONE, FAILED, PENDING, PaymentOutbox
+from qiwipyapi.wallets import QIWIWallet
+
+WALLET = '79000000000'
+PROVIDER_ID = '1963'
+PAYMENTS_URL = rf'/sinap/api/v2/terms/{PROVIDER_ID}/payments$'
+HISTORY_URL = rf'/payment-history/v2/persons/{WALLET}/payments$'
+
+
+class FakeQiwi:
+    """ Платежи и история исходящих платежей QIWI в памяти для MockTransport. """
+
+    def __init__(self):
+        self.reject = False
+        self.unavailable = False
+        self.history = []
+        self.posts = []
+
+    def payment(self, request):
+        body = request.json()
+        self.posts.append(body['id'])
+        if self.unavailable:
+            return 500, {'errorCode': 'internal.error', 'userMessage': 'Internal error'}
+        if self.reject:
+            return 400, {'code': 'QWPRC-220', 'message': 'Недостаточно средств'}
+        if body['id'] not in [txn['trmTxnId'] for txn in self.history]:
+            self.history.append({'txnId': 30000000000 + len(self.history), 'trmTxnId': body['id'], 'type': 'OUT',
+                                 'status': 'SUCCESS', 'date': '2020-03-14T15:09:26+03:00', 'sum': body['sum']})
+        return {'id': body['id'], 'terms': PROVIDER_ID, 'sum': body['sum'],
+                'transaction': {'id': str(30000000000 + len(self.history)), 'state': {'code': 'Accepted'}}}
+
+    def payments(self, request):
+        return {'data': list(reversed(self.history)), 'nextTxnId': None, 'nextTxnDate': None}
+
+    def transport(self):
+        return MockTransport([('post', PAYMENTS_URL, self.payment), ('get', HISTORY_URL, self.payments)])
+
+
+@pytest.fixture
+def qiwi():
+    return FakeQiwi()
+
+
+@pytest.fixture
+def outbox(qiwi, tmp_path):
+    rate_limiter = RateLimiter({family: (1000, 1000) for family in ('payment-history', 'sinap', 'default')})
+    wallet = QIWIWallet(WALLET, 'token', transport=qiwi.transport(), rate_limiter=rate_limiter,
+                        retry_policy=RetryPolicy(tries=1))
+    with PaymentOutbox(wallet, str(tmp_path / 'payouts.db')) as outbox:
+        yield outbox
+
+
+def _payment(amount=100):
+    return Payment(amount=amount, fields={'account': '4111111111111111'})
+
+
+def test_send_marks_payment_done(outbox, qiwi):
+    payment = _payment()
+    outbox.send(PROVIDER_ID, payment)
+    assert outbox.state(payment.id) == DONE
+    assert qiwi.posts == [payment.id]
+
+
+def test_rejected_payment_is_marked_failed(outbox, qiwi):
+    qiwi.reject = True
+    payment = _payment()
+    with pytest.raises(QiwiError):
+        outbox.send(PROVIDER_ID, payment)
+    assert outbox.state(payment.id) == FAILED
+    assert outbox.recover() == {}
+
+
+def test_recover_resolves_sent_payment_by_trm_txn_id(outbox, qiwi):
+    # процесс упал после того, как QIWI принял платёж, но до записи результата в журнал
+    payload = outbox.record(PROVIDER_ID, _payment())
+    outbox.wallet.send_payment(PROVIDER_ID, payload)
+    assert outbox.state(payload['id']) == PENDING
+
+    assert outbox.recover() == {payload['id']: DONE}
+    assert qiwi.posts == [payload['id']]  # платёж не отправлен второй раз
+
+
+def test_recover_resends_unsent_payment_with_same_id(outbox, qiwi):
+    # процесс упал после записи в журнал, до отправки платежа
+    payload = outbox.record(PROVIDER_ID, _payment())
+
+    assert outbox.recover() == {payload['id']: DONE}
+    assert qiwi.posts == [payload['id']]
+
+
+def test_recover_does_not_match_other_payments(outbox, qiwi):
+    sent = outbox.record(PROVIDER_ID, _payment(100))
+    outbox.wallet.send_payment(PROVIDER_ID, sent)
+    unsent = outbox.record(PROVIDER_ID, _payment(200))
+
+    assert outbox.recover() == {sent['id']: DONE, unsent['id']: DONE}
+    assert qiwi.posts == [sent['id'], unsent['id']]
+
+
+def test_recover_keeps_payment_pending_when_qiwi_is_unavailable(outbox, qiwi):
+    payload = outbox.record(PROVIDER_ID, _payment())
+    qiwi.unavailable = True
+
+    assert outbox.recover() == {payload['id']: PENDING}
+    assert qiwi.history == []
+
+
+def test_record_is_idempotent(outbox):
+    payment = _payment()
+    outbox.record(PROVIDER_ID, payment)
+    outbox.record(PROVIDER_ID, payment)
+    assert [payment_id for payment_id, _, _, _ in outbox.pending()] == [payment.id]
+
+
+def test_decimal_amount_is_recorded_exactly(outbox, qiwi):
+    payload = outbox.record(PROVIDER_ID, _payment(Decimal('100.10')))
+    [(_, _, pending, _)] = outbox.pending()
+    assert pending == codec.loads(codec.dumps(payload))
+    assert Decimal(str(pending['sum']['amount'])) == Decimal('100.10')
+    assert outbox.recover() == {payload['id']: DONE}
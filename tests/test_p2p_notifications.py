@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import asyncio
+import io
+import json
+
+import pytest
+
+from qiwipyapi.notifications import NotificationHandler, P2PNotificationHandler
+
+# Подпись посчитана заранее: HMAC-SHA256 строки полей счёта на секретном ключе
+P2P_SECRET = 'p2p-secret-key'
+P2P_BILL = {'siteId': 'site-00', 'billId': 'cc961e8d-d4d6-4f02-b737-2297e51fb48e',
+            'amount': {'value': '100.00', 'currency': 'RUB'}, 'status': {'value': 'PAID'}}
+P2P_SIGNATURE = 'bcb5ce45927a5885628058825818586c6eb246881da7ae4d13accba19491f4f2'
+
+
+def _p2p_body(**changes):
+    return json.dumps({'bill': dict(P2P_BILL, **changes)}).encode()
+
+
+@pytest.fixture
+def p2p():
+    handler = P2PNotificationHandler(P2P_SECRET, lambda invoice: None)
+    yield handler
+    handler.close()
+
+
+def test_p2p_valid_signature_is_accepted(p2p):
+    status, invoice = p2p.handle(_p2p_body(), {'x-api-signature-sha256': P2P_SIGNATURE})
+    assert status == 200
+    assert invoice.billId == P2P_BILL['billId']
+
+
+@pytest.mark.parametrize('signature', ['', '0' * 64, P2P_SIGNATURE.upper(), P2P_SIGNATURE[:-1],
+                                       'подпись', P2P_SIGNATURE[:-1] + 'ё'])
+def test_p2p_bad_signature_is_rejected(p2p, signature):
+    assert p2p.handle(_p2p_body(), {'x-api-signature-sha256': signature}) == (403, None)
+
+
+def test_p2p_missing_signature_is_rejected(p2p):
+    assert p2p.handle(_p2p_body(), {}) == (403, None)
+
+
+def test_p2p_tampered_amount_is_rejected(p2p):
+    body = _p2p_body(amount={'value': '10000.00', 'currency': 'RUB'})
+    assert p2p.handle(body, {'x-api-signature-sha256': P2P_SIGNATURE}) == (403, None)
+
+
+def test_p2p_malformed_body(p2p):
+    assert p2p.handle(b'not json', {'x-api-signature-sha256': P2P_SIGNATURE}) == (400, None)
+    assert p2p.handle(b'{"bill": {"billId": 1}}', {'x-api-signature-sha256': P2P_SIGNATURE}) == (403, None)
+
+
+def test_p2p_duplicate_is_acknowledged_once(p2p):
+    headers = {'x-api-signature-sha256': P2P_SIGNATURE}
+    assert p2p.handle(_p2p_body(), headers)[1] is not None
+    assert p2p.handle(_p2p_body(), headers) == (200, None)
+
+
+def test_wsgi_rejects_forged_signature(p2p):
+    body = _p2p_body()
+    environ = {'CONTENT_LENGTH': str(len(body)), 'wsgi.input': io.BytesIO(body),
+               'HTTP_X_API_SIGNATURE_SHA256': 'подпись'}
+    statuses = []
+    assert p2p.wsgi(environ, lambda status, headers: statuses.append(status)) == [b'']
+    assert statuses == ['403 Forbidden']
+
+
+def test_asgi_runs_async_callback_to_completion():
+    received = []
+
+    async def callback(invoice):
+        await asyncio.sleep(0.01)
+        received.append(invoice.billId)
+
+    handler = P2PNotificationHandler(P2P_SECRET, callback)
+
+    async def deliver():
+        sent = []
+        body = _p2p_body()
+
+        async def receive():
+            return {'type': 'http.request', 'body': body}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'headers': [(b'x-api-signature-sha256', P2P_SIGNATURE.encode())]}
+        await handler.asgi(scope, receive, send)
+        assert handler._tasks  # ссылка на задачу держится, пока callback выполняется
+        await asyncio.gather(*handler._tasks)
+        return sent[0]['status']
+
+    assert asyncio.run(deliver()) == 200
+    assert received == [P2P_BILL['billId']]
+    assert not handler._tasks
+    handler.close()
+
+
+def test_handler_must_implement_verify_parse_and_dedupe_key():
+    class Handler(NotificationHandler):
+        def verify(self, payload, headers):
+            return True
+
+    with pytest.raises(TypeError):
+        Handler(lambda notification: None)
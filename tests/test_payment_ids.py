@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import logging
+import threading
+
+import pytest
+
+from qiwipyapi import utils
+from qiwipyapi.models import Payment
+from qiwipyapi.utils import IdGenerator
+
+
+def test_ids_are_unique_and_increasing():
+    generate = IdGenerator(node_id=1)
+    ids = [generate() for _ in range(50000)]
+    assert len(set(ids)) == len(ids)
+    assert ids == sorted(ids)
+    assert max(ids) < 1 << 63  # не больше 19 цифр, как требует QIWI
+
+
+def test_ids_are_unique_across_threads():
+    generate = IdGenerator(node_id=1)
+    ids = []
+
+    def worker():
+        batch = [generate() for _ in range(10000)]
+        ids.extend(batch)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(ids)) == 80000
+
+
+def test_different_nodes_never_collide(monkeypatch):
+    monkeypatch.setattr(utils.time, 'time', lambda: 1600000000.0)  # все идентификаторы в одной миллисекунде
+    first, second = IdGenerator(node_id=1), IdGenerator(node_id=2)
+    assert not {first() for _ in range(5000)} & {second() for _ in range(5000)}
+
+
+def test_sequence_overflow_moves_to_next_millisecond(monkeypatch):
+    monkeypatch.setattr(utils.time, 'time', lambda: 1600000000.0)
+    generate = IdGenerator(node_id=1)
+    ids = [generate() for _ in range(3 << IdGenerator.SEQUENCE_BITS)]
+    assert len(set(ids)) == len(ids)
+    assert ids == sorted(ids)
+
+
+def test_clock_going_backwards_keeps_ids_increasing(monkeypatch):
+    now = [1600000000.0]
+    monkeypatch.setattr(utils.time, 'time', lambda: now[0])
+    generate = IdGenerator(node_id=1)
+    before = [generate() for _ in range(10)]
+    now[0] -= 5
+    after = [generate() for _ in range(10)]
+    assert min(after) > max(before)
+
+
+def test_node_id_from_environment(monkeypatch):
+    monkeypatch.setenv('QIWIPYAPI_NODE_ID', '7')
+    generate = IdGenerator()
+    assert generate() >> IdGenerator.SEQUENCE_BITS & ((1 << IdGenerator.NODE_BITS) - 1) == 7
+
+
+@pytest.mark.parametrize('node_id', [-1, 1024])
+def test_node_id_out_of_range(node_id, monkeypatch):
+    with pytest.raises(ValueError):
+        IdGenerator(node_id)
+    monkeypatch.setenv('QIWIPYAPI_NODE_ID', str(node_id))
+    with pytest.raises(ValueError):
+        IdGenerator()()
+
+
+def test_fallback_node_is_reported(monkeypatch, caplog):
+    monkeypatch.delenv('QIWIPYAPI_NODE_ID', raising=False)
+    with caplog.at_level(logging.WARNING, logger='qiwipyapi'):
+        IdGenerator()()
+    assert 'QIWIPYAPI_NODE_ID' in caplog.text
+
+
+def test_explicit_node_is_not_reported(caplog):
+    with caplog.at_level(logging.WARNING, logger='qiwipyapi'):
+        IdGenerator(node_id=3)()
+    assert not caplog.records
+
+
+def test_payment_gets_numeric_id():
+    first, second = Payment(amount=1), Payment(amount=1)
+    assert first.id.isdigit() and len(first.id) <= 19
+    assert first.id != second.id
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from qiwipyapi import AsyncMockTransport, MockTransport, RateLimiter, RetryPolicy
+from qiwipyapi.aio import AsyncQIWIWallet
+from qiwipyapi.outbox import DONE, PENDING, PaymentOutbox
+from qiwipyapi.payouts import PayoutEngine, PayoutOrder
+from qiwipyapi.wallets import QIWIWallet
+
+WALLET = '79000000000'
+PROVIDER_ID = '1963'
+PAYMENTS_URL = rf'/sinap/api/v2/terms/{PROVIDER_ID}/payments$'
+HISTORY_URL = rf'/payment-history/v2/persons/{WALLET}/payments$'
+
+
+class FakeQiwi:
+    """ Платежи QIWI в памяти: ответы на платежи берутся по очереди из replies, принятые платежи
+    попадают в историю.
+    """
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.history = []
+        self.posts = []
+
+    def payment(self, request):
+        body = request.json()
+        self.posts.append(body['id'])
+        status_code = self.replies.pop(0) if self.replies else 200
+        if status_code == 423:
+            return 423, {'errorCode': 'request.blocked', 'userMessage': 'Too many requests'}
+        if status_code in (200, 502):
+            # 502 от балансировщика: платёж проведён, но ответ потерян
+            self.history.append({'txnId': 30000000000 + len(self.history), 'trmTxnId': body['id'], 'type': 'OUT',
+                                 'status': 'SUCCESS', 'date': '2020-03-14T15:09:26+03:00', 'sum': body['sum']})
+        if status_code != 200:
+            return status_code, {'errorCode': 'internal.error', 'userMessage': 'Internal error'}
+        return {'id': body['id'], 'terms': PROVIDER_ID, 'sum': body['sum'],
+                'transaction': {'id': str(30000000000 + len(self.history)), 'state': {'code': 'Accepted'}}}
+
+    def payments(self, request):
+        return {'data': list(reversed(self.history)), 'nextTxnId': None, 'nextTxnDate': None}
+
+    def routes(self):
+        return [('post', PAYMENTS_URL, self.payment), ('get', HISTORY_URL, self.payments)]
+
+
+def _wallet(wallet_class, transport):
+    rate_limiter = RateLimiter({family: (1000, 1000) for family in ('payment-history', 'sinap', 'default')})
+    return wallet_class(WALLET, 'token', transport=transport, rate_limiter=rate_limiter,
+                        retry_policy=RetryPolicy(tries=1))
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    def make(qiwi, wallet_class=QIWIWallet, transport_class=MockTransport):
+        return PaymentOutbox(_wallet(wallet_class, transport_class(qiwi.routes())), str(tmp_path / 'payouts.db'))
+    return make
+
+
+ORDER = PayoutOrder('card', '4111111111111111', 100, provider_id=PROVIDER_ID)
+
+
+def test_throttled_payment_is_retried_with_same_id(outbox):
+    qiwi = FakeQiwi(423)
+    with outbox(qiwi) as journal:
+        [result] = PayoutEngine(journal.wallet, outbox=journal, retry_delay=0).run([ORDER])
+        assert result.failure is None
+        assert qiwi.posts == [result.payment_id, result.payment_id]
+        assert journal.state(result.payment_id) == DONE
+
+
+@pytest.mark.parametrize('status_code', [500, 502])
+def test_server_error_is_not_resent_and_recovered_by_trm_txn_id(outbox, status_code):
+    qiwi = FakeQiwi(status_code)
+    with outbox(qiwi) as journal:
+        [result] = PayoutEngine(journal.wallet, outbox=journal, retry_delay=0).run([ORDER])
+        assert result.failure == 'server'
+        assert qiwi.posts == [result.payment_id]
+        assert journal.state(result.payment_id) == PENDING
+
+        assert journal.recover() == {result.payment_id: DONE}
+        assert len(qiwi.history) == 1
+
+
+def test_async_engine_records_payments_in_outbox(outbox):
+    qiwi = FakeQiwi(423, 500)
+
+    async def run(journal):
+        engine = PayoutEngine(journal.wallet, outbox=journal, retry_delay=0)
+        return [result async for result in engine.arun([ORDER, ORDER._replace(id='42')])]
+
+    with outbox(qiwi, AsyncQIWIWallet, AsyncMockTransport) as journal:
+        results = asyncio.run(run(journal))
+        assert sorted(result.failure or 'ok' for result in results) == ['ok', 'server']
+        assert len(qiwi.posts) == 3
+        assert {journal.state(result.payment_id) for result in results} == {DONE, PENDING}
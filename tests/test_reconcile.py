@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from decimal import Decimal
+
+from qiwipyapi.models import Invoice, Transaction
+from qiwipyapi.reconcile import reconcile
+
+
+def _invoice(bill_id, value, status='WAITING'):
+    return {'siteId': 'site-00', 'billId': bill_id, 'amount': {'value': value, 'currency': 'RUB'},
+            'status': {'value': status}, 'comment': f'order {bill_id}'}
+
+
+def _txn(comment, amount):
+    return {'txnId': 1, 'type': 'IN', 'status': 'SUCCESS', 'comment': comment,
+            'sum': {'amount': amount, 'currency': 643}}
+
+
+def test_invoice_objects_are_accepted_as_bills():
+    bills = [Invoice.from_json(_invoice('b-1', '100.00')), _invoice('b-2', '50.00'), ('b-3', 10)]
+    result = reconcile(bills, transactions=[_txn('order b-1', 100), Transaction.from_json(_txn('b-2', 20))])
+    assert [(match.bill_id, match.paid) for match in result.matched] == [('b-1', Decimal(100))]
+    assert [(match.bill_id, match.paid) for match in result.underpaid] == [('b-2', Decimal(20))]
+    assert [match.bill_id for match in result.unmatched] == ['b-3']
+
+
+def test_statuses_from_invoice_objects():
+    status = Invoice.from_json(_invoice('b-1', '100.00', 'PAID'))
+    result = reconcile([('b-1', '100.00')], statuses=[status])
+    assert [match.bill_id for match in result.matched] == ['b-1']
+
+
+def test_transaction_without_amount_is_unknown():
+    txn = {'txnId': 2, 'type': 'IN', 'status': 'SUCCESS', 'comment': 'b-1'}
+    result = reconcile([('b-1', 10)], transactions=[txn], match_by_amount=True)
+    assert result.unknown == [txn]
+    assert [match.bill_id for match in result.unmatched] == ['b-1']
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from qiwipyapi.retry import RetryPolicy
+
+
+class Reply:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.mark.parametrize('method, url, expected', [
+    ('GET', 'https://edge.qiwi.com/payment-history/v2/persons/79000000000/payments', True),
+    ('PUT', 'https://api.qiwi.com/partner/bill/v1/bills/order-1', True),
+    ('PUT', 'https://edge.qiwi.com/payment-notifier/v1/hooks?hookType=1', False),
+    ('DELETE', 'https://edge.qiwi.com/payment-notifier/v1/hooks/hook-1', False),
+    ('POST', 'https://edge.qiwi.com/sinap/providers/1963/onlineCommission', True),
+    ('POST', 'https://edge.qiwi.com/sinap/api/v2/terms/1963/payments', False),
+    ('POST', 'https://api.qiwi.com/partner/bill/v1/bills/order-1/reject', False),
+])
+def test_is_idempotent(method, url, expected):
+    assert RetryPolicy.is_idempotent(method, url) is expected
+
+
+def test_payment_post_is_not_retried():
+    replies = iter([Reply(500), Reply(200)])
+    result = RetryPolicy(tries=3, base_delay=0).call(lambda: next(replies), 'post',
+                                                     'https://edge.qiwi.com/sinap/api/v2/terms/1963/payments')
+    assert result.status_code == 500
+
+
+def test_discarded_responses_are_closed():
+    replies = [Reply(423), Reply(503), Reply(200)]
+    returned = iter(replies)
+    result = RetryPolicy(tries=3, base_delay=0).call(lambda: next(returned), 'get', 'https://edge.qiwi.com/x')
+    assert result is replies[2]
+    assert [reply.closed for reply in replies] == [True, True, False]
+
+
+def test_async_discarded_responses_are_closed():
+    replies = [Reply(500), Reply(200)]
+    returned = iter(replies)
+
+    async def send():
+        return next(returned)
+
+    result = asyncio.run(RetryPolicy(tries=2, base_delay=0).acall(send, 'get', 'https://edge.qiwi.com/x'))
+    assert result is replies[1]
+    assert replies[0].closed and not replies[1].closed
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import asyncio
+from decimal import Decimal
+
+from qiwipyapi.store import TransactionStore
+
+
+def _txn(txn_id, day, amount):
+    return {'txnId': txn_id, 'date': f'2020-03-{day:02d}T15:09:26+03:00', 'status': 'SUCCESS', 'type': 'IN',
+            'account': '79001234567', 'sum': {'amount': amount, 'currency': 643}}
+
+
+TXNS = [_txn(3, 14, Decimal('0.30')), _txn(2, 13, Decimal('1.10')), _txn(1, 12, Decimal('100'))]
+
+
+class Wallet:
+    _WALLET_NUMBER = '79000000000'
+
+    def backfill_payments(self, start, end, window, workers):
+        return iter(TXNS)
+
+
+class AsyncWallet(Wallet):
+    async def backfill_payments(self, start, end, window, workers):
+        for txn in TXNS:
+            yield txn
+
+
+def _synced_ts(store):
+    return store._db.execute('SELECT last_ts FROM sync_state').fetchone()['last_ts']
+
+
+def test_sync_saves_batches_and_last_date():
+    with TransactionStore(Wallet()) as store:
+        assert store.sync(batch=2) == 3
+        assert [txn['txnId'] for txn in store.query()] == [3, 2, 1]
+        assert _synced_ts(store) == store._row(TXNS[0])[3]
+
+
+def test_async_sync_saves_batches_and_last_date():
+    with TransactionStore(AsyncWallet()) as store:
+        assert asyncio.run(store.async_sync(batch=2)) == 3
+        assert [txn['txnId'] for txn in store.query()] == [3, 2, 1]
+        assert _synced_ts(store) == store._row(TXNS[0])[3]
+
+
+def test_decimal_amounts_are_stored_exactly():
+    with TransactionStore(Wallet()) as store:
+        store.add(TXNS)
+        assert store.get(3)['sum']['amount'] == '0.30'
+        assert store.get(2)['sum']['amount'] == '1.10'